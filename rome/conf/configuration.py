@@ -59,9 +59,100 @@ class Configuration(object):
         """
         try:
             return self.configuration.getboolean('Rome', 'database_caching')
-        except ConfigParser.NoOptionError:
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
             return False
 
+    def plan_cache_size(self):
+        """
+        This function parses configuration and provides the maximum number of query plans that
+        are kept in the plan cache.
+        :return: an integer
+        """
+        try:
+            return self.configuration.getint('Rome', 'plan_cache_size')
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+            return 500
+
+    def frame_cache_size(self):
+        """
+        This function parses configuration and provides the maximum number of table frames that
+        are kept in the frame cache of pandas where clauses.
+        :return: an integer
+        """
+        try:
+            return self.configuration.getint('Rome', 'frame_cache_size')
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+            return 64
+
+    def result_cache_enabled(self):
+        """
+        This function parses configuration and tells if the results of queries are cached for the
+        tables that are not listed in the 'ResultCacheTables' section. When it is not set, the
+        'database_caching' option is used.
+        :return: a boolean
+        """
+        try:
+            return self.configuration.getboolean('ResultCache', 'enabled')
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+            return self.database_caching()
+
+    def result_cache_size(self):
+        """
+        This function parses configuration and provides the maximum number of results that are
+        kept in the result cache.
+        :return: an integer
+        """
+        try:
+            return self.configuration.getint('ResultCache', 'max_entries')
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+            return 1000
+
+    def result_cache_bytes(self):
+        """
+        This function parses configuration and provides the maximum estimated size (in bytes) of
+        the results that are kept in the result cache.
+        :return: an integer
+        """
+        try:
+            return self.configuration.getint('ResultCache', 'max_bytes')
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+            return 64 * 1024 * 1024
+
+    def result_cache_tables(self):
+        """
+        This function parses configuration and tells for which tables the results of queries are
+        cached, regardless of the 'enabled' option of the 'ResultCache' section.
+        :return: a dict that associates table names (in lower case) with booleans
+        """
+        if not self.configuration.has_section('ResultCacheTables'):
+            return {}
+        result = {}
+        for option in self.configuration.options('ResultCacheTables'):
+            result[option] = self.configuration.getboolean('ResultCacheTables', option)
+        return result
+
+    def object_cache_bytes(self):
+        """
+        This function parses configuration and provides the maximum estimated size (in bytes) of
+        the decoded objects that are kept in the object cache (0 disables the cache).
+        :return: an integer
+        """
+        try:
+            return self.configuration.getint('Rome', 'object_cache_bytes')
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+            return 32 * 1024 * 1024
+
+    def memory_storage(self):
+        """
+        This function parses configuration and provides the storage of the tables of the memory
+        backend: "dict" stores each object as a dict, "columnar" stores each table by columns.
+        :return: a storage name
+        """
+        try:
+            return self.configuration.get('Rome', 'memory_storage')
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
+            return "dict"
+
 
 CONFIGURATION = None
 
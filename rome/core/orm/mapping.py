@@ -0,0 +1,136 @@
+"""Mapping module.
+
+This module contains a registry of the mapping metadata of entity classes: their columns, their
+primary key components and their relationships, as well as the entity class of each table. These
+facts do not change once the classes have been mapped: they are extracted the first time an entity
+class is seen, instead of being rediscovered for each object, each row or each query.
+
+"""
+
+import threading
+
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm.mapper import Mapper
+from sqlalchemy.orm.properties import ColumnProperty, RelationshipProperty
+
+
+class RelationshipMetadata(object):
+
+    """A relationship of an entity class: the name and the instrumented attribute of the
+    relationship, its direction (ONETOMANY, MANYTOONE or MANYTOMANY) and the pairs of columns
+    (local, remote) that it joins."""
+
+    def __init__(self, name, attribute):
+        self.name = name
+        self.attribute = attribute
+        self.direction = attribute.property.direction
+        self.local_remote_pairs = attribute.property.local_remote_pairs
+
+
+class EntityMetadata(object):
+
+    """The mapping metadata of an entity class."""
+
+    def __init__(self, entity_class):
+        self.entity_class = entity_class
+        self.table_name = entity_class.__table__.name
+        self.columns = list(entity_class.__table__.columns)
+        class_manager = entity_class._sa_class_manager
+        # Columns are designated by the name of their attribute, which is also their key in the
+        # objects stored in the database, and may differ from their name in the table
+        self.column_names = map(lambda x: class_manager.mapper.get_property_by_column(x).key,
+                                self.columns)
+        self.column_types = dict(zip(self.column_names, map(lambda x: x.type, self.columns)))
+        self.primary_key_components = list(class_manager.mapper.primary_key)
+        self.column_attributes = []
+        self.relationships = []
+        for (attr_name, attr) in class_manager.local_attrs.iteritems():
+            if type(attr.property) is ColumnProperty:
+                self.column_attributes += [attr_name]
+            elif type(attr.property) is RelationshipProperty:
+                self.relationships += [RelationshipMetadata(attr_name, attr)]
+        self.secondary_indexes = getattr(entity_class, "_secondary_indexes", [])
+        # Row materializers of the entity class, indexed by their columns (see the
+        # 'rome.core.orm.materializers' module)
+        self.materializers = {}
+
+
+class MappingRegistry(object):
+
+    """A registry of the mapping metadata of entity classes. Relationships are completed (with
+    backrefs for instance) when SQLAlchemy configures new mappers: the registry is emptied each time
+    this happens."""
+
+    def __init__(self):
+        self.entities = {}
+        self.entity_classes = {}
+        self.lock = threading.Lock()
+
+    def _check_mappers(self):
+        if Mapper._new_mappers:
+            configure_mappers()
+            self.clear()
+
+    def get_entity_metadata(self, entity_class):
+        """
+        Return the mapping metadata of an entity class.
+        :param entity_class: an entity class
+        :return: an instance of EntityMetadata
+        """
+        self._check_mappers()
+        entity_metadata = self.entities.get(entity_class, None)
+        if entity_metadata is None:
+            entity_metadata = EntityMetadata(entity_class)
+            with self.lock:
+                self.entities[entity_class] = entity_metadata
+        return entity_metadata
+
+    def get_entity_classes(self, class_registry):
+        """
+        Return the entity classes of a declarative class registry, indexed by their table name.
+        :param class_registry: a declarative class registry
+        :return: a dict that associates table names with entity classes
+        """
+        self._check_mappers()
+        key = id(class_registry)
+        entity_classes = self.entity_classes.get(key, None)
+        if entity_classes is None or entity_classes[0] is not class_registry:
+            tables = {}
+            for element in class_registry.values():
+                if hasattr(element, "__table__"):
+                    tables[element.__table__.name] = element
+            entity_classes = (class_registry, tables)
+            with self.lock:
+                self.entity_classes[key] = entity_classes
+        return entity_classes[1]
+
+    def clear(self):
+        """
+        Remove every mapping metadata from the registry.
+        """
+        with self.lock:
+            self.entities.clear()
+            self.entity_classes.clear()
+
+
+MAPPING_REGISTRY = None
+
+
+def get_mapping_registry():
+    """
+    Return a singleton instance of the 'MappingRegistry' class.
+    :return: an instance of the 'MappingRegistry' class
+    """
+    global MAPPING_REGISTRY
+    if MAPPING_REGISTRY is None:
+        MAPPING_REGISTRY = MappingRegistry()
+    return MAPPING_REGISTRY
+
+
+def get_entity_metadata(entity_class):
+    """
+    Return the mapping metadata of an entity class.
+    :param entity_class: an entity class
+    :return: an instance of EntityMetadata
+    """
+    return get_mapping_registry().get_entity_metadata(entity_class)
@@ -0,0 +1,145 @@
+"""Materializers module.
+
+This module contains the materializers that build entity objects from the raw objects (dicts)
+fetched from the database. A materializer is built once per entity class and selected columns:
+objects are created with the fast instance construction of SQLAlchemy's class manager (as SQLAlchemy
+does when it loads objects from a SQL database), their attributes are stored in bulk in their
+__dict__ instead of going through the instrumentation of each attribute, and values are decoded by
+a decoder chosen from the type of their column. The decoded values of objects that have not been
+modified since they were last read are taken from the object cache (see the
+'rome.core.orm.object_cache' module).
+
+"""
+
+import datetime
+import threading
+
+import pytz
+from sqlalchemy import Boolean, DateTime, Float, Integer, Numeric, String
+
+from rome.core.dataformat.json import Decoder
+from rome.core.orm.mapping import get_entity_metadata
+
+# Values of these column types are stored as they are, unless they have been encoded.
+SCALAR_TYPES = (Boolean, Float, Integer, Numeric, String)
+
+
+def scalar_decoder(decoder):
+    """
+    Build a decoder for the values of columns of a scalar type.
+    :param decoder: an instance of Decoder, used for values that have been encoded
+    :return: a function that decodes a value
+    """
+    def decode(value):
+        if isinstance(value, (dict, list)):
+            return decoder.decode(value)
+        return value
+    return decode
+
+
+def datetime_decoder(decoder):
+    """
+    Build a decoder for the values of datetime columns. Dates written with the default date format
+    of Rome are parsed without strptime.
+    :param decoder: an instance of Decoder, used for the other values
+    :return: a function that decodes a value
+    """
+    decode_scalar = scalar_decoder(decoder)
+
+    def decode(value):
+        if not isinstance(value, dict) or value.get("simplify_strategy", None) != "datetime":
+            return decode_scalar(value)
+        date = value["value"]
+        if len(date) != 26 or date[4] != "-" or date[10] != " " or date[19] != ".":
+            return decoder.datetime_decode(value)
+        try:
+            result = datetime.datetime(int(date[0:4]), int(date[5:7]), int(date[8:10]),
+                                       int(date[11:13]), int(date[14:16]), int(date[17:19]),
+                                       int(date[20:26]))
+        except ValueError:
+            return decoder.datetime_decode(value)
+        if value["timezone"] == "UTC":
+            result = pytz.utc.localize(result)
+        return result
+    return decode
+
+
+def column_decoder(column_type, decoder):
+    """
+    Choose the decoder of the values of a column according to its type.
+    :param column_type: the SQLAlchemy type of the column
+    :param decoder: an instance of Decoder
+    :return: a function that decodes a value
+    """
+    if isinstance(column_type, DateTime):
+        return datetime_decoder(decoder)
+    if isinstance(column_type, SCALAR_TYPES):
+        return scalar_decoder(decoder)
+    return decoder.decode
+
+
+class RowMaterializer(object):
+
+    """Build the objects of an entity class from raw objects that contain the columns
+    'column_names'."""
+
+    def __init__(self, entity_class, column_names=None):
+        entity_metadata = get_entity_metadata(entity_class)
+        if column_names is None:
+            column_names = entity_metadata.column_names
+        decoder = Decoder()
+        self.entity_class = entity_class
+        self.table_name = entity_metadata.table_name
+        self.column_names = column_names
+        self.column_names_key = tuple(column_names)
+        self.new_instance = entity_class._sa_class_manager.new_instance
+        self.decoders = map(lambda x: (x, column_decoder(entity_metadata.column_types[x], decoder)),
+                            column_names)
+
+    def materialize(self, raw_object, object_cache=None):
+        """
+        Build an object from a raw object.
+        :param raw_object: a dict that contains the values of the columns of the object
+        :param object_cache: (facultative) an instance of DecodedObjectCache, which contains the
+        values of the objects that have already been decoded
+        :return: an object of the entity class
+        """
+        new_object = self.new_instance()
+        object_dict = new_object.__dict__
+        key = None
+        if object_cache is not None and raw_object.get("id", None) is not None and \
+                raw_object.get("___version_number", None) is not None:
+            key = (self.table_name, raw_object["id"], raw_object["___version_number"])
+            values = object_cache.get(key, self.column_names_key)
+        if key is None or values is None:
+            values = [decode(raw_object.get(column_name, None))
+                      for (column_name, decode) in self.decoders]
+            if key is not None:
+                object_cache.put(key, self.column_names_key, values)
+        object_dict.update(zip(self.column_names, values))
+        if "___version_number" in raw_object:
+            object_dict["___version_number"] = raw_object["___version_number"]
+        return new_object
+
+
+MATERIALIZERS_LOCK = threading.Lock()
+
+
+def get_materializer(entity_class, column_names=None):
+    """
+    Return the materializer of an entity class for the given columns, which is built the first time
+    it is requested. Materializers are kept with the mapping metadata of the entity class, so that
+    they are discarded when the mapping registry is cleared.
+    :param entity_class: an entity class
+    :param column_names: (facultative) the names of the columns that are materialized, by default
+    every column of the entity class
+    :return: an instance of RowMaterializer
+    """
+    materializers = get_entity_metadata(entity_class).materializers
+    key = tuple(column_names) if column_names is not None else None
+    materializer = materializers.get(key, None)
+    if materializer is None:
+        materializer = RowMaterializer(entity_class, column_names)
+        with MATERIALIZERS_LOCK:
+            materializers[key] = materializer
+    return materializer
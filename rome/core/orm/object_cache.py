@@ -0,0 +1,158 @@
+"""Object cache module.
+
+This module contains a cache of the decoded values of the objects read from the database, shared
+by every query. Each time an object is modified, its version number is incremented: an object
+identified by its table, its identifier and its version number always has the same values, so
+objects that have not been modified since they were last read are not decoded again.
+
+Cached values are immutable snapshots: values that may be modified in place (lists, dicts and
+other objects) are copied each time they are given to a new entity object. The cache has a size
+budget (in bytes, estimated when values are cached): objects that have not been read recently are
+evicted first.
+
+"""
+
+import copy
+import datetime
+import decimal
+import sys
+import threading
+from collections import deque
+
+from rome.conf.configuration import get_config
+from rome.driver import database_driver
+from rome.driver.result_cache import estimate_size
+
+# Values of these types (but not of their subclasses) are shared between the entity objects built
+# from a snapshot
+IMMUTABLE_TYPES = frozenset([type(None), bool, int, long, float, str, unicode, datetime.datetime,
+                             datetime.date, datetime.time, decimal.Decimal])
+
+# Positions of the items of an entry of the cache
+(COLUMN_NAMES, VALUES, MUTABLE_POSITIONS, SIZE, REFERENCED) = range(5)
+
+
+class DecodedObjectCache(object):
+
+    """A cache of the decoded values of objects, indexed by table name, identifier and version
+    number. Objects are evicted with the CLOCK algorithm: an object that has been read since it
+    was cached or since the last time it was examined is given a second chance, and the other
+    objects are evicted in the order they were cached."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.snapshots = {}
+        self.queue = deque()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, column_names):
+        """
+        Return the decoded values of an object.
+        :param key: a tuple (table_name, identifier, version_number)
+        :param column_names: a tuple that contains the names of the columns of the values
+        :return: a sequence of values, in the order of the columns, or None if the object is not
+        cached
+        """
+        entry = self.snapshots.get(key, None)
+        if entry is None or entry[COLUMN_NAMES] != column_names:
+            self.misses += 1
+            return None
+        entry[REFERENCED] = True
+        self.hits += 1
+        values = entry[VALUES]
+        if len(entry[MUTABLE_POSITIONS]) == 0:
+            return values
+        values = list(values)
+        for position in entry[MUTABLE_POSITIONS]:
+            values[position] = copy.deepcopy(values[position])
+        return values
+
+    def put(self, key, column_names, values):
+        """
+        Cache the decoded values of an object.
+        :param key: a tuple (table_name, identifier, version_number)
+        :param column_names: a tuple that contains the names of the columns of the values
+        :param values: a sequence of values, in the order of the columns. Values that may be
+        modified in place are copied.
+        """
+        values = tuple(values)
+        mutable_positions = tuple([i for (i, value) in enumerate(values)
+                                   if type(value) not in IMMUTABLE_TYPES])
+        size = sys.getsizeof(values) + sum(map(sys.getsizeof, values))
+        if len(mutable_positions) > 0:
+            values = tuple(copy.deepcopy(value) if i in mutable_positions else value
+                           for (i, value) in enumerate(values))
+            size += sum(map(lambda x: estimate_size(values[x]), mutable_positions))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            previous_entry = self.snapshots.get(key, None)
+            if previous_entry is not None:
+                self.size -= previous_entry[SIZE]
+            else:
+                self.queue.append(key)
+            self.snapshots[key] = [column_names, values, mutable_positions, size, False]
+            self.size += size
+            while self.max_bytes is not None and self.size > self.max_bytes:
+                self._evict_one()
+
+    def _evict_one(self):
+        candidate = self.queue.popleft()
+        entry = self.snapshots[candidate]
+        if entry[REFERENCED]:
+            entry[REFERENCED] = False
+            self.queue.append(candidate)
+            return
+        del self.snapshots[candidate]
+        self.size -= entry[SIZE]
+        self.evictions += 1
+
+    def statistics(self):
+        """
+        Return statistics about the usage of the cache.
+        :return: a dict that contains the number of hits, misses, evictions and cached objects,
+        and the estimated size of the cached values
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.snapshots),
+            "bytes": self.size
+        }
+
+    def clear(self):
+        """
+        Remove every object from the cache, and reset its statistics.
+        """
+        with self.lock:
+            self.snapshots.clear()
+            self.queue.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+OBJECT_CACHE = None
+OBJECT_CACHE_DRIVER = None
+
+
+def get_object_cache():
+    """
+    Return a singleton instance of the 'DecodedObjectCache' class, or None if the object cache is
+    disabled in the configuration. The cache is emptied when the database driver is replaced, as
+    version numbers are only meaningful for a given database.
+    :return: an instance of the 'DecodedObjectCache' class, or None
+    """
+    global OBJECT_CACHE, OBJECT_CACHE_DRIVER
+    driver = database_driver.get_driver()
+    if OBJECT_CACHE_DRIVER is not driver:
+        max_bytes = get_config().object_cache_bytes()
+        OBJECT_CACHE = DecodedObjectCache(max_bytes=max_bytes) if max_bytes > 0 else None
+        OBJECT_CACHE_DRIVER = driver
+    return OBJECT_CACHE
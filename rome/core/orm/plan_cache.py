@@ -0,0 +1,171 @@
+"""Plan cache module.
+
+This module contains a cache of query plans. Queries that only differ by their literal values
+share the same plan: the parsing of their SQL query and the rewriting of their filters and joins
+are done once, and each execution of a query only binds its own values in the plan.
+
+"""
+
+import threading
+
+from rome.conf.configuration import get_config
+from rome.core.orm.utils import render_literal_value
+from rome.core.rows.hints import extract_hint_candidates
+from rome.core.rows.lookups import extract_key_lookup
+from rome.core.rows.scans import extract_table_scan
+from rome.core.rows.tuples import build_tuples_plan
+from rome.lang.expression import Placeholder
+from rome.utils.dictionary_with_limited_size import DictionaryWithLimitedSize
+
+
+class QueryPlan(object):
+
+    """The plan of a query: its tree representation, where literal values are placeholders, the
+    plan of the tuples building and the predicates that can be pushed down to the database driver.
+    Queries that select objects by their primary key also have a key lookup, which bypasses the
+    tuples building, and other queries on a single table have a table scan, used to stream their
+    rows. Sub queries have their own plans."""
+
+    def __init__(self, query_tree, parameter_types=None):
+        if parameter_types is None:
+            parameter_types = {}
+        self.query_tree = query_tree
+        self.parameter_types = parameter_types
+        self.tuples_plan = build_tuples_plan(query_tree)
+        self.hint_candidates = extract_hint_candidates(query_tree)
+        self.key_lookup = extract_key_lookup(query_tree, self.tuples_plan)
+        self.table_scan = None
+        if self.key_lookup is None:
+            self.table_scan = extract_table_scan(query_tree, self.tuples_plan,
+                                                 self.hint_candidates)
+        self.variables = {}
+        for (variable_name, sub_query_tree) in query_tree.variables.iteritems():
+            self.variables[variable_name] = QueryPlan(sub_query_tree, parameter_types)
+
+    def bind_limits(self, parameters):
+        """
+        Compute the limit and the offset of the query.
+        :param parameters: a dict that contains the values of the placeholders of the plan
+        :return: a tuple (limit, offset), where limit is None when the query has no limit
+        """
+        def bind(expression, default):
+            if expression is None:
+                return default
+            if isinstance(expression, Placeholder):
+                return int(parameters[expression.name])
+            return int(expression.value)
+        return (bind(self.query_tree.limit, None), bind(self.query_tree.offset, 0))
+
+    def render_parameters(self, parameters):
+        """
+        Render the values of the placeholders of the plan as SQL literals.
+        :param parameters: a dict that contains the values of the placeholders of the plan
+        :return: a dict that contains the literal representation of the values
+        """
+        result = {}
+        for (name, value) in parameters.iteritems():
+            result[name] = render_literal_value(value, self.parameter_types[name])
+        return result
+
+
+class QueryPlanCache(object):
+
+    """A cache of query plans, indexed by the shape of each query. When the cache is full, the
+    least recently used plan is evicted."""
+
+    def __init__(self, size_limit=None):
+        self.plans = DictionaryWithLimitedSize(size_limit=size_limit)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_plan(self, sa_query):
+        """
+        Return the plan of a SQLAlchemy query, and the values that should be bound in it. The plan
+        is computed only if no query with the same shape has been planned before.
+
+        The query tree is compiled directly from the expression tree of the SQLAlchemy query.
+        Queries that cannot be compiled are rendered as SQL queries and parsed with sqlparse.
+        :param sa_query: a SQLAlchemy query
+        :return: a tuple (plan, parameters), where plan is an instance of QueryPlan and parameters
+        a dict that contains the values of the placeholders of the plan
+        """
+        from rome.lang.sqlalchemy_compiler import QueryCompiler, UnsupportedExpression
+
+        try:
+            (query_tree, parameters, parameter_types) = QueryCompiler().compile(sa_query)
+        except UnsupportedExpression:
+            return self.get_parsed_plan(sa_query)
+        key = ("compiled", query_tree.signature())
+        plan = self._lookup(key)
+        if plan is None:
+            plan = QueryPlan(query_tree, parameter_types)
+            self._store(key, plan)
+        return plan, parameters
+
+    def get_parsed_plan(self, sa_query):
+        """
+        Return the plan of a SQLAlchemy query, by parsing its parametrized SQL query.
+        :param sa_query: a SQLAlchemy query
+        :return: a tuple (plan, parameters), where plan is an instance of QueryPlan and parameters
+        a dict that contains the values of the placeholders of the plan
+        """
+        from rome.core.orm.utils import get_parametrized_query
+        from rome.lang.sql_parser import QueryParser
+
+        (sql_query, parameters, parameter_types) = get_parametrized_query(sa_query)
+        key = ("sql", sql_query)
+        plan = self._lookup(key)
+        if plan is None:
+            plan = QueryPlan(QueryParser().parse(sql_query), parameter_types)
+            self._store(key, plan)
+        return plan, parameters
+
+    def _lookup(self, key):
+        with self.lock:
+            plan = self.plans.pop(key, None)
+            if plan is None:
+                self.misses += 1
+                return None
+            # Plans are moved to the end of the dict when they are used
+            self.plans[key] = plan
+            self.hits += 1
+            return plan
+
+    def _store(self, key, plan):
+        with self.lock:
+            self.plans[key] = plan
+
+    def statistics(self):
+        """
+        Return statistics about the usage of the cache.
+        :return: a dict that contains the number of hits, misses and cached plans
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.plans)
+        }
+
+    def clear(self):
+        """
+        Remove every plan from the cache, and reset its statistics.
+        """
+        with self.lock:
+            self.plans.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+PLAN_CACHE = None
+
+
+def get_plan_cache():
+    """
+    Return a singleton instance of the 'QueryPlanCache' class.
+    :return: an instance of the 'QueryPlanCache' class
+    """
+    global PLAN_CACHE
+    if PLAN_CACHE is None:
+        PLAN_CACHE = QueryPlanCache(size_limit=get_config().plan_cache_size())
+    return PLAN_CACHE
@@ -4,6 +4,7 @@ This module contains a definition of object queries.
 
 """
 
+import itertools
 import logging
 
 from rome.core.dataformat.json import Decoder
@@ -17,6 +18,8 @@ class Query(object):
 
         self.session = kwargs.pop("__session", None)
         self.query_tree = None
+        self.query_plan = None
+        self.query_parameters = None
         self.entity_class_registry = None
         self._autoflush = True
         self.read_deleted = "no"
@@ -49,10 +52,7 @@ class Query(object):
                 else:
                     session_candidate = None
                 self.session = session_candidate
-                if len(attributes) == 0:
-                    self.sa_query = SqlAlchemyQuery(entities, session=session_candidate)
-                else:
-                    self.sa_query = SqlAlchemyQuery(attributes, session=session_candidate)
+                self.sa_query = SqlAlchemyQuery(entities, session=session_candidate)
 
     def set_sa_query(self, query):
         """
@@ -68,6 +68,16 @@ class Query(object):
         """
         self.query_tree = query_tree
 
+    def set_query_plan(self, query_plan, parameters):
+        """
+        Set the query_plan, and the values that should be bound in it
+        :param query_plan: an instance of QueryPlan
+        :param parameters: a dict that contains the values of the placeholders of the plan
+        """
+        self.query_plan = query_plan
+        self.query_parameters = parameters
+        self.query_tree = query_plan.query_tree
+
     def set_entity_class_registry(self, entity_class_registry):
         """
         Set the "entity_class_registry" field
@@ -106,30 +116,25 @@ class Query(object):
         :return: An entity class registry object if one could be found. None in case no entity class
         registry could be found
         """
+        from rome.core.orm.mapping import get_mapping_registry
+
         for description in self.sa_query.column_descriptions:
             if "entity" in description:
                 declarative_meta = description["entity"]
                 _class_registry = getattr(
                     declarative_meta, "_decl_class_registry", None)
                 if _class_registry is not None:
-                    entity_class_registry = {}
-                    for elmnt in _class_registry.values():
-                        if type(elmnt) is DeclarativeMeta:
-                            description = elmnt.__table__.description
-                            entity_class_registry[description] = elmnt
-                    return entity_class_registry
+                    return get_mapping_registry().get_entity_classes(_class_registry)
         return None
 
-    def matching_objects(self, filter_deleted):
+    def _prepare_execution(self, filter_deleted):
         """
-        Execute the query, and return its result as rows
+        Flush the session, and find the plan of the query and the values that should be bound in it
         :param filter_deleted: a boolean. When filter_deleted is True, matching objects that have
         been soft_deleted are filtered
-        :return: a list of tuples (can be objects/values or list of objects values)
+        :return: a tuple (query_plan, parameters, read_deleted)
         """
-        from rome.core.orm.utils import get_literal_query
-        from rome.lang.sql_parser import QueryParser
-        from rome.core.rows.rows import construct_rows
+        from rome.core.orm.plan_cache import QueryPlan, get_plan_cache
 
         read_deleted = self.read_deleted
         if filter_deleted:
@@ -139,52 +144,162 @@ class Query(object):
             if self.session is not None:
                 self.session.commit()
 
-        if not self.query_tree:
-            sql_query = get_literal_query(self.sa_query)
-            parser = QueryParser()
-            query_tree = parser.parse(sql_query)
+        if self.query_plan is not None:
+            (query_plan, parameters) = (self.query_plan, self.query_parameters)
+        elif self.query_tree:
+            (query_plan, parameters) = (QueryPlan(self.query_tree), {})
         else:
-            query_tree = self.query_tree
+            (query_plan, parameters) = get_plan_cache().get_plan(self.sa_query)
 
         if not self.entity_class_registry:
             self.entity_class_registry = self._extract_entity_class_registry()
+
+        return query_plan, parameters, read_deleted
+
+    def _execute_plan(self, query_plan, parameters, read_deleted, limit=None):
+        """
+        Execute the plan of the query, and return the raw rows of its result
+        :param query_plan: an instance of QueryPlan
+        :param parameters: a dict that contains the values of the placeholders of the plan
+        :param read_deleted: a string. Value can be "yes", "no" and "only"
+        :param limit: (facultative) the maximum number of rows that should be returned, in
+        addition to the limit of the query
+        :return: a list of rows
+        """
+        from rome.core.rows.rows import construct_rows
+
+        query_tree = query_plan.query_tree
         entity_class_registry = self.entity_class_registry
 
         # Collecting variables of sub queries
         subqueries_variables = {}
-        for (variable_name, sub_query_tree) in query_tree.variables.iteritems():
+        for (variable_name, sub_query_plan) in query_plan.variables.iteritems():
             sub_query = Query()
-            sub_query.set_query_tree(sub_query_tree)
+            sub_query.set_query_plan(sub_query_plan, parameters)
             sub_query.set_entity_class_registry(entity_class_registry)
             result = sub_query.all()
             subqueries_variables[variable_name] = result
 
+        # Only the rows that will be returned are built into objects
+        (query_limit, offset) = query_plan.bind_limits(parameters)
+        if query_limit is not None:
+            limit = query_limit if limit is None else min(limit, query_limit)
+
         rows = construct_rows(query_tree,
                               entity_class_registry,
                               read_deleted=read_deleted,
-                              subqueries_variables= subqueries_variables)
+                              subqueries_variables=subqueries_variables,
+                              plan=query_plan,
+                              parameters=parameters,
+                              limit=limit,
+                              offset=offset)
+
+        return rows
+
+    def matching_rows(self, filter_deleted, limit=None):
+        """
+        Execute the query, and return its result as raw rows, without building any object
+        :param filter_deleted: a boolean. When filter_deleted is True, matching objects that have
+        been soft_deleted are filtered
+        :param limit: (facultative) the maximum number of rows that should be returned, in
+        addition to the limit of the query
+        :return: a tuple (query_tree, rows), where each row is a dict that associates the tables
+        of the query with raw objects (dicts), and the function calls with their values
+        """
+        (query_plan, parameters, read_deleted) = self._prepare_execution(filter_deleted)
+        rows = self._execute_plan(query_plan, parameters, read_deleted, limit=limit)
+        return query_plan.query_tree, rows
+
+    def matching_row_batches(self, filter_deleted, batch_size):
+        """
+        Execute the query, and return its result as batches of raw rows. The rows of queries that
+        have a table scan are read by batches from the database driver, unless they can use a
+        secondary index, while the rows of the other queries are built at once and split into
+        batches.
+        :param filter_deleted: a boolean. When filter_deleted is True, matching objects that have
+        been soft_deleted are filtered
+        :param batch_size: the number of rows of each batch
+        :return: a tuple (query_tree, batches), where batches is a generator of lists of rows
+        """
+        (query_plan, parameters, read_deleted) = self._prepare_execution(filter_deleted)
+        table_scan = query_plan.table_scan
+        if table_scan is not None and \
+                table_scan.uses_secondary_indexes(self.entity_class_registry[table_scan.table_name]):
+            table_scan = None
+        if table_scan is not None:
+            (limit, offset) = query_plan.bind_limits(parameters)
+            batches = table_scan.stream_rows(parameters, batch_size, read_deleted=read_deleted,
+                                             limit=limit, offset=offset)
+        else:
+            rows = self._execute_plan(query_plan, parameters, read_deleted)
+            batches = (rows[i:i + batch_size] for i in xrange(0, len(rows), batch_size))
+        return query_plan.query_tree, batches
+
+    def matching_objects(self, filter_deleted, limit=None):
+        """
+        Execute the query, and return its result as rows
+        :param filter_deleted: a boolean. When filter_deleted is True, matching objects that have
+        been soft_deleted are filtered
+        :param limit: (facultative) the maximum number of rows that should be returned, in
+        addition to the limit of the query
+        :return: a list of tuples (can be objects/values or list of objects values)
+        """
+        (query_tree, rows) = self.matching_rows(filter_deleted, limit=limit)
+        return self.build_objects(query_tree, rows)
+
+    def matching_object_batches(self, batch_size, filter_deleted=False):
+        """
+        Execute the query, and build its result by batches: the objects of a batch are built once
+        the previous batch has been consumed.
+        :param batch_size: the number of rows of each batch
+        :param filter_deleted: a boolean. When filter_deleted is True, matching objects that have
+        been soft_deleted are filtered
+        :return: a generator of lists of tuples (can be objects/values or list of objects values)
+        """
+        (query_tree, batches) = self.matching_row_batches(filter_deleted, batch_size)
+        for rows in batches:
+            yield self.build_objects(query_tree, rows)
+
+    def build_objects(self, query_tree, rows):
+        """
+        Build the result of the query from raw rows
+        :param query_tree: a tree representation of the query
+        :param rows: a list of rows, where each row is a dict that associates the tables of the
+        query with raw objects (dicts), and the function calls with their values
+        :return: a list of tuples (can be objects/values or list of objects values)
+        """
+
+        from rome.core.orm.materializers import get_materializer
+        from rome.core.orm.object_cache import get_object_cache
+        from rome.core.session.utils import ObjectAttributeRefresher
+
+        # Relationships of the objects are refreshed once all the objects have been built, so that
+        # they can be loaded in batches
+        new_objects = []
+        object_cache = get_object_cache()
 
         def row_function(row, column_descriptions, decoder):
-            from rome.core.session.utils import ObjectAttributeRefresher
             final_row = []
             one_is_an_object = False
-            object_attribute_refresher = ObjectAttributeRefresher()
             for column_description in column_descriptions:
                 if type(column_description["type"]) in [Integer, String]:
-                    row_key = column_description["entity"].__table__.name.capitalize(
-                    )
+                    row_key = column_description["entity"].__table__.name
+                    if row_key not in row:
+                        row_key = row_key.capitalize()
                     property_name = column_description["name"]
-                    value = None
-                    if row_key in row and property_name in row[row_key]:
+                    value_found = False
+                    if row.get(row_key, None) is not None and property_name in row[row_key]:
                         value = row[row_key].get(property_name, None)
+                        value_found = True
                     else:
                         # It seems that we are parsing the result of a function call
                         column_description_expr = column_description.get("expr",
                                                                          None)
                         if column_description_expr is not None:
                             property_name = str(column_description_expr)
+                            value_found = property_name in row
                             value = row.get(property_name, None)
-                    if value is not None:
+                    if value_found:
                         final_row += [value]
                     else:
                         logging.error(
@@ -193,21 +308,13 @@ class Query(object):
                 elif type(column_description["type"]) == DeclarativeMeta:
                     one_is_an_object = True
                     row_key = column_description["entity"].__table__.name
-                    new_object = column_description["entity"]()
-                    attribute_names = map(lambda x: x.key, list(
-                        column_description["entity"].__table__.columns))
-                    for attribute_name in attribute_names:
-                        value = decoder.decode(row[row_key].get(attribute_name,
-                                                                None))
-                        setattr(new_object, attribute_name, value)
-
-                    if "___version_number" in row[row_key]:
-                        setattr(new_object, "___version_number", row[row_key]["___version_number"])
-
-                    load_options = None
-                    if hasattr(self.sa_query, "_with_options"):
-                        load_options = self.sa_query._with_options
-                    object_attribute_refresher.refresh(new_object, load_options=load_options)
+                    if row[row_key] is None:
+                        # No object matched in an outer joined table
+                        final_row += [None]
+                        continue
+                    materializer = get_materializer(column_description["entity"])
+                    new_object = materializer.materialize(row[row_key], object_cache)
+                    new_objects.append(new_object)
                     final_row += [new_object]
                 else:
                     logging.error("Unsupported type: '%s'" %
@@ -219,20 +326,27 @@ class Query(object):
 
         def row_function_subquery(row, attributes, decoder):
             result = []
-            for attribute in attributes:
-                tablename = attribute.split(".")[0]
-                attribute_name = attribute.split(".")[1]
+            for (index, attribute) in enumerate(attributes):
+                if index in query_tree.function_calls:
+                    function_name = query_tree.function_calls[index]
+                    result += [row["%s(%s)" % (function_name, attribute)]]
+                    continue
+                (tablename, attribute_name) = attribute.replace("\"", "").split(".", 1)
                 result += [row[tablename][attribute_name]]
             return result
 
         decoder = Decoder()
 
-        if len(self.sa_query.column_descriptions) > 0:
-            final_rows = map(lambda r: row_function(
-                r, self.sa_query.column_descriptions, decoder), rows)
+        # The column descriptions of a SQLAlchemy query are computed each time they are accessed
+        column_descriptions = self.sa_query.column_descriptions
+        if len(column_descriptions) > 0:
+            final_rows = map(lambda r: row_function(r, column_descriptions, decoder), rows)
         else:
             final_rows = map(lambda r: row_function_subquery(
-                r, self.query_tree.attributes, decoder), rows)
+                r, query_tree.attributes, decoder), rows)
+
+        load_options = getattr(self.sa_query, "_with_options", None)
+        ObjectAttributeRefresher().refresh_all(new_objects, load_options=load_options)
 
         if len(self.sa_query.column_descriptions) <= 1:
             # Flatten the list
@@ -264,7 +378,7 @@ class Query(object):
         :return: a single tuple (can be objects/values or list of objects values) if a value could
         be found. None is returned if no value can be found.
         """
-        objects = self.matching_objects(filter_deleted=filter_deleted)
+        objects = self.matching_objects(filter_deleted=filter_deleted, limit=1)
 
         if len(objects) > 0:
             value = objects[0]
@@ -275,13 +389,72 @@ class Query(object):
         else:
             return None
 
+    def get(self, ident):
+        """
+        Return the object whose primary key is 'ident'. The object is fetched directly from the
+        database driver, without planning any query.
+        :param ident: the value of the primary key (or a tuple that contains this value)
+        :return: an object if it could be found, None otherwise
+        """
+        from sqlalchemy.exc import InvalidRequestError
+
+        if isinstance(ident, (tuple, list)):
+            if len(ident) != 1:
+                raise InvalidRequestError("Incorrect number of values in identifier formed "
+                                          "from argument to get().")
+            ident = ident[0]
+        objects = self.get_many([ident])
+        return objects[0] if len(objects) > 0 else None
+
+    def get_many(self, idents):
+        """
+        Return the objects whose primary keys are in 'idents'. The objects are fetched with a
+        single multi-key get of the database driver, without planning any query.
+        :param idents: a list of values of the primary key
+        :return: a list of objects, in the order of the keys (keys that do not match any object
+        are skipped)
+        """
+        from sqlalchemy.exc import InvalidRequestError
+        from rome.core.rows.rows import filter_deleted_objects
+        from rome.driver.database_driver import get_driver
+
+        column_descriptions = self.sa_query.column_descriptions
+        if len(column_descriptions) != 1 or \
+                type(column_descriptions[0]["type"]) is not DeclarativeMeta:
+            raise InvalidRequestError("get() can only be used against a single mapped class.")
+
+        if self._autoflush:
+            if self.session is not None:
+                self.session.commit()
+
+        keys = []
+        known_keys = set()
+        for ident in idents:
+            if ident is not None and ident not in known_keys:
+                known_keys.add(ident)
+                keys += [ident]
+        table_name = column_descriptions[0]["entity"].__table__.name
+        objects = filter(lambda x: x is not None, get_driver().get_many(table_name, keys))
+        objects = filter_deleted_objects(objects, self.read_deleted)
+        rows = map(lambda x: {table_name: x}, objects)
+        return self.build_objects(None, rows)
+
     def count(self):
         """
         Executes the query and returns the number of matching rows.
         :return: an int corresponding of the number of rows matching the request.
         """
-        objects = self.all()
-        return len(objects)
+        (_, rows) = self.matching_rows(filter_deleted=False)
+        return len(rows)
+
+    def has_rows(self):
+        """
+        Executes the query and tells if at least one row matches, without building objects.
+        SQLAlchemy's Query.exists(), which returns an EXISTS clause, is left untouched.
+        :return: a boolean which is True if at least one row matches the request.
+        """
+        (_, rows) = self.matching_rows(filter_deleted=False, limit=1)
+        return len(rows) > 0
 
     def delete(self, synchronize_session='evaluate'):
         from rome.core.session.session import Session
@@ -305,6 +478,11 @@ class Query(object):
         return len(objects)
 
     def __iter__(self):
+        # The batch size given to 'yield_per' is kept by the SQLAlchemy query, and by the queries
+        # derived from it
+        batch_size = getattr(self.sa_query, "_yield_per", None)
+        if batch_size:
+            return itertools.chain.from_iterable(self.matching_object_batches(batch_size))
         return iter(self.all())
 
     def update(self, values, synchronize_session='evaluate', update_args=None):
@@ -348,7 +526,8 @@ class Query(object):
         # return None
 
     def one(self):
-        matching_objects = self.matching_objects(filter_deleted=False)
+        # Two rows are enough to know if there is more than one result
+        matching_objects = self.matching_objects(filter_deleted=False, limit=2)
         if len(matching_objects) == 0:
             from sqlalchemy.orm.exc import NoResultFound
             raise NoResultFound()
@@ -49,6 +49,9 @@ class LiteralDialect(DefaultDialect):
     }
 
 
+LITERAL_DIALECT = LiteralDialect()
+
+
 def get_literal_query(statement):
     """
     Extracts the SQL query corresponding to a SQLAlchemy query.
@@ -62,3 +65,36 @@ def get_literal_query(statement):
         statement = statement.selectable
     return statement.compile(dialect=LiteralDialect(),
                              compile_kwargs={'literal_binds': True},).string
+
+
+def render_literal_value(value, type_):
+    """
+    Render a value as a SQL literal, in the same way as the LiteralDialect does.
+    :param value: a python value
+    :param type_: the SQLAlchemy type of the value
+    :return: a string
+    """
+    processor = type_._cached_literal_processor(LITERAL_DIALECT)
+    if processor is None:
+        raise NotImplementedError("Don't know how to literal-quote value %r" % (value))
+    return processor(value)
+
+
+def get_parametrized_query(statement):
+    """
+    Extracts the SQL query corresponding to a SQLAlchemy query, where each literal value has been
+    replaced by a named placeholder (such as ':id_1'). Two queries that only differ by their
+    literal values share the same parametrized SQL query.
+    :param statement: a query object
+    :return: a tuple (sql_query, parameters, parameter_types), where parameters is a dict that
+    associates the name of each placeholder with its value, and parameter_types a dict that
+    associates the name of each placeholder with the SQLAlchemy type of its value
+    """
+    import sqlalchemy.orm
+    if isinstance(statement, sqlalchemy.orm.Query):
+        statement = statement.selectable
+    compiled = statement.compile(dialect=LITERAL_DIALECT)
+    parameter_types = {}
+    for name in compiled.params:
+        parameter_types[name] = compiled.binds[name].type
+    return compiled.string, compiled.params, parameter_types
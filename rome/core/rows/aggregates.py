@@ -0,0 +1,176 @@
+"""Aggregates module.
+
+This module contains the aggregate functions (count, sum, min, max and avg) that can be used in
+the attributes of a query, and the execution of GROUP BY clauses. Tuples are grouped with a hash
+table in a single pass over the raw values of their objects, where the aggregates of each group
+are updated, without building any entity. As in SQL, NULL values are ignored, and the aggregates
+of an empty set of values are NULL, except for count which is 0. HAVING clauses are compiled by
+the 'rome.core.rows.predicates' module.
+
+"""
+
+from rome.core.rows.joins import join_key
+from rome.lang.expression import BinaryComparison, BooleanClause, FunctionCall, Negation
+
+
+class Aggregate(object):
+
+    """Base class of aggregate functions: values are added one by one, and the result is
+    computed once every value has been added."""
+
+    def add(self, value):
+        """
+        Add a value to the aggregate.
+        :param value: a raw value of an object
+        """
+        raise NotImplementedError
+
+    def result(self):
+        """
+        Compute the value of the aggregate.
+        :return: a value
+        """
+        raise NotImplementedError
+
+
+class CountAggregate(Aggregate):
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            self.count += 1
+
+    def result(self):
+        return self.count
+
+
+class SumAggregate(Aggregate):
+
+    def __init__(self):
+        self.sum = None
+
+    def add(self, value):
+        if value is not None:
+            self.sum = value if self.sum is None else self.sum + value
+
+    def result(self):
+        return self.sum
+
+
+class AvgAggregate(Aggregate):
+
+    def __init__(self):
+        self.sum = 0
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            self.sum += value
+            self.count += 1
+
+    def result(self):
+        if self.count == 0:
+            return None
+        return float(self.sum) / self.count
+
+
+class ExtremumAggregate(Aggregate):
+
+    """Minimum or maximum of values: values are compared with their join key, so that datetime
+    values are compared with their serialized representation, but the original value is kept."""
+
+    def __init__(self, maximum=False):
+        self.maximum = maximum
+        self.key = None
+        self.value = None
+
+    def add(self, value):
+        key = join_key(value)
+        if key is None:
+            return
+        if self.key is None or (key > self.key if self.maximum else key < self.key):
+            (self.key, self.value) = (key, value)
+
+    def result(self):
+        return self.value
+
+
+AGGREGATES = {
+    "count": CountAggregate,
+    "sum": SumAggregate,
+    "avg": AvgAggregate,
+    "min": lambda: ExtremumAggregate(maximum=False),
+    "max": lambda: ExtremumAggregate(maximum=True),
+}
+
+
+def new_aggregate(function_name):
+    """
+    Create an aggregate function.
+    :param function_name: the name of the function (count, sum, avg, min or max)
+    :return: an instance of Aggregate
+    """
+    if function_name.lower() not in AGGREGATES:
+        raise Exception("Aggregate function '%s' is not supported" % (function_name))
+    return AGGREGATES[function_name.lower()]()
+
+
+def _attribute_value(each, label, attribute):
+    obj = each.get(label, None) if each is not None else None
+    return obj.get(attribute, None) if obj is not None else None
+
+
+def group_tuples(tuples, group_by, function_calls):
+    """
+    Group tuples, and compute the aggregates of each group in a single pass over the tuples.
+    :param tuples: an iterable of tuples, where each tuple is a dict that associates labels with
+    objects
+    :param group_by: a list of ColumnReference: tuples that have the same values for these
+    columns belong to the same group. When it is empty, every tuple belongs to a single group,
+    that exists even if there is no tuple.
+    :param function_calls: a list of tuples (row_key, function_name, label, attribute), where
+    row_key is the key under which the value of the aggregate is returned
+    :return: a list of pairs (first_tuple, values) in the order in which groups have been found,
+    where first_tuple is the first tuple of the group (None for an empty group) and values is a
+    dict that associates each row_key with the value of its aggregate
+    """
+    groups = {}
+    group_keys = []
+    for each in tuples:
+        group_key = tuple(map(lambda x: join_key(_attribute_value(each, x.table, x.column)),
+                              group_by))
+        if group_key not in groups:
+            groups[group_key] = (each, map(lambda x: new_aggregate(x[1]), function_calls))
+            group_keys += [group_key]
+        aggregates = groups[group_key][1]
+        for (aggregate, (_, _, label, attribute)) in zip(aggregates, function_calls):
+            aggregate.add(_attribute_value(each, label, attribute))
+    if len(group_by) == 0 and len(group_keys) == 0:
+        groups[()] = (None, map(lambda x: new_aggregate(x[1]), function_calls))
+        group_keys += [()]
+    result = []
+    for group_key in group_keys:
+        (first_tuple, aggregates) = groups[group_key]
+        values = dict(map(lambda x: (x[0][0], x[1].result()), zip(function_calls, aggregates)))
+        result += [(first_tuple, values)]
+    return result
+
+
+def having_function_calls(expression):
+    """
+    Find the aggregates used in a HAVING clause.
+    :param expression: an expression
+    :return: a list of tuples (row_key, function_name, label, attribute)
+    """
+    if isinstance(expression, FunctionCall):
+        argument = expression.argument
+        return [(str(expression), expression.name, argument.table, argument.column)]
+    if isinstance(expression, BinaryComparison):
+        return having_function_calls(expression.left) + having_function_calls(expression.right)
+    if isinstance(expression, BooleanClause):
+        return reduce(lambda x, y: x + y, map(having_function_calls, expression.operands), [])
+    if isinstance(expression, Negation):
+        return having_function_calls(expression.operand)
+    return []
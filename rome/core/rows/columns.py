@@ -0,0 +1,270 @@
+"""Columns module.
+
+This module contains a compiler of the predicates that involve a single table into filters that are
+evaluated on the columns of tables stored by columns (see the 'rome.driver.memory.columnar'
+module). Comparisons of a column with values of the query, IN lists and IS NULL tests are evaluated
+on whole column arrays with NumPy, with the three-valued logic of SQL: an evaluation returns a mask
+of the objects for which the expression is TRUE, and a mask of those for which it is FALSE. Only
+the objects for which every such conjunct of the predicate is TRUE are built: the predicate of the
+table is still evaluated on them afterwards.
+
+Comparisons whose semantics cannot be reproduced on arrays (for instance a string column compared
+with a number, where SQL converts each value of the column) are left to the predicate of the table.
+
+"""
+
+import numpy
+
+from rome.core.rows.hints import conjuncts
+from rome.core.rows.joins import join_key
+from rome.lang.expression import (BinaryComparison, BooleanClause, ColumnReference, Constant,
+                                  Negation, Placeholder, ValueList)
+
+COMPARISON_FUNCTIONS = {
+    "=": numpy.equal,
+    "!=": numpy.not_equal,
+    "<": numpy.less,
+    "<=": numpy.less_equal,
+    ">": numpy.greater,
+    ">=": numpy.greater_equal,
+}
+
+FLIPPED_OPERATORS = {"=": "=", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+NUMERIC_KINDS = ["bool", "int", "float"]
+
+INT64_BOUND = 2 ** 63
+
+
+class UnsupportedColumnExpression(Exception):
+
+    """Raised when an expression cannot be evaluated on the columns of a table."""
+
+
+def _numeric_value(kind, value):
+    # Convert a value compared with a numeric column, as the 'compare' function of the predicates
+    # module does
+    if isinstance(value, basestring):
+        try:
+            value = float(value) if kind == "float" else int(value)
+        except ValueError:
+            raise UnsupportedColumnExpression()
+    if not isinstance(value, (int, long, float)):
+        raise UnsupportedColumnExpression()
+    if isinstance(value, long) and abs(value) >= INT64_BOUND:
+        raise UnsupportedColumnExpression()
+    return value
+
+
+def _numeric_keys(kind, keys):
+    # Find the numbers of a numeric column that belong to a set of keys, with the conversions of
+    # the 'KeySet' class of the predicates module: strings are converted to the type of the column,
+    # or compared with the representation of the values of the column when they are not numbers
+    result = []
+    for key in keys:
+        if isinstance(key, basestring):
+            try:
+                key = float(key) if kind == "float" else int(key)
+            except ValueError:
+                if kind == "bool" and key in ["True", "False"]:
+                    result += [key == "True"]
+                continue
+        elif not isinstance(key, (int, long, float)):
+            continue
+        if not isinstance(key, long) or abs(key) < INT64_BOUND:
+            result += [key]
+    return result
+
+
+def _column_arrays(table, column):
+    arrays = table.column(column)
+    if arrays is None:
+        # No object of the table has this column: its values are NULL
+        nulls = numpy.ones(table.size, dtype=numpy.bool_)
+        return None, nulls, nulls
+    return arrays
+
+
+def _value_operand(operand):
+    if isinstance(operand, Placeholder):
+        name = operand.name
+        return lambda environment: join_key(environment["parameters"].get(name, None))
+    if isinstance(operand, Constant):
+        value = join_key(operand.value)
+        return lambda environment: value
+    return None
+
+
+def compile_comparison(expression, label):
+    (left, right, operator) = (expression.left, expression.right, expression.operator)
+    if isinstance(right, ColumnReference) and not isinstance(left, ColumnReference):
+        if operator not in FLIPPED_OPERATORS:
+            return None
+        (left, right, operator) = (right, left, FLIPPED_OPERATORS[operator])
+    if not isinstance(left, ColumnReference) or left.table != label:
+        return None
+    column = left.column
+
+    if operator in ["IN", "NOT IN"]:
+        if not isinstance(right, ValueList):
+            return None
+        items = map(_value_operand, right.items)
+        if None in items:
+            return None
+        negated = operator == "NOT IN"
+
+        def membership(table, environment):
+            (kind, values, nulls) = _column_arrays(table, column)
+            keys = set(map(lambda x: x(environment), items))
+            if kind in NUMERIC_KINDS:
+                matches = numpy.in1d(values, _numeric_keys(kind, keys))
+            elif kind == "string":
+                if any(map(lambda x: not isinstance(x, basestring) and x is not None, keys)):
+                    raise UnsupportedColumnExpression()
+                matches = numpy.zeros(len(nulls), dtype=numpy.bool_)
+                positions = numpy.flatnonzero(~nulls)
+                string_keys = filter(lambda x: x is not None, keys)
+                if len(positions) > 0 and len(string_keys) > 0:
+                    matches[positions] = numpy.in1d(values[positions], string_keys)
+            elif kind is None:
+                matches = numpy.zeros(len(nulls), dtype=numpy.bool_)
+            else:
+                raise UnsupportedColumnExpression()
+            true_mask = matches & ~nulls
+            if None in keys:
+                false_mask = numpy.zeros(len(nulls), dtype=numpy.bool_)
+            else:
+                false_mask = ~matches & ~nulls
+            return (false_mask, true_mask) if negated else (true_mask, false_mask)
+        return membership
+
+    value = _value_operand(right)
+    if value is None:
+        return None
+    if operator in ["IS", "IS NOT"]:
+        expected = operator == "IS"
+
+        def identity(table, environment):
+            (kind, _, nulls) = _column_arrays(table, column)
+            # Objects such as encoded dates are compared through their value
+            if value(environment) is not None or kind == "object":
+                raise UnsupportedColumnExpression()
+            return (nulls, ~nulls) if expected else (~nulls, nulls)
+        return identity
+    if operator not in COMPARISON_FUNCTIONS:
+        return None
+    function = COMPARISON_FUNCTIONS[operator]
+
+    def comparison(table, environment):
+        (kind, values, nulls) = _column_arrays(table, column)
+        right_value = value(environment)
+        if right_value is None or kind is None:
+            unknown = numpy.zeros(len(nulls), dtype=numpy.bool_)
+            return unknown, unknown
+        if kind in NUMERIC_KINDS:
+            matches = function(values, _numeric_value(kind, right_value))
+        elif kind == "string" and isinstance(right_value, basestring):
+            matches = numpy.zeros(len(nulls), dtype=numpy.bool_)
+            positions = numpy.flatnonzero(~nulls)
+            matches[positions] = function(values[positions], right_value).astype(numpy.bool_)
+        else:
+            raise UnsupportedColumnExpression()
+        return matches & ~nulls, ~matches & ~nulls
+    return comparison
+
+
+def compile_column_expression(expression, label):
+    """
+    Compile a boolean expression into a function evaluated on the columns of a table.
+    :param expression: an expression
+    :param label: the label of the table in the query
+    :return: a function (table, environment) -> (true_mask, false_mask), which raises
+    UnsupportedColumnExpression when the values of the query or the columns of the table do not
+    allow its evaluation on arrays, or None if the expression cannot be evaluated on columns
+    """
+    if isinstance(expression, BooleanClause):
+        operands = map(lambda x: compile_column_expression(x, label), expression.operands)
+        if None in operands:
+            return None
+        is_and = expression.operator == "AND"
+
+        def boolean_clause(table, environment):
+            results = map(lambda x: x(table, environment), operands)
+            (true_masks, false_masks) = (map(lambda x: x[0], results), map(lambda x: x[1], results))
+            if is_and:
+                return numpy.logical_and.reduce(true_masks), numpy.logical_or.reduce(false_masks)
+            return numpy.logical_or.reduce(true_masks), numpy.logical_and.reduce(false_masks)
+        return boolean_clause
+    if isinstance(expression, Negation):
+        operand = compile_column_expression(expression.operand, label)
+        if operand is None:
+            return None
+
+        def negation(table, environment):
+            (true_mask, false_mask) = operand(table, environment)
+            return false_mask, true_mask
+        return negation
+    if isinstance(expression, BinaryComparison):
+        return compile_comparison(expression, label)
+    return None
+
+
+class ColumnFilter(object):
+
+    """A filter evaluated on the columns of a table: the conjuncts of a predicate of the table that
+    can be evaluated on arrays."""
+
+    def __init__(self, label, expressions):
+        self.label = label
+        self.expressions = expressions
+        self.evaluations = map(lambda x: compile_column_expression(x, label), expressions)
+
+    def bind(self, parameters=None):
+        """
+        Bind the values of the query in the filter.
+        :param parameters: a dict that contains the values of the placeholders of the query
+        :return: a function that takes a table stored by columns, and returns the positions of the
+        objects for which every conjunct that can be evaluated on arrays is TRUE
+        """
+        environment = {"parameters": parameters if parameters is not None else {}}
+        evaluations = self.evaluations
+
+        def column_filter(table):
+            mask = numpy.ones(table.size, dtype=numpy.bool_)
+            for evaluate in evaluations:
+                try:
+                    (true_mask, _) = evaluate(table, environment)
+                except UnsupportedColumnExpression:
+                    continue
+                mask &= true_mask
+            return numpy.flatnonzero(mask)
+        return column_filter
+
+
+def build_column_filters(table_predicates, semi_joins):
+    """
+    Build the filters of the tables of a query, from the predicates of the tables and from their
+    IN lists. IN lists are executed as semi-joins (see the 'rome.core.rows.semijoins' module),
+    which compare values without converting them: their filters select a superset of the objects
+    they keep. NOT IN lists are only executed as anti-joins.
+    :param table_predicates: a dict that associates labels with predicates (Predicate)
+    :param semi_joins: a list of SemiJoin
+    :return: a dict that associates labels with instances of ColumnFilter
+    """
+    expressions = {}
+    for (label, predicate) in table_predicates.iteritems():
+        expressions.setdefault(label, []).extend(conjuncts(predicate.expression))
+    for semi_join in semi_joins:
+        if semi_join.placeholders is None or semi_join.negated:
+            continue
+        column = ColumnReference(semi_join.table_name, semi_join.attribute,
+                                 "\"%s\".%s" % (semi_join.table_name, semi_join.attribute))
+        expression = BinaryComparison(column, "IN", ValueList(semi_join.placeholders))
+        expressions.setdefault(semi_join.table_name, []).append(expression)
+    result = {}
+    for (label, label_expressions) in expressions.iteritems():
+        supported_expressions = filter(lambda x: compile_column_expression(x, label) is not None,
+                                       label_expressions)
+        if len(supported_expressions) > 0:
+            result[label] = ColumnFilter(label, supported_expressions)
+    return result
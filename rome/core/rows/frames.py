@@ -0,0 +1,132 @@
+"""Frames module.
+
+This module contains a cache of the column frames used to filter tuples with a pandas where clause
+(see the 'filter_tuples' function of the 'rome.core.rows.tuples' module). The frame of a table
+contains the needed columns of its objects, indexed by their identifiers, where encoded dates are
+replaced by their text value and NULL values by 0.
+
+Frames are cached with the version number of their table: queries on a table that has not been
+modified since the previous query reuse its frame, which is only completed with the objects that
+it does not contain yet. The frame of a table is replaced as soon as the table is modified.
+
+"""
+
+import threading
+
+import numpy
+import pandas as pd
+
+from rome.conf.configuration import get_config
+from rome.utils.dictionary_with_limited_size import DictionaryWithLimitedSize
+
+
+def is_encoded_datetime(value):
+    """
+    Check if a value is a date encoded by the JSON encoder of Rome.
+    :param value: a python value
+    :return: a boolean
+    """
+    return isinstance(value, dict) and value.get("simplify_strategy", None) == "datetime"
+
+
+def build_column_frame(objects, columns, keys):
+    """
+    Build the frame of the columns of several objects.
+    :param objects: a list of objects (dicts)
+    :param columns: a list of attribute names
+    :param keys: a list that contains the key of each object, used as the index of the frame
+    :return: a DataFrame
+    """
+    data = {}
+    for column in columns:
+        values = map(lambda x: x.get(column, None), objects)
+        # <Quick fix for handling dates>
+        first_value = next((x for x in values if x is not None), None)
+        if is_encoded_datetime(first_value):
+            values = map(lambda x: x["value"] if isinstance(x, dict) else x, values)
+        # </Quick fix for handling dates>
+        data[column] = values
+    frame = pd.DataFrame(data=data, columns=columns, index=keys)
+    return frame.fillna(value=0)
+
+
+class ColumnFrameCache(object):
+
+    """A cache of the frames of the tables, indexed by table name and columns, and validated by
+    the version number of their table."""
+
+    def __init__(self, size_limit=None):
+        self.frames = DictionaryWithLimitedSize(size_limit=size_limit)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_frame(self, table_name, version, columns, objects):
+        """
+        Return the frame of the columns of objects of a table. The frame is built only if the
+        table has been modified since the frame was cached, and is completed with the objects
+        that it does not contain.
+        :param table_name: a table name
+        :param version: the version number of the table, read before its objects were fetched
+        :param columns: a list of attribute names
+        :param objects: a list of objects of the table (dicts that contain an 'id' key)
+        :return: a DataFrame indexed by the identifiers of the objects, which may contain other
+        objects of the table
+        """
+        key = (table_name, tuple(columns))
+        with self.lock:
+            # Entries are moved to the end of the dict when they are used
+            entry = self.frames.pop(key, None)
+        if entry is not None and entry[0] == version:
+            frame = entry[1]
+            indexer = frame.index.get_indexer([x["id"] for x in objects])
+            missing_objects = dict((objects[i]["id"], objects[i])
+                                   for i in numpy.flatnonzero(indexer == -1))
+            if len(missing_objects) == 0:
+                self.hits += 1
+            else:
+                self.misses += 1
+                new_frame = build_column_frame(missing_objects.values(), columns,
+                                               missing_objects.keys())
+                frame = pd.concat([frame, new_frame])
+        else:
+            self.misses += 1
+            distinct_objects = dict((x["id"], x) for x in objects)
+            frame = build_column_frame(distinct_objects.values(), columns, distinct_objects.keys())
+        with self.lock:
+            self.frames[key] = (version, frame)
+        return frame
+
+    def statistics(self):
+        """
+        Return statistics about the usage of the cache.
+        :return: a dict that contains the number of hits, misses and cached frames
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.frames)
+        }
+
+    def clear(self):
+        """
+        Remove every frame from the cache, and reset its statistics.
+        """
+        with self.lock:
+            self.frames.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+FRAME_CACHE = None
+
+
+def get_frame_cache():
+    """
+    Return a singleton instance of the 'ColumnFrameCache' class.
+    :return: an instance of the 'ColumnFrameCache' class
+    """
+    global FRAME_CACHE
+    if FRAME_CACHE is None:
+        FRAME_CACHE = ColumnFrameCache(size_limit=get_config().frame_cache_size())
+    return FRAME_CACHE
@@ -0,0 +1,111 @@
+"""Hints module.
+
+This module contains the functions that push the predicates of a query down to the database
+driver: equality and IN predicates on the 'id' of a table (or on one of its secondary indexes)
+are turned into hints, so that the driver only fetches the candidate objects of the table instead
+of the whole table. The predicates are still evaluated on the candidate objects afterwards.
+
+"""
+
+from rome.lang.expression import BinaryComparison, BooleanClause, ColumnReference, Placeholder
+from rome.lang.expression import ValueList
+
+
+class Hint(object):
+
+    """A hint given to the database driver: objects of the table 'table_name' whose attribute
+    'attribute' is equal to 'value'."""
+
+    def __init__(self, table_name, attribute, value):
+        self.table_name = table_name
+        self.attribute = attribute
+        self.value = value
+
+
+class HintCandidate(object):
+
+    """A predicate of a query that can be turned into hints, once the values of its placeholders
+    are known: the attribute 'attribute' of the table 'table_name' should be equal to one of the
+    placeholders."""
+
+    def __init__(self, table_name, attribute, placeholders):
+        self.table_name = table_name
+        self.attribute = attribute
+        self.placeholders = placeholders
+
+    def bind(self, parameters):
+        """
+        Build the hints corresponding to this candidate.
+        :param parameters: a dict that contains the values of the placeholders
+        :return: a list of Hint
+        """
+        return map(lambda x: Hint(self.table_name, self.attribute, parameters[x.name]),
+                   self.placeholders)
+
+
+def conjuncts(expression):
+    """
+    Split an expression into the expressions of its top level conjunction.
+    :param expression: an expression
+    :return: a list of expressions
+    """
+    if isinstance(expression, BooleanClause) and expression.operator == "AND":
+        result = []
+        for operand in expression.operands:
+            result += conjuncts(operand)
+        return result
+    return [expression]
+
+
+def _hint_candidate(expression):
+    if not isinstance(expression, BinaryComparison):
+        return None
+    (column, values) = (expression.left, expression.right)
+    if expression.operator == "=":
+        if isinstance(values, ColumnReference):
+            (column, values) = (values, column)
+        values = [values]
+    elif expression.operator == "IN" and isinstance(values, ValueList):
+        values = values.items
+    else:
+        return None
+    if not isinstance(column, ColumnReference):
+        return None
+    if len(values) == 0 or not all(map(lambda x: isinstance(x, Placeholder), values)):
+        return None
+    return HintCandidate(column.table, column.column, values)
+
+
+def excluded_tables(query_tree):
+    """
+    Find the tables of a query whose predicates cannot be pushed down to the database driver:
+    tables that are aliased or used several times in the query, and tables that are the optional
+    side of an outer join.
+    :param query_tree: a tree representation of the query
+    :return: a set of table names
+    """
+    result = set(query_tree.aliases.keys() + query_tree.aliases.values())
+    for model in query_tree.models:
+        if query_tree.models.count(model) > 1:
+            result.add(model)
+        if query_tree.outer_join_models and model not in query_tree.outer_join_models:
+            result.add(model)
+    return result
+
+
+def extract_hint_candidates(query_tree):
+    """
+    Find the predicates of a query that can be pushed down to the database driver. Only top level
+    conjuncts of the where clauses are considered, and only for tables that are used once in the
+    query and that are not the optional side of an outer join.
+    :param query_tree: a tree representation of the query
+    :return: a list of HintCandidate
+    """
+    excluded = excluded_tables(query_tree)
+    result = []
+    for where_clause in query_tree.where_clauses:
+        for conjunct in conjuncts(where_clause):
+            candidate = _hint_candidate(conjunct)
+            if candidate is not None and candidate.table_name not in excluded:
+                result += [candidate]
+    return result
@@ -0,0 +1,212 @@
+"""Joins module.
+
+This module contains the join executor used to build the tuples of a query: tables are joined
+with hash joins, where the hash table is built on the smaller side of the join and probed with
+the larger side. Each tuple is a dict that associates each label (table name or alias) of the
+query with an object, or with None when an outer joined table has no matching object.
+
+"""
+
+import datetime
+
+from rome.core.rows.optimizer import order_joins
+from rome.core.utils import DATE_FORMAT
+
+
+def join_key(value):
+    """
+    Compute the value used to compare two objects in a join: datetime values are compared with
+    their serialized representation.
+    :param value: the value of an attribute of an object, or a value of a query parameter
+    :return: a hashable value
+    """
+    if isinstance(value, dict):
+        return value.get("value", None)
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _attribute_value(row, label, attribute):
+    obj = row[label]
+    if obj is None:
+        return None
+    return join_key(obj.get(attribute, None))
+
+
+def hash_join(rows, objects, left, right, outer=False, condition=None):
+    """
+    Join tuples with the objects of a table.
+    :param rows: a list of tuples
+    :param objects: a list of objects of the table that is joined
+    :param left: a pair (label, attribute) that designates the joining attribute in the tuples
+    :param right: a pair (label, attribute) that designates the joining attribute of the objects
+    :param outer: a boolean which is True if tuples that do not match any object should be kept
+    (left outer join)
+    :param condition: (facultative) a function (row) -> boolean that an object must also satisfy
+    to match a tuple (the other criteria of the ON clause of an outer join)
+    :return: a list of tuples
+    """
+    (left_label, left_attribute) = left
+    (right_label, right_attribute) = right
+    if condition is None:
+        condition = lambda row: True
+    result = []
+    if len(objects) <= len(rows):
+        # Build the hash table on the objects, and probe it with the tuples
+        index = {}
+        for obj in objects:
+            key = join_key(obj.get(right_attribute, None))
+            if key is not None:
+                index.setdefault(key, []).append(obj)
+        for row in rows:
+            matched = False
+            for obj in index.get(_attribute_value(row, left_label, left_attribute), []):
+                new_row = row.copy()
+                new_row[right_label] = obj
+                if condition(new_row):
+                    result += [new_row]
+                    matched = True
+            if outer and not matched:
+                new_row = row.copy()
+                new_row[right_label] = None
+                result += [new_row]
+    else:
+        # Build the hash table on the tuples, and probe it with the objects
+        index = {}
+        for (position, row) in enumerate(rows):
+            key = _attribute_value(row, left_label, left_attribute)
+            if key is not None:
+                index.setdefault(key, []).append(position)
+        matched_positions = set()
+        for obj in objects:
+            for position in index.get(join_key(obj.get(right_attribute, None)), []):
+                new_row = rows[position].copy()
+                new_row[right_label] = obj
+                if condition(new_row):
+                    result += [new_row]
+                    matched_positions.add(position)
+        if outer:
+            for (position, row) in enumerate(rows):
+                if position not in matched_positions:
+                    new_row = row.copy()
+                    new_row[right_label] = None
+                    result += [new_row]
+    return result
+
+
+def cartesian_product(rows, label, objects, outer=False, condition=None):
+    """
+    Compute the cartesian product of tuples with the objects of a table.
+    :param rows: a list of tuples
+    :param label: the label of the table
+    :param objects: a list of objects of the table
+    :param outer: a boolean which is True if tuples that do not match any object should be kept
+    :param condition: (facultative) a function (row) -> boolean that an object must satisfy to
+    match a tuple (the criteria of the ON clause of an outer join)
+    :return: a list of tuples
+    """
+    if condition is None:
+        condition = lambda row: True
+    result = []
+    for row in rows:
+        matched = False
+        for obj in objects:
+            new_row = row.copy()
+            new_row[label] = obj
+            if condition(new_row):
+                result += [new_row]
+                matched = True
+        if outer and not matched:
+            new_row = row.copy()
+            new_row[label] = None
+            result += [new_row]
+    return result
+
+
+def join_tables(lists_results, joining_pairs, optional_labels=None, selectivities=None,
+                outer_join_conditions=None):
+    """
+    Join the objects of several tables. The order of the joins is decided by the optimizer of
+    the 'rome.core.rows.optimizer' module.
+    :param lists_results: a dict that associates each label with a list of objects
+    :param joining_pairs: a list of pairs of attributes (such as ["Authors.id", "Books.author_id"])
+    that should be equal in each tuple
+    :param optional_labels: (facultative) a list of labels that are outer joined: tuples are kept
+    when no object of these tables match
+    :param selectivities: (facultative) a dict that associates labels with the estimated
+    selectivity of their criteria (instances of SelectivityEstimate)
+    :param outer_join_conditions: (facultative) a dict that associates optional labels with pairs
+    (labels, condition), where condition is a function (row) -> boolean that the objects of the
+    optional table must satisfy to match a tuple, and labels the set of labels it involves
+    :return: a list of tuples
+    """
+    if optional_labels is None:
+        optional_labels = []
+    if outer_join_conditions is None:
+        outer_join_conditions = {}
+    for label in lists_results:
+        if label not in optional_labels and len(lists_results[label]) == 0:
+            return []
+    cardinalities = dict(map(lambda x: (x, len(lists_results[x])), lists_results))
+    (joining_pairs, labels) = order_joins(cardinalities, joining_pairs,
+                                          selectivities=selectivities,
+                                          optional_labels=optional_labels)
+
+    rows = None
+    joined_labels = []
+
+    def join_condition(label):
+        if label not in outer_join_conditions:
+            return None
+        (condition_labels, condition) = outer_join_conditions[label]
+        if not condition_labels <= set(joined_labels + [label]):
+            raise Exception("The tables of the ON clause of '%s' are not joined before it"
+                            % (label))
+        return condition
+
+    def add_label(rows, label):
+        outer = label in optional_labels
+        condition = join_condition(label)
+        if rows is None:
+            return map(lambda x: {label: x}, lists_results[label])
+        return cartesian_product(rows, label, lists_results[label], outer=outer,
+                                 condition=condition)
+
+    for joining_pair in joining_pairs:
+        (left_label, left_attribute) = joining_pair[0].strip().split(".")
+        (right_label, right_attribute) = joining_pair[1].strip().split(".")
+        if left_label not in lists_results or right_label not in lists_results:
+            return []
+        if left_label in joined_labels and right_label in joined_labels:
+            # Both tables are already joined: the pair is an additional condition
+            def match(row):
+                if row[left_label] is None or row[right_label] is None:
+                    return True
+                left_value = _attribute_value(row, left_label, left_attribute)
+                return (left_value is not None and
+                        left_value == _attribute_value(row, right_label, right_attribute))
+            rows = filter(match, rows)
+            continue
+        if right_label in joined_labels or (left_label not in joined_labels and
+                                            left_label in optional_labels and
+                                            right_label not in optional_labels):
+            (left_label, left_attribute, right_label, right_attribute) = \
+                (right_label, right_attribute, left_label, left_attribute)
+        if left_label not in joined_labels:
+            rows = add_label(rows, left_label)
+            joined_labels += [left_label]
+        rows = hash_join(rows, lists_results[right_label],
+                         (left_label, left_attribute),
+                         (right_label, right_attribute),
+                         outer=right_label in optional_labels,
+                         condition=join_condition(right_label))
+        joined_labels += [right_label]
+
+    for label in labels:
+        if label not in joined_labels:
+            rows = add_label(rows, label)
+            joined_labels += [label]
+    return rows if rows is not None else []
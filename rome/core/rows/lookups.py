@@ -0,0 +1,120 @@
+"""Lookups module.
+
+This module contains the fast path of queries that select the objects of a single table by their
+primary key, such as 'filter_by(id=x)' or 'filter(Model.id.in_(ids))': the objects are fetched
+directly with the multi-key get of the database driver, and the other criteria of the query are
+evaluated on these objects. Tables are neither scanned nor joined.
+
+"""
+
+from rome.core.rows.hints import conjuncts
+from rome.driver.database_driver import get_driver
+from rome.lang.expression import BinaryComparison, ColumnReference, Expression, Placeholder
+
+
+class KeyLookup(object):
+
+    """A query that selects the objects of the table 'table_name' whose 'id' is one of the values
+    of the placeholders 'placeholders'. The other criteria of the query, which only involve this
+    table, are evaluated with the predicate 'predicate' (an instance of Predicate, or None)."""
+
+    def __init__(self, table_name, placeholders, predicate=None):
+        self.table_name = table_name
+        self.placeholders = placeholders
+        self.predicate = predicate
+
+    def keys(self, parameters):
+        """
+        Find the keys of the objects that should be fetched.
+        :param parameters: a dict that contains the values of the placeholders of the query
+        :return: a list of distinct keys, in the order of the placeholders
+        """
+        result = []
+        known_keys = set()
+        for placeholder in self.placeholders:
+            key = parameters.get(placeholder.name, None)
+            if key is not None and key not in known_keys:
+                known_keys.add(key)
+                result += [key]
+        return result
+
+    def fetch(self, parameters):
+        """
+        Fetch the objects whose key is one of the values of the placeholders.
+        :param parameters: a dict that contains the values of the placeholders of the query
+        :return: a list of objects
+        """
+        objects = get_driver().get_many(self.table_name, self.keys(parameters))
+        return filter(lambda x: x is not None, objects)
+
+    def build_rows(self, objects, parameters, limit=None, offset=0):
+        """
+        Build the rows of the query from the fetched objects.
+        :param objects: a list of objects of the table
+        :param parameters: a dict that contains the values of the placeholders of the query
+        :param limit: (facultative) the maximum number of rows that should be returned
+        :param offset: (facultative) the number of rows that should be skipped
+        :return: a list of rows, where each row is a dict that associates the table with an object
+        """
+        if self.predicate is not None:
+            matches = self.predicate.bind(parameters)
+            objects = filter(lambda x: matches({self.table_name: x}), objects)
+        end = offset + limit if limit is not None else None
+        return map(lambda x: {self.table_name: x}, objects[offset:end])
+
+
+def _key_placeholders(expression, table_name):
+    if not isinstance(expression, BinaryComparison) or expression.operator != "=":
+        return None
+    (column, value) = (expression.left, expression.right)
+    if isinstance(value, ColumnReference):
+        (column, value) = (value, column)
+    if not isinstance(column, ColumnReference) or not isinstance(value, Placeholder):
+        return None
+    if column.table != table_name or column.column != "id":
+        return None
+    return [value]
+
+
+def extract_key_lookup(query_tree, tuples_plan):
+    """
+    Find whether a query can be answered by a key lookup: the query should only involve a single
+    table, without sub queries, aggregates or sorting, and its criteria should contain an equality
+    or an IN list on the 'id' of the table. Equalities on 'id' stay in the criteria of the table,
+    while IN lists are removed from them by the planning of semi-joins.
+    :param query_tree: a tree representation of the query
+    :param tuples_plan: the plan of the tuples building of the query (an instance of TuplesPlan)
+    :return: an instance of KeyLookup, or None if the query needs the relational engine
+    """
+    if len(query_tree.models) != 1 or len(query_tree.aliases) > 0:
+        return None
+    if len(query_tree.joining_clauses) > 0 or len(query_tree.variables) > 0:
+        return None
+    if len(query_tree.function_calls) > 0 or len(query_tree.group_by) > 0:
+        return None
+    if query_tree.having is not None or len(query_tree.order_by) > 0:
+        return None
+    if not all(map(lambda x: isinstance(x, Expression), query_tree.where_clauses)):
+        return None
+    if tuples_plan.tuple_predicate is not None:
+        return None
+    table_name = query_tree.models[0]
+    placeholders = None
+    if len(tuples_plan.semi_joins) > 0:
+        semi_join = tuples_plan.semi_joins[0]
+        if len(tuples_plan.semi_joins) > 1 or semi_join.placeholders is None:
+            return None
+        if semi_join.negated or semi_join.attribute != "id":
+            return None
+        placeholders = semi_join.placeholders
+    else:
+        for where_clause in query_tree.where_clauses:
+            for conjunct in conjuncts(where_clause):
+                placeholders = _key_placeholders(conjunct, table_name)
+                if placeholders is not None:
+                    break
+            if placeholders is not None:
+                break
+    if placeholders is None:
+        return None
+    return KeyLookup(table_name, placeholders, tuples_plan.table_predicates.get(table_name, None))
@@ -0,0 +1,167 @@
+"""Optimizer module.
+
+This module contains a small cost-based optimizer that decides in which order the tables of a
+query are joined. The number of rows of each table is estimated from its number of candidate
+objects and from the selectivity of the criteria that only involve this table; joins then start
+from the table with the smallest estimate, and each following join adds the connected table that
+has the smallest estimate.
+
+"""
+
+from rome.core.rows.hints import conjuncts
+from rome.lang.expression import (BinaryComparison, BooleanClause, ColumnReference, Expression,
+                                  Negation, ValueList)
+
+# Default selectivities of criteria, when nothing is known about the distribution of values.
+EQUALITY_SELECTIVITY = 0.1
+INEQUALITY_SELECTIVITY = 0.9
+RANGE_SELECTIVITY = 1.0 / 3
+DEFAULT_SELECTIVITY = 0.5
+
+RANGE_OPERATORS = ["<", "<=", ">", ">="]
+
+
+class SelectivityEstimate(object):
+
+    """The estimated selectivity of the criteria of a table: the fraction of the objects of the
+    table that match the criteria, and the maximum number of matching objects when it is known
+    (for instance when the criteria contain an equality on 'id')."""
+
+    def __init__(self, selectivity=1.0, max_rows=None):
+        self.selectivity = selectivity
+        self.max_rows = max_rows
+
+    def combine(self, other):
+        """
+        Combine two estimates of criteria that are both satisfied (conjunction).
+        :param other: an instance of SelectivityEstimate
+        :return: an instance of SelectivityEstimate
+        """
+        max_rows = filter(lambda x: x is not None, [self.max_rows, other.max_rows])
+        return SelectivityEstimate(self.selectivity * other.selectivity,
+                                   min(max_rows) if len(max_rows) > 0 else None)
+
+    def estimate(self, cardinality):
+        """
+        Estimate the number of objects that match the criteria.
+        :param cardinality: the number of candidate objects of the table
+        :return: a float
+        """
+        result = cardinality * self.selectivity
+        if self.max_rows is not None:
+            result = min(result, self.max_rows)
+        return result
+
+
+def _selectivity(expression):
+    if isinstance(expression, BooleanClause):
+        estimates = map(_selectivity, expression.operands)
+        if expression.operator == "AND":
+            return reduce(lambda x, y: x.combine(y), estimates)
+        selectivity = 0.0
+        for estimate in estimates:
+            selectivity = selectivity + estimate.selectivity - selectivity * estimate.selectivity
+        return SelectivityEstimate(selectivity)
+    if isinstance(expression, Negation):
+        return SelectivityEstimate(1.0 - _selectivity(expression.operand).selectivity)
+    if not isinstance(expression, BinaryComparison):
+        return SelectivityEstimate(DEFAULT_SELECTIVITY)
+    column = expression.left if isinstance(expression.left, ColumnReference) else expression.right
+    is_id = isinstance(column, ColumnReference) and column.column == "id"
+    if expression.operator in ["=", "IS"]:
+        return SelectivityEstimate(EQUALITY_SELECTIVITY, 1 if is_id else None)
+    if expression.operator == "IN":
+        if isinstance(expression.right, ValueList):
+            count = len(expression.right.items)
+            return SelectivityEstimate(min(1.0, EQUALITY_SELECTIVITY * count),
+                                       count if is_id else None)
+        return SelectivityEstimate(DEFAULT_SELECTIVITY)
+    if expression.operator in ["!=", "NOT IN", "IS NOT"]:
+        return SelectivityEstimate(INEQUALITY_SELECTIVITY)
+    if expression.operator in RANGE_OPERATORS:
+        return SelectivityEstimate(RANGE_SELECTIVITY)
+    return SelectivityEstimate(DEFAULT_SELECTIVITY)
+
+
+def estimate_selectivities(query_tree):
+    """
+    Estimate the selectivity of the criteria of each table of a query. Only the top level
+    conjuncts of the where clauses that involve a single table are considered.
+    :param query_tree: a tree representation of the query
+    :return: a dict that associates labels with instances of SelectivityEstimate
+    """
+    result = {}
+    for where_clause in query_tree.where_clauses:
+        for conjunct in conjuncts(where_clause):
+            if not isinstance(conjunct, Expression):
+                continue
+            labels = conjunct.labels()
+            if len(labels) != 1:
+                continue
+            label = list(labels)[0]
+            estimate = _selectivity(conjunct)
+            result[label] = result[label].combine(estimate) if label in result else estimate
+    return result
+
+
+def order_joins(cardinalities, joining_pairs, selectivities=None, optional_labels=None):
+    """
+    Decide in which order tables are joined.
+    :param cardinalities: a dict that associates each label with its number of candidate objects
+    :param joining_pairs: a list of pairs of attributes (such as ["Authors.id", "Books.author_id"])
+    :param selectivities: (facultative) a dict that associates labels with instances of
+    SelectivityEstimate
+    :param optional_labels: (facultative) a list of labels that are outer joined: they are never
+    used to start a join
+    :return: a tuple (ordered_pairs, ordered_labels), where ordered_pairs contains the joining
+    pairs in the order in which they should be processed, each pair starting with the attribute of
+    a table that is already joined, and ordered_labels contains all the labels sorted by estimated
+    size
+    """
+    if selectivities is None:
+        selectivities = {}
+    if optional_labels is None:
+        optional_labels = []
+
+    estimates = {}
+    for (label, cardinality) in cardinalities.iteritems():
+        estimate = selectivities.get(label, SelectivityEstimate())
+        estimates[label] = estimate.estimate(cardinality)
+
+    def size(label):
+        # Optional tables are joined after the tables they are attached to
+        return (label in optional_labels, estimates.get(label, 0), label)
+
+    ordered_labels = sorted(cardinalities.keys(), key=size)
+    remaining_pairs = map(lambda x: map(lambda y: y.strip(), x), joining_pairs)
+    ordered_pairs = []
+    joined_labels = set()
+    while len(remaining_pairs) > 0:
+        candidates = []
+        for pair in remaining_pairs:
+            (left_label, right_label) = map(lambda x: x.split(".")[0], pair)
+            if left_label in joined_labels and right_label in joined_labels:
+                # Pairs between joined tables are cheap filters: process them first
+                candidates += [((-1,), pair, pair)]
+            elif left_label in joined_labels:
+                candidates += [(size(right_label), pair, pair)]
+            elif right_label in joined_labels:
+                candidates += [(size(left_label), pair, [pair[1], pair[0]])]
+            elif len(joined_labels) == 0:
+                if size(left_label) <= size(right_label):
+                    candidates += [(size(left_label), pair, pair)]
+                else:
+                    candidates += [(size(right_label), pair, [pair[1], pair[0]])]
+        if len(candidates) == 0:
+            # The remaining pairs are not connected to the joined tables: start a new component
+            # from its smallest table.
+            pair = min(remaining_pairs,
+                       key=lambda x: min(map(lambda y: size(y.split(".")[0]), x)))
+            (left_label, right_label) = map(lambda x: x.split(".")[0], pair)
+            oriented_pair = pair if size(left_label) <= size(right_label) else [pair[1], pair[0]]
+            candidates = [(None, pair, oriented_pair)]
+        (_, pair, oriented_pair) = min(candidates, key=lambda x: x[0])
+        remaining_pairs.remove(pair)
+        ordered_pairs += [oriented_pair]
+        joined_labels |= set(map(lambda x: x.split(".")[0], pair))
+    return ordered_pairs, ordered_labels
@@ -0,0 +1,365 @@
+"""Predicates module.
+
+This module contains a compiler of the expressions of a query tree (where clauses, joining
+clauses and HAVING clauses) into Python closures, which are evaluated on tuples with the
+three-valued logic of SQL: comparisons with NULL are UNKNOWN (None), and a tuple matches a
+predicate only if the predicate is TRUE. Predicates are compiled once per query plan, and the
+values of the placeholders of the query are bound at each execution.
+
+"""
+
+import operator
+
+from rome.core.rows.hints import conjuncts
+from rome.core.rows.joins import join_key
+from rome.lang.expression import (BinaryComparison, BooleanClause, ColumnReference, Constant,
+                                  FunctionCall, Negation, Placeholder, ValueList, Variable)
+
+COMPARISON_FUNCTIONS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+NUMBER_TYPES = (int, long, float)
+
+
+def _coerce(left, right):
+    # As in SQL, a string compared with a number is converted to a number when possible
+    if isinstance(left, basestring) and isinstance(right, NUMBER_TYPES):
+        (right, left) = _coerce(right, left)
+        return left, right
+    if isinstance(left, NUMBER_TYPES) and isinstance(right, basestring):
+        try:
+            return left, float(right) if isinstance(left, float) else int(right)
+        except ValueError:
+            return unicode(left), right
+    return left, right
+
+
+def compare(function, left, right):
+    """
+    Compare two values with the semantics of SQL.
+    :param function: a comparison function (such as operator.eq)
+    :param left: a value
+    :param right: a value
+    :return: True, False, or None when one of the values is NULL
+    """
+    if left is None or right is None:
+        return None
+    (left, right) = _coerce(left, right)
+    return function(left, right)
+
+
+def _conversion(number):
+    # The function that converts strings compared with a number (see '_coerce')
+    return float if isinstance(number, float) else int
+
+
+class KeySet(object):
+
+    """The hash set of the values of an IN list or of a sub query. Values are tested with the
+    conversions of '=' comparisons (see '_coerce'): a string compared with a number is converted
+    to the type of the number, or compared with the representation of the number when it can not
+    be converted. 'x IN (a, b)' thus matches the same values as 'x = a OR x = b'."""
+
+    def __init__(self, values):
+        self.keys = set(values)
+        strings = filter(lambda x: isinstance(x, basestring), self.keys)
+        numbers = filter(lambda x: isinstance(x, NUMBER_TYPES), self.keys)
+        self.converted_strings = {}
+        self.numbers = {}
+        for conversion in [int, float]:
+            (converted, unconverted) = (set(), set())
+            for string in strings:
+                try:
+                    converted.add(conversion(string))
+                except ValueError:
+                    unconverted.add(string)
+            self.converted_strings[conversion] = (converted, unconverted)
+            kind_numbers = filter(lambda x: _conversion(x) is conversion, numbers)
+            self.numbers[conversion] = (set(kind_numbers), set(map(unicode, kind_numbers)))
+
+    def __contains__(self, value):
+        return value in self.keys
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def match(self, value):
+        """
+        Test if a value is equal to one of the keys, with the three-valued logic of SQL.
+        :param value: a value
+        :return: True, False, or None when the value is NULL or when NULL is one of the keys
+        """
+        if value is None:
+            return None
+        if value in self.keys:
+            return True
+        if isinstance(value, NUMBER_TYPES):
+            (converted, unconverted) = self.converted_strings[_conversion(value)]
+            if value in converted or unicode(value) in unconverted:
+                return True
+        elif isinstance(value, basestring):
+            for conversion in [int, float]:
+                (numbers, representations) = self.numbers[conversion]
+                if len(numbers) == 0:
+                    continue
+                try:
+                    if conversion(value) in numbers:
+                        return True
+                except ValueError:
+                    if value in representations:
+                        return True
+        return None if None in self.keys else False
+
+
+def compile_operand(operand):
+    """
+    Compile an operand of a comparison.
+    :param operand: an expression
+    :return: a function (row, environment) -> value
+    """
+    if isinstance(operand, ColumnReference):
+        (label, column) = (operand.table, operand.column)
+
+        def column_value(row, environment):
+            obj = row.get(label, None)
+            return join_key(obj.get(column, None)) if obj is not None else None
+        return column_value
+    if isinstance(operand, Placeholder):
+        name = operand.name
+        return lambda row, environment: join_key(environment["parameters"].get(name, None))
+    if isinstance(operand, Constant):
+        value = join_key(operand.value)
+        return lambda row, environment: value
+    if isinstance(operand, Variable):
+        name = operand.name
+
+        def variable_value(row, environment):
+            value = environment["variables"].get(name, None)
+            if isinstance(value, list):
+                value = value[0] if len(value) > 0 else None
+            return join_key(value)
+        return variable_value
+    if isinstance(operand, FunctionCall):
+        key = str(operand)
+        return lambda row, environment: join_key(row.get(key, None))
+    return compile_expression(operand)
+
+
+def _compile_keys(expression):
+    # Compile the right operand of an IN operator into a function that returns a set of keys.
+    # Sets that do not depend on the row are built once per execution.
+    right = expression.right
+    if isinstance(right, Variable):
+        name = right.name
+
+        def variable_keys(row, environment):
+            cache = environment["cache"]
+            if name not in cache:
+                values = environment["variables"].get(name, [])
+                if not isinstance(values, list):
+                    values = [values]
+                cache[name] = KeySet(map(join_key, values))
+            return cache[name]
+        return variable_keys
+    if not isinstance(right, ValueList):
+        raise Exception("Unsupported operand '%s' for the IN operator" % (right))
+    items = map(compile_operand, right.items)
+    if all(map(lambda x: isinstance(x, (Placeholder, Constant)), right.items)):
+        key = id(expression)
+
+        def constant_keys(row, environment):
+            cache = environment["cache"]
+            if key not in cache:
+                cache[key] = KeySet(map(lambda x: x(row, environment), items))
+            return cache[key]
+        return constant_keys
+    return lambda row, environment: KeySet(map(lambda x: x(row, environment), items))
+
+
+def compile_comparison(expression):
+    left = compile_operand(expression.left)
+    if expression.operator in ["IN", "NOT IN"]:
+        keys = _compile_keys(expression)
+        negated = expression.operator == "NOT IN"
+
+        def membership(row, environment):
+            result = keys(row, environment).match(left(row, environment))
+            return result if result is None else result != negated
+        return membership
+    right = compile_operand(expression.right)
+    if expression.operator in ["IS", "IS NOT"]:
+        expected = expression.operator == "IS"
+
+        def identity(row, environment):
+            (left_value, right_value) = (left(row, environment), right(row, environment))
+            if right_value is None or left_value is None:
+                return (left_value is right_value) == expected
+            return (left_value == right_value) == expected
+        return identity
+    function = COMPARISON_FUNCTIONS[expression.operator]
+    return lambda row, environment: compare(function, left(row, environment),
+                                            right(row, environment))
+
+
+def compile_expression(expression):
+    """
+    Compile a boolean expression.
+    :param expression: an expression
+    :return: a function (row, environment) -> True, False or None
+    """
+    if isinstance(expression, BooleanClause):
+        operands = map(compile_expression, expression.operands)
+        (absorbing, neutral) = (False, True) if expression.operator == "AND" else (True, False)
+
+        def boolean_clause(row, environment):
+            unknown = False
+            for operand in operands:
+                result = operand(row, environment)
+                if result is None:
+                    unknown = True
+                elif result == absorbing:
+                    return absorbing
+            return None if unknown else neutral
+        return boolean_clause
+    if isinstance(expression, Negation):
+        operand = compile_expression(expression.operand)
+
+        def negation(row, environment):
+            result = operand(row, environment)
+            return None if result is None else not result
+        return negation
+    if isinstance(expression, BinaryComparison):
+        return compile_comparison(expression)
+    if isinstance(expression, Constant):
+        value = expression.value
+        return lambda row, environment: None if value is None else bool(value)
+    raise Exception("Unsupported expression '%s'" % (expression))
+
+
+class Predicate(object):
+
+    """A compiled boolean expression. A row is a dict that associates labels with objects (and
+    the keys of aggregates with their values when HAVING clauses are evaluated)."""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.labels = expression.labels()
+        self.evaluate = compile_expression(expression)
+
+    def bind(self, parameters=None, variables=None):
+        """
+        Bind the values of the query in the predicate.
+        :param parameters: a dict that contains the values of the placeholders of the query
+        :param variables: a dict that contains the values returned by sub queries
+        :return: a function (row) -> boolean which is True when the row matches the predicate
+        """
+        environment = {
+            "parameters": parameters if parameters is not None else {},
+            "variables": variables if variables is not None else {},
+            "cache": {},
+        }
+        evaluate = self.evaluate
+        return lambda row: evaluate(row, environment) is True
+
+
+def conjunction(expressions):
+    """
+    Build the predicate of the conjunction of several expressions.
+    :param expressions: a list of expressions
+    :return: an instance of Predicate, or None if the list is empty
+    """
+    if len(expressions) == 0:
+        return None
+    if len(expressions) == 1:
+        return Predicate(expressions[0])
+    return Predicate(BooleanClause("AND", expressions))
+
+
+def _joining_pair(expression):
+    if not isinstance(expression, BinaryComparison) or expression.operator != "=":
+        return None
+    (left, right) = (expression.left, expression.right)
+    if not isinstance(left, ColumnReference) or not isinstance(right, ColumnReference):
+        return None
+    if left.table == right.table:
+        return None
+    return sorted(["%s.%s" % (left.table, left.column), "%s.%s" % (right.table, right.column)])
+
+
+def plan_predicates(query_tree, where_clauses):
+    """
+    Split the criteria of a query into joining pairs, which are executed by the join executor,
+    predicates that only involve a single table, which are evaluated on the objects of the table
+    before they are joined, and predicates that are evaluated on the joined tuples. Criteria on
+    the optional side of an outer join are evaluated on the joined tuples, except the criteria of
+    the ON clause of the outer join: the criteria that only involve the optional table restrict
+    its objects, and the other criteria are part of the matching of the outer join, so that
+    tuples that do not satisfy them are kept with NULL values for the optional table.
+    :param query_tree: a tree representation of the query
+    :param where_clauses: the where clauses of the query (expressions)
+    :return: a tuple (joining_pairs, table_predicates, tuple_predicate, outer_join_predicates),
+    where table_predicates is a dict that associates labels with instances of Predicate,
+    tuple_predicate is an instance of Predicate or None, and outer_join_predicates is a dict that
+    associates optional labels with instances of Predicate
+    """
+    optional_labels = set()
+    if len(query_tree.outer_join_models) > 0:
+        labels = query_tree.models + query_tree.aliases.keys()
+        optional_labels = set(filter(lambda x: x not in query_tree.outer_join_models, labels))
+
+    joining_pairs = []
+    table_conjuncts = {}
+    tuple_conjuncts = []
+    outer_join_conjuncts = {}
+
+    def add_conjunct(conjunct):
+        labels = conjunct.labels()
+        if len(labels) == 1 and len(labels & optional_labels) == 0:
+            table_conjuncts.setdefault(list(labels)[0], []).append(conjunct)
+        else:
+            tuple_conjuncts.append(conjunct)
+
+    for where_clause in where_clauses:
+        for conjunct in conjuncts(where_clause):
+            pair = _joining_pair(conjunct)
+            if pair is not None and len(conjunct.labels() & optional_labels) == 0:
+                if pair not in joining_pairs:
+                    joining_pairs.append(pair)
+                continue
+            add_conjunct(conjunct)
+    for joining_clause in query_tree.joining_clauses:
+        for conjunct in conjuncts(joining_clause):
+            if _joining_pair(conjunct) is not None:
+                # Joining pairs of ON clauses are extracted with the joining clauses
+                continue
+            labels = conjunct.labels()
+            if len(optional_labels) == 0:
+                add_conjunct(conjunct)
+            elif len(labels) == 1 and labels <= optional_labels:
+                # Criteria of an ON clause that restrict the outer joined table
+                table_conjuncts.setdefault(list(labels)[0], []).append(conjunct)
+            elif len(optional_labels) == 1:
+                # Other criteria of the ON clause decide which objects of the outer joined table
+                # match a tuple
+                outer_join_conjuncts.setdefault(list(optional_labels)[0], []).append(conjunct)
+            else:
+                # The ON clause of each criterion is not known when several tables are outer
+                # joined
+                raise Exception("Unsupported criterion '%s' in the ON clause of an outer join"
+                                % (conjunct))
+    table_predicates = {}
+    for (label, expressions) in table_conjuncts.iteritems():
+        table_predicates[label] = conjunction(expressions)
+    outer_join_predicates = {}
+    for (label, expressions) in outer_join_conjuncts.iteritems():
+        outer_join_predicates[label] = conjunction(expressions)
+    return joining_pairs, table_predicates, conjunction(tuple_conjuncts), outer_join_predicates
@@ -2,8 +2,10 @@ import logging
 import uuid
 import json
 
-from rome.core.utils import get_objects, current_milli_time
+from rome.core.utils import get_objects, get_populated_secondary_indexes, get_table_versions, \
+    current_milli_time
 from rome.core.rows.tuples import sql_panda_building_tuples as join_building_tuples
+from rome.driver.result_cache import get_result_cache
 
 FILE_LOGGER_ENABLED = False
 try:
@@ -33,11 +35,51 @@ def has_attribute(obj, key):
         return hasattr(obj, key)
 
 
+def filter_deleted_objects(objects, read_deleted):
+    """
+    Filter the objects that have been soft deleted.
+    :param objects: a list of python objects (dictionary representation)
+    :param read_deleted: a string. Value can be "yes", "no" and "only". Specify
+    if deleted items should be kept
+    :return: a list of python objects
+    """
+    if read_deleted == "no":
+        return filter(lambda o: not ("deleted" in o and o["deleted"] == o["id"]), objects)
+    elif read_deleted == "only":
+        return filter(lambda o: not ("deleted" in o and o["deleted"] != o["id"]), objects)
+    return objects
+
+
+def get_cached_objects(table_name, hints, version):
+    """
+    Get the objects of a table that match hints, from the result cache when it is enabled for the
+    table and the table has not been modified.
+    :param table_name: a table name
+    :param hints: a list of tuples (attribute, value)
+    :param version: the version number of the table read before calling this function, or None
+    :return: a list of python objects (dictionary representation)
+    """
+    result_cache = get_result_cache()
+    if version is None or not result_cache.is_enabled([table_name]):
+        return get_objects(table_name, hints=hints)
+    key = ("objects", table_name, tuple(hints))
+    versions = {table_name: version}
+    objects = result_cache.get(key, versions)
+    if objects is None:
+        objects = get_objects(table_name, hints=hints)
+        result_cache.put(key, versions, objects)
+    return objects
+
+
 def construct_rows(query_tree,
                    entity_class_registry,
                    request_uuid=None,
                    read_deleted=True,
-                   subqueries_variables=None):
+                   subqueries_variables=None,
+                   plan=None,
+                   parameters=None,
+                   limit=None,
+                   offset=0):
     """
     This function constructs the rows that corresponds to the current orm.
     :param query_tree: a tree representation of the query
@@ -47,17 +89,59 @@ def construct_rows(query_tree,
     if deleted items should be included in the results of the query
     :param subqueries_variables: a dict that contains variables whose values
     have been set in sub queries.
+    :param plan: (facultative) an instance of QueryPlan computed for the query
+    :param parameters: (facultative) a dict that contains the values of the placeholders of the
+    plan
+    :param limit: (facultative) the maximum number of rows that should be constructed
+    :param offset: (facultative) the number of rows that should be skipped
     :return: a list of rows
     """
 
     if subqueries_variables is None:
         subqueries_variables = {}
+    if parameters is None:
+        parameters = {}
+
+    # The version numbers of the tables are read before their objects: cached results and frames
+    # are never associated with versions more recent than their content
+    result_cache = get_result_cache()
+    table_names = sorted(set(query_tree.models))
+    cached_table_names = filter(lambda x: result_cache.is_enabled([x]), table_names)
+    versions = {}
+    if plan is not None and (len(cached_table_names) > 0 or plan.tuples_plan.uses_pandas()):
+        versions = get_table_versions(table_names)
+
+    # The rows of queries whose tables have not been modified are reused. The rows of queries
+    # that have sub queries are not cached, but the objects of their tables may be.
+    rows_key = None
+    if plan is not None and len(subqueries_variables) == 0 and \
+            len(cached_table_names) == len(table_names):
+        rows_key = ("rows", query_tree.signature(), repr(sorted(parameters.items())),
+                    read_deleted, limit, offset)
+        cached_rows = result_cache.get(rows_key, versions)
+        if cached_rows is not None:
+            return list(cached_rows)
+
+    # Queries that select objects by their primary key are answered by the database driver
+    if plan is not None and plan.key_lookup is not None:
+        objects = filter_deleted_objects(plan.key_lookup.fetch(parameters), read_deleted)
+        rows = plan.key_lookup.build_rows(objects, parameters, limit=limit, offset=offset)
+        if rows_key is not None:
+            result_cache.put(rows_key, versions, list(rows))
+        return rows
 
     # Find the SQLAlchemy model classes
     models = map(lambda x: entity_class_registry[x], query_tree.models)
     criteria = query_tree.where_clauses
     joining_criteria = query_tree.joining_clauses
     hints = []
+    if plan is not None:
+        for candidate in plan.hint_candidates:
+            hints += candidate.bind(parameters)
+        # The values of sub queries executed as semi-joins are also pushed down
+        for semi_join in plan.tuples_plan.semi_joins:
+            values = semi_join.values(subqueries_variables, parameters)
+            hints += semi_join.hints(semi_join.keys(values))
 
     metadata = {}
     part1_start_time = current_milli_time()
@@ -92,36 +176,58 @@ def construct_rows(query_tree,
 
     # Loading objects (from database)
     list_results = {}
+    table_versions = {}
     for selectable in model_set:
         table_name = selectable.__table__.name
-        # authorized_secondary_indexes = get_attribute(selectable._model, "_secondary_indexes", [])
-        authorized_secondary_indexes = []
+        version = versions.get(table_name, None)
+        if plan is not None and plan.tuples_plan.uses_pandas():
+            table_versions[table_name] = (table_name, version)
+        authorized_secondary_indexes = get_populated_secondary_indexes(
+            table_name, getattr(selectable, "_secondary_indexes", []))
         selected_hints = filter(lambda x: x.table_name == table_name and
                                 (x.attribute == "id" or
                                  x.attribute in authorized_secondary_indexes),
                                 hints)
+        # Hints are combined as a union by drivers: use the hints of a single attribute, and
+        # prefer the hints on 'id'.
+        selected_hints = sorted(selected_hints, key=lambda x: x.attribute != "id")
+        selected_hints = filter(lambda x: x.attribute == selected_hints[0].attribute,
+                                selected_hints)
         reduced_hints = map(lambda x: (x.attribute, x.value), selected_hints)
-        objects = get_objects(table_name, hints=reduced_hints)
-        # Filter soft_deleted objects
-        if read_deleted == "no":
-            objects = filter(lambda o: not ("deleted" in o and o["deleted"] == o["id"]), objects)
-        elif read_deleted == "only":
-            objects = filter(lambda o: not ("deleted" in o and o["deleted"] != o["id"]), objects)
-
-
-        list_results[table_name] = objects
+        # Tables stored by columns are filtered before their objects are built, unless the objects
+        # are shared with an alias of the table, or are read from the result cache
+        column_filter = None
+        if plan is not None and len(reduced_hints) == 0 and \
+                table_name not in query_tree.aliases.values() and \
+                (version is None or table_name not in cached_table_names):
+            column_filter = plan.tuples_plan.column_filters.get(table_name, None)
+        if column_filter is not None:
+            objects = get_objects(table_name, column_filter=column_filter.bind(parameters))
+        else:
+            objects = get_cached_objects(table_name, reduced_hints, version)
+        list_results[table_name] = filter_deleted_objects(objects, read_deleted)
     part3_start_time = current_milli_time()
 
     # Handling aliases
     for k in query_tree.aliases:
         list_results[k] = list_results[query_tree.aliases[k]]
+        if query_tree.aliases[k] in table_versions:
+            table_versions[k] = table_versions[query_tree.aliases[k]]
 
     # Building tuples
     building_tuples = join_building_tuples
+    tuples_plan = plan.tuples_plan if plan is not None else None
+    tuples_parameters = plan.render_parameters(parameters) if plan is not None else None
     tuples = building_tuples(query_tree,
                              list_results,
                              metadata=metadata,
-                             subqueries_variables=subqueries_variables)
+                             subqueries_variables=subqueries_variables,
+                             plan=tuples_plan,
+                             parameters=tuples_parameters,
+                             limit=limit,
+                             offset=offset,
+                             parameter_values=parameters,
+                             table_versions=table_versions)
     part4_start_time = current_milli_time()
 
     # Filtering tuples (cartesian product)
@@ -133,14 +239,11 @@ def construct_rows(query_tree,
     # Reordering tuples (+ selecting attributes)
     part6_start_time = current_milli_time()
 
-    if "sql" in metadata:
-        sql_information = metadata["sql"]
-    else:
-        sql_information = {
-            "models": str(models),
-            "criteria": str(criteria),
-            "joining_criteria": str(joining_criteria)
-        }
+    sql_information = {
+        "models": str(models),
+        "criteria": str(criteria),
+        "joining_criteria": str(joining_criteria)
+    }
 
     query_information = {
         "building_query": part2_start_time - part1_start_time,
@@ -158,4 +261,6 @@ def construct_rows(query_tree,
     if FILE_LOGGER_ENABLED:
         FILE_LOGGER.info(json_query_information)
 
+    if rows_key is not None:
+        result_cache.put(rows_key, versions, list(rows))
     return rows
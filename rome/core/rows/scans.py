@@ -0,0 +1,106 @@
+"""Scans module.
+
+This module contains the streaming execution of queries that select the objects of a single table,
+used when a query is iterated with 'yield_per': the table is read by batches with the scan of the
+database driver, and each batch is filtered with the criteria of the query before the next one is
+read. The table is never held in memory as a whole, and the first rows are returned before the
+table has been read entirely.
+
+"""
+
+from rome.core.rows.rows import filter_deleted_objects
+from rome.core.utils import get_populated_secondary_indexes
+from rome.driver.database_driver import get_driver
+from rome.lang.expression import Expression
+
+
+class TableScan(object):
+
+    """A query that selects objects of the table 'table_name' by scanning it. The criteria of the
+    query, which only involve this table, are evaluated with the predicate 'predicate' (an instance
+    of Predicate, or None). 'hint_attributes' contains the attributes of the criteria that could be
+    looked up in a secondary index."""
+
+    def __init__(self, table_name, predicate=None, hint_attributes=None):
+        if hint_attributes is None:
+            hint_attributes = []
+        self.table_name = table_name
+        self.predicate = predicate
+        self.hint_attributes = hint_attributes
+
+    def uses_secondary_indexes(self, entity_class):
+        """
+        Check if the objects selected by the query can be read with the secondary indexes of the
+        table, instead of scanning it.
+        :param entity_class: the entity class of the table
+        :return: a boolean
+        """
+        authorized_secondary_indexes = get_populated_secondary_indexes(
+            self.table_name, getattr(entity_class, "_secondary_indexes", []))
+        return any(map(lambda x: x == "id" or x in authorized_secondary_indexes,
+                       self.hint_attributes))
+
+    def stream_rows(self, parameters, batch_size, read_deleted="no", limit=None, offset=0):
+        """
+        Read the table by batches, and build the rows of the query.
+        :param parameters: a dict that contains the values of the placeholders of the query
+        :param batch_size: the number of objects that should be read at once, which is also the
+        number of rows of each batch (except the last one)
+        :param read_deleted: a string. Value can be "yes", "no" and "only". Specify if deleted
+        items should be included in the rows
+        :param limit: (facultative) the maximum number of rows that should be returned
+        :param offset: (facultative) the number of rows that should be skipped
+        :return: a generator of lists of rows, where each row is a dict that associates the table
+        with an object
+        """
+        matches = self.predicate.bind(parameters) if self.predicate is not None else None
+        remaining_offset = offset
+        remaining_limit = limit
+        pending_rows = []
+        for objects in get_driver().scan(self.table_name, batch_size):
+            objects = filter_deleted_objects(objects, read_deleted)
+            if matches is not None:
+                objects = filter(lambda x: matches({self.table_name: x}), objects)
+            if remaining_offset > 0:
+                skipped = min(remaining_offset, len(objects))
+                objects = objects[skipped:]
+                remaining_offset -= skipped
+            if remaining_limit is not None:
+                objects = objects[:remaining_limit]
+                remaining_limit -= len(objects)
+            pending_rows += map(lambda x: {self.table_name: x}, objects)
+            while len(pending_rows) >= batch_size:
+                yield pending_rows[:batch_size]
+                pending_rows = pending_rows[batch_size:]
+            if remaining_limit == 0:
+                break
+        if len(pending_rows) > 0:
+            yield pending_rows
+
+
+def extract_table_scan(query_tree, tuples_plan, hint_candidates):
+    """
+    Find whether a query can be executed by scanning a single table: the query should only involve
+    this table, without sub queries, semi-joins, aggregates or sorting, and its criteria should be
+    compiled into a predicate on the table.
+    :param query_tree: a tree representation of the query
+    :param tuples_plan: the plan of the tuples building of the query (an instance of TuplesPlan)
+    :param hint_candidates: a list of HintCandidate, extracted from the criteria of the query
+    :return: an instance of TableScan, or None if the query needs the relational engine
+    """
+    if len(query_tree.models) != 1 or len(query_tree.aliases) > 0:
+        return None
+    if len(query_tree.joining_clauses) > 0 or len(query_tree.variables) > 0:
+        return None
+    if len(query_tree.function_calls) > 0 or len(query_tree.group_by) > 0:
+        return None
+    if query_tree.having is not None or len(query_tree.order_by) > 0:
+        return None
+    if not all(map(lambda x: isinstance(x, Expression), query_tree.where_clauses)):
+        return None
+    if tuples_plan.tuple_predicate is not None or len(tuples_plan.semi_joins) > 0:
+        return None
+    table_name = query_tree.models[0]
+    hint_attributes = list(set(map(lambda x: x.attribute, hint_candidates)))
+    return TableScan(table_name, tuples_plan.table_predicates.get(table_name, None),
+                     hint_attributes)
@@ -0,0 +1,140 @@
+"""Semi-joins module.
+
+This module contains the execution of 'x IN (SELECT ...)' predicates as semi-joins: the sub
+query is executed once and its values are stored in a hash set, that is probed with the value of
+'x' of each candidate object, before tables are joined. When 'x' is the 'id' (or a secondary
+index) of a table, the values of the sub query are also pushed down to the database driver as
+hints. 'x NOT IN (SELECT ...)' predicates are executed as anti-joins.
+
+'x IN (:p1, :p2, ...)' predicates are executed in the same way, with a hash set of the values
+of the parameters, so that their cost is linear in the number of values.
+
+"""
+
+from rome.core.rows.hints import Hint, conjuncts, excluded_tables
+from rome.core.rows.joins import join_key
+from rome.core.rows.predicates import KeySet
+from rome.lang.expression import (BinaryComparison, BooleanClause, ColumnReference, Placeholder,
+                                  ValueList, Variable)
+
+
+class SemiJoin(object):
+
+    """A top level predicate of a query that compares the attribute 'attribute' of the objects
+    of the table (or alias) 'table_name' with the values of the sub query 'variable', or with the
+    values of a list of placeholders."""
+
+    def __init__(self, table_name, attribute, variable=None, negated=False, pushdown=False,
+                 placeholders=None):
+        self.table_name = table_name
+        self.attribute = attribute
+        self.variable = variable
+        self.negated = negated
+        self.pushdown = pushdown
+        self.placeholders = placeholders
+
+    def values(self, subqueries_variables, parameters):
+        """
+        Find the values compared with the attribute.
+        :param subqueries_variables: a dict that contains the values returned by sub queries
+        :param parameters: a dict that contains the values of the placeholders of the query
+        :return: a list of values
+        """
+        if self.placeholders is not None:
+            return map(lambda x: parameters.get(x.name, None), self.placeholders)
+        values = subqueries_variables.get(self.variable, [])
+        if not isinstance(values, list):
+            values = [values]
+        return values
+
+    def keys(self, values):
+        """
+        Build the hash set of the values compared with the attribute.
+        :param values: a list of values
+        :return: an instance of KeySet
+        """
+        return KeySet(map(join_key, values))
+
+    def probe(self, objects, keys):
+        """
+        Keep the objects that match the predicate, with the semantics of SQL for NULL values.
+        :param objects: a list of objects of the table
+        :param keys: the hash set of the values of the sub query
+        :return: a list of objects
+        """
+        if self.negated:
+            if len(keys) == 0:
+                return objects
+            if None in keys:
+                return []
+
+        def match(obj):
+            result = keys.match(join_key(obj.get(self.attribute, None)))
+            if result is None:
+                return False
+            return result != self.negated
+        return filter(match, objects)
+
+    def hints(self, keys):
+        """
+        Build the hints given to the database driver.
+        :param keys: the hash set of the values of the sub query
+        :return: a list of Hint
+        """
+        if self.negated or not self.pushdown:
+            return []
+        return map(lambda x: Hint(self.table_name, self.attribute, x),
+                   filter(lambda x: x is not None, keys))
+
+
+def _semi_join(expression):
+    if not isinstance(expression, BinaryComparison):
+        return None
+    if expression.operator not in ["=", "IN", "NOT IN"]:
+        return None
+    (column, values) = (expression.left, expression.right)
+    if not isinstance(column, ColumnReference):
+        return None
+    negated = expression.operator == "NOT IN"
+    if isinstance(values, Variable):
+        return SemiJoin(column.table, column.column, values.name, negated=negated)
+    if isinstance(values, ValueList) and expression.operator != "=" and \
+            all(map(lambda x: isinstance(x, Placeholder), values.items)):
+        # Lists of values are pushed down to the driver by the hints module
+        return SemiJoin(column.table, column.column, negated=negated,
+                        placeholders=values.items)
+    return None
+
+
+def extract_semi_joins(query_tree):
+    """
+    Find the top level conjuncts of the where clauses of a query that can be executed as
+    semi-joins. Predicates on the optional side of an outer join are not considered.
+    :param query_tree: a tree representation of the query
+    :return: a tuple (semi_joins, remaining_where_clauses), where remaining_where_clauses contains
+    the where clauses of the query without the predicates executed as semi-joins
+    """
+    optional_labels = []
+    if len(query_tree.outer_join_models) > 0:
+        labels = query_tree.models + query_tree.aliases.keys()
+        optional_labels = filter(lambda x: x not in query_tree.outer_join_models, labels)
+    excluded = excluded_tables(query_tree)
+    semi_joins = []
+    remaining_where_clauses = []
+    for where_clause in query_tree.where_clauses:
+        remaining_conjuncts = []
+        for conjunct in conjuncts(where_clause):
+            semi_join = _semi_join(conjunct)
+            if semi_join is None or semi_join.table_name in optional_labels:
+                remaining_conjuncts += [conjunct]
+                continue
+            semi_join.pushdown = semi_join.variable is not None and \
+                semi_join.table_name not in excluded
+            semi_joins += [semi_join]
+        if len(remaining_conjuncts) == len(conjuncts(where_clause)):
+            remaining_where_clauses += [where_clause]
+        elif len(remaining_conjuncts) == 1:
+            remaining_where_clauses += remaining_conjuncts
+        elif len(remaining_conjuncts) > 1:
+            remaining_where_clauses += [BooleanClause("AND", remaining_conjuncts)]
+    return semi_joins, remaining_where_clauses
@@ -0,0 +1,73 @@
+"""Sorting module.
+
+This module contains the functions that sort the tuples of a query according to its ORDER BY
+clause. Tuples are sorted on the raw values of their objects, before any entity is built: when
+only the first rows are needed (the query has a limit), a bounded heap is used to select them
+instead of sorting every tuple. As in MySQL and SQLite, NULL values are smaller than any other
+value.
+
+"""
+
+import heapq
+
+from rome.core.rows.joins import join_key
+
+
+def _less_than(left, right):
+    if left is None:
+        return right is not None
+    if right is None:
+        return False
+    return left < right
+
+
+class SortKey(object):
+
+    """The sorting key of a tuple: the values of its sort keys, compared according to the
+    direction of each sort key."""
+
+    __slots__ = ["values", "directions"]
+
+    def __init__(self, values, directions):
+        self.values = values
+        self.directions = directions
+
+    def __lt__(self, other):
+        for (value, other_value, descending) in zip(self.values, other.values, self.directions):
+            if value == other_value:
+                continue
+            if descending:
+                return _less_than(other_value, value)
+            return _less_than(value, other_value)
+        return False
+
+    def __eq__(self, other):
+        return self.values == other.values
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+def sort_tuples(tuples, orderings, count=None):
+    """
+    Sort tuples according to the ORDER BY clause of a query.
+    :param tuples: an iterable of tuples, where each tuple is a dict that associates labels with
+    objects
+    :param orderings: a list of Ordering, whose operands are instances of ColumnReference
+    :param count: (facultative) the number of tuples that are needed: only the first 'count'
+    tuples are returned
+    :return: a sorted list of tuples
+    """
+    directions = map(lambda x: x.descending, orderings)
+    columns = map(lambda x: (x.operand.table, x.operand.column), orderings)
+
+    def key(each):
+        values = []
+        for (label, attribute) in columns:
+            obj = each.get(label, None)
+            values += [join_key(obj.get(attribute, None)) if obj is not None else None]
+        return SortKey(values, directions)
+
+    if count is not None:
+        return heapq.nsmallest(count, tuples, key=key)
+    return sorted(tuples, key=key)
@@ -1,10 +1,24 @@
 import datetime
+import itertools
 import re
-import traceback
 
 import pandas as pd
 
+from rome.core.rows.aggregates import group_tuples, having_function_calls
+from rome.core.rows.columns import build_column_filters
+from rome.core.rows.frames import build_column_frame, get_frame_cache
+from rome.core.rows.joins import join_tables
+from rome.core.rows.optimizer import estimate_selectivities
+from rome.core.rows.predicates import Predicate, plan_predicates
+from rome.core.rows.semijoins import extract_semi_joins
+from rome.core.rows.sorting import sort_tuples
 from rome.core.utils import DATE_FORMAT, datetime_to_int
+from rome.lang.expression import Expression
+from rome.lang.sql_parser import bind_parameters
+
+VALUE_PATTERN = r"""(?::[_a-zA-Z][_a-zA-Z0-9]*|-?[0-9]+(?:\.[0-9]+)?|"[^"]*")"""
+IN_LIST_PATTERN = re.compile(r"\b(not\s+)?in\s*\(\s*(%s(?:\s*,\s*%s)*)\s*\)" % (VALUE_PATTERN,
+                                                                              VALUE_PATTERN))
 
 
 def correct_boolean_int(expression_str):
@@ -39,31 +53,6 @@ def correct_expression(expression_str):
     return clean_expression
 
 
-def drop_y(data_frame):
-    """
-    Drop duplicate columns that appeared after a merge of two pandas data frames.
-    Usually these columns ends with "_y".
-    :param data_frame: a pandas data frame
-    :return: a reference to the data frame
-    """
-    to_drop = [x for x in data_frame if x.endswith('_y')]
-    result = data_frame.drop(to_drop, axis=1, inplace=True)
-    return result
-
-
-def rename_x(data_frame):
-    """
-    Rename duplicate columns that appeared after a merge of two pandas data frames.
-    Usually these columns ends with "_x"
-    :param data_frame: a pandas data frame
-    :return: a reference to the data frame
-    """
-    cols = list(data_frame.columns)
-    fixed_columns = map(lambda x: re.sub("_x$", "", x), cols)
-    data_frame.columns = fixed_columns
-    return data_frame
-
-
 def extract_joining_pairs(criterion):
     """
     Extract pairs of attributes that must be used to decide which columns
@@ -104,50 +93,95 @@ def date_value_to_int(local_value):
     return local_value
 
 
-def sql_panda_building_tuples(query_tree,
-                              lists_results,
-                              metadata=None,
-                              subqueries_variables=None):
+def literal_value(value):
     """
-    Build tuples (join operator in relational algebra).
-    :param query_tree: a tree representation of the query
-    :param lists_results: a dict containing a list of objects corresponding
-    to each entity used in the query.
-    :param metadata: a dict that contains metadata that will be used to
-    analyse how data have been joined.
-    :param subqueries_variables: a dict that contains variables whose values
-    have been set in sub queries.
-    :return: a list of rows
+    Render a value returned by a sub query as a literal of a pandas where clause.
+    :param value: a value
+    :return: a string
     """
+    if isinstance(value, basestring):
+        return "\"%s\"" % (value.replace("\"", "\\\""))
+    return "%s" % (value)
 
-    if not subqueries_variables:
-        subqueries_variables = {}
-
-    labels = lists_results.keys()
-    if metadata is None:
-        metadata = {}
 
-    # Initializing data indexes.
-    table_id_index = {}
-    table_index = {}
-    for label in labels:
-        table_id_index[label] = {}
-        table_index[label] = 1
-    for (label, k) in zip(labels, lists_results):
-        for result in lists_results[k]:
-            id_ = result["id"]
-            table_id_index[label][id_] = result
+def rewrite_in_lists(where_clause):
+    """
+    Rewrite the 'x in (v1, v2, ...)' and 'x not in (v1, v2, ...)' expressions of a pandas where
+    clause, where each value is a placeholder or a literal number or string, into
+    'x in [v1, v2, ...]': pandas evaluates them as set membership tests, even when the list
+    contains a single value.
+    :param where_clause: a pandas where clause
+    :return: a modified pandas where clause
+    """
+    def _rewrite(match):
+        return "%sin [%s]" % (match.group(1) or "", match.group(2))
+    return IN_LIST_PATTERN.sub(_rewrite, where_clause)
+
+
+class TuplesPlan(object):
+
+    """The part of the building of tuples that only depends on the shape of a query: it contains
+    the joining pairs, the columns needed by each table, the estimated selectivity of the criteria
+    of each table, and the sub queries executed as semi-joins.
+
+    The other criteria are compiled into predicates (see the 'rome.core.rows.predicates' module):
+    predicates evaluated on the objects of a single table before the join, predicates evaluated
+    while outer joined tables are joined, and a predicate evaluated on the joined tuples. Criteria
+    of queries parsed from a SQL text (queries with a construct that the compiler of the
+    'rome.lang.sqlalchemy_compiler' module rejects) are not compiled: they are rewritten as a
+    pandas expression, where literal values may still be placeholders."""
+
+    def __init__(self, joining_pairs, needed_columns, pandas_where_clause,
+                 selectivities=None, semi_joins=None, table_predicates=None,
+                 tuple_predicate=None, having_predicate=None, outer_join_predicates=None):
+        if selectivities is None:
+            selectivities = {}
+        if semi_joins is None:
+            semi_joins = []
+        if table_predicates is None:
+            table_predicates = {}
+        if outer_join_predicates is None:
+            outer_join_predicates = {}
+        self.joining_pairs = joining_pairs
+        self.needed_columns = needed_columns
+        self.pandas_where_clause = pandas_where_clause
+        self.selectivities = selectivities
+        self.semi_joins = semi_joins
+        self.table_predicates = table_predicates
+        self.tuple_predicate = tuple_predicate
+        self.having_predicate = having_predicate
+        self.outer_join_predicates = outer_join_predicates
+        # Filters of the tables stored by columns, which select their objects before they are built
+        self.column_filters = build_column_filters(table_predicates, semi_joins)
+
+    def uses_pandas(self):
+        """
+        Check if the tuples are filtered with the pandas where clause.
+        :return: a boolean
+        """
+        return self.tuple_predicate is None and self.pandas_where_clause != ""
+
+
+def build_tuples_plan(query_tree):
+    """
+    Compute the plan that will be used to build the tuples of a query.
+    :param query_tree: a tree representation of the query
+    :return: an instance of TuplesPlan
+    """
+    labels = list(set(query_tree.models + query_tree.aliases.keys()))
 
     # Collecting dependencies.
     joining_pairs = []
-    non_joining_criteria = []
     _joining_pairs_str_index = {}
     needed_columns = {}
 
+    # Predicates on sub queries that can be executed as semi-joins are not part of the criteria
+    (semi_joins, where_clauses) = extract_semi_joins(query_tree)
+
     adapted_non_pandas_criteria = []
     adapted_pandas_criteria = []
-    for criterion in query_tree.where_clauses:
-        adapted_criterion = criterion
+    for criterion in where_clauses:
+        adapted_criterion = "%s" % (criterion)
         adapted_criterion = re.sub("\\\'", "\"", adapted_criterion)
         adapted_criterion = re.sub(" = ", " == ", adapted_criterion)
         adapted_criterion = re.sub("AND", " and ", adapted_criterion)
@@ -164,7 +198,7 @@ def sql_panda_building_tuples(query_tree,
         adapted_non_pandas_criteria += [adapted_nonpanda_criterion]
 
     for criterion in query_tree.joining_clauses:
-        _joining_pairs = extract_joining_pairs(criterion)
+        _joining_pairs = extract_joining_pairs("%s" % (criterion))
 
         if len(_joining_pairs) > 0:
             _joining_pairs_str = str(sorted(_joining_pairs[0]))
@@ -172,7 +206,7 @@ def sql_panda_building_tuples(query_tree,
                 _joining_pairs_str_index[_joining_pairs_str] = 1
                 joining_pairs += _joining_pairs
 
-    # Cloning lists_results.
+    # Collecting the columns needed by each table.
     for label in labels:
         needed_columns[label] = ["id"]
     for criterion in adapted_non_pandas_criteria:
@@ -190,128 +224,10 @@ def sql_panda_building_tuples(query_tree,
             if table in needed_columns and attribute not in needed_columns[table]:
                 needed_columns[table] += [attribute]
 
-    # Preparing the query for pandasql.
-    attribute_clause = ",".join(map(lambda x: "%s.id" % (x), labels))
-    from_clause = " join ".join(labels)
-    where_join_clause = " and ".join(map(lambda x: "%s == %s" % (x[0], x[1]),
-                                         joining_pairs))
-    where_criterions_clause = " and ".join(map(lambda x: str(x),
-                                               adapted_pandas_criteria))
-
-    where_clause = "1==1 "
-    if where_join_clause != "":
-        where_clause += " and %s" % (where_join_clause)
-    if where_criterions_clause != "":
-        where_clause += " and %s" % (where_criterions_clause)
-
-    # Update where clause with variables collected in sub queries
-    for (variable_name, value) in subqueries_variables.iteritems():
-        if type(value) is list:
-            str_value = "(%s)" % (",".join(map(lambda x: "%s" % (x), value)))
-        else:
-            str_value = "%s"
-        where_join_clause = where_join_clause.replace(variable_name, str_value)
-        where_criterions_clause = where_criterions_clause.replace(variable_name, str_value)
-        where_clause = where_clause.replace(variable_name, str_value)
-
-    sql_query = "SELECT %s FROM %s WHERE %s" % (attribute_clause, from_clause,
-                                                where_clause)
-    metadata["sql"] = sql_query
-
-    # Preparing Dataframes.
-    env = {}
-    for (label, k) in zip(labels, lists_results):
-        current_dataframe_all = pd.DataFrame(data=lists_results[k])
-        if len(current_dataframe_all.columns) > 0:
-            dataframe = current_dataframe_all[needed_columns[label]]
-        else:
-            if len(query_tree.outer_join_models) > 0:
-                empty_columns = {}
-                for column in needed_columns[label]:
-                    empty_columns[column] = []
-                dataframe = pd.DataFrame(empty_columns)
-            else:
-                return []
-        dataframe.columns = map(lambda c: "%s__%s" % (label, c),
-                                needed_columns[label])
-        env[label] = dataframe
-
-    # Construct the resulting rows.
-    if len(labels) > 1 and len(filter(lambda x: len(x) == 0, lists_results)) > 0:
-        return []
-
-    result = None
-
-    if len(lists_results) > 1:
-        processed_tables = []
-
-        if len(joining_pairs) > 0:
-            # Do a join between the tables
-            for joining_pair in joining_pairs:
-                # Preparing the tables that will be joined.
-                attribute_1 = joining_pair[0].strip()
-                attribute_2 = joining_pair[1].strip()
-                tablename_1 = attribute_1.split(".")[0]
-                tablename_2 = attribute_2.split(".")[0]
-
-                if tablename_1 not in env or tablename_2 not in env:
-                    return []
-                dataframe_1 = env[tablename_1] if not tablename_1 in processed_tables else result
-                dataframe_2 = env[tablename_2] if not tablename_2 in processed_tables else result
-
-                refactored_attribute_1 = attribute_1.split(
-                    ".")[0] + "__" + attribute_1.split(".")[1]
-                refactored_attribute_2 = attribute_2.split(
-                    ".")[0] + "__" + attribute_2.split(".")[1]
-                # Join the tables.
-                try:
-                    merge_method = "outer"
-                    if len(query_tree.outer_join_models) > 0:
-                        if tablename_1 in query_tree.outer_join_models:
-                            merge_method = "left"
-                    result = pd.merge(dataframe_1, dataframe_2,
-                                      left_on=refactored_attribute_1,
-                                      right_on=refactored_attribute_2,
-                                      how=merge_method)
-                    drop_y(result)
-                    rename_x(result)
-                except KeyError:
-                    return []
-                # Update the history of processed tables.
-                processed_tables += [tablename_1, tablename_2]
-                processed_tables = list(set(processed_tables))
-        elif len(table_index.keys()) >= 2:
-            # Do a cartesian product manually
-            ids_array = []
-            for tablename in table_index.keys():
-                old_ids_array = ids_array
-                ids_array = []
-                if tablename not in env:
-                    continue
-                if len(old_ids_array) == 0:
-                    ids_array = map(
-                        lambda x: {"%s__id" % (tablename): x["id"]},
-                        lists_results[tablename])
-                else:
-                    for element in lists_results[tablename]:
-                        for row in old_ids_array:
-                            row_copy = row.copy()
-                            row_copy["%s__id" % (tablename)] = element["id"]
-                            ids_array += [row_copy]
-                processed_tables += [tablename]
-            result = pd.DataFrame(ids_array)
-
-    # Fixing none result.
-    if result is None:
-        if len(labels) == 0:
-            return []
-        result = env[labels[0]]
-
-    # Update where clause.
-    new_where_clause = where_clause
+    # Rewrite the criteria as a pandas expression: joining pairs are not part of it, as they are
+    # handled by the join executor.
+    new_where_clause = " and ".join(map(lambda x: str(x), adapted_pandas_criteria))
     new_where_clause = " ".join(new_where_clause.split())
-    # new_where_clause = new_where_clause.replace("()", "1==1")
-    new_where_clause = new_where_clause.replace("1==1 and", "")
     new_where_clause = new_where_clause.replace("is None", "== 0")
     new_where_clause = new_where_clause.replace("is not None", "!= 0")
     new_where_clause = new_where_clause.replace("IS NULL", "== 0")
@@ -319,19 +235,6 @@ def sql_panda_building_tuples(query_tree,
     new_where_clause = new_where_clause.replace("NOT", " not ")
     new_where_clause = new_where_clause.strip()
 
-    # <Quick fix for handling dates>
-    fix_date = True
-    if fix_date:
-        for column_name in result:
-            column = result[column_name]
-            if column.dtype.name == "object" and len(column) > 0:
-                column_item = column[0]
-                if type(column_item) is not dict:
-                    continue
-                if "simplify_strategy" in column_item and column_item["simplify_strategy"] == "datetime":
-                    result[column_name] = column.apply(lambda x: x["value"])
-    # </Quick fix for handling dates>
-
     for table in needed_columns:
         for attribute in needed_columns[table]:
             old_pattern = "%s.%s" % (table, attribute)
@@ -339,78 +242,256 @@ def sql_panda_building_tuples(query_tree,
             new_where_clause = new_where_clause.replace(old_pattern, new_pattern)
 
     # Handling IN operator
-    number_regexp = """[0-9]+"""
-    char_regexp = """[a-zA-Z1-9_]"""
-    variable_regexp = """%s+""" % (char_regexp)
-    string_regexp = """\"%s*\"""" % (char_regexp)
-    string_or_number_regexp = """(%s|%s)""" % (number_regexp, string_regexp)
-    regexp = """%s in \((%s)(,%s)*\)""" % (variable_regexp,
-                                           string_or_number_regexp,
-                                           string_or_number_regexp)
-    in_expression_matches = re.search(regexp, new_where_clause)
-    if in_expression_matches:
-        non_none_in_expression_match = in_expression_matches.group()
-        variable = non_none_in_expression_match.split("in")[0]
-        list_value = non_none_in_expression_match.split("in")[1]
-        values_match = re.findall(string_or_number_regexp, list_value)
-        if values_match:
-            non_none_matches = filter(lambda x: x != "", values_match)
-            equivalent_using_or = map(lambda x: "%s == %s" % (variable, x), non_none_matches)
-            equivalent_expr = "(%s)" % (" or ".join(equivalent_using_or))
-            new_where_clause = new_where_clause.replace(non_none_in_expression_match, equivalent_expr)
+    new_where_clause = rewrite_in_lists(new_where_clause)
+
+    # Compile the criteria of query trees made of expressions into predicates
+    table_predicates = {}
+    tuple_predicate = None
+    outer_join_predicates = {}
+    clauses = where_clauses + query_tree.joining_clauses
+    if all(map(lambda x: isinstance(x, Expression), clauses)):
+        (where_joining_pairs, table_predicates, tuple_predicate, outer_join_predicates) = \
+            plan_predicates(query_tree, where_clauses)
+        for pair in where_joining_pairs:
+            if str(pair) not in _joining_pairs_str_index:
+                _joining_pairs_str_index[str(pair)] = 1
+                joining_pairs += [pair]
+        new_where_clause = ""
+    having_predicate = None
+    if query_tree.having is not None:
+        having_predicate = Predicate(query_tree.having)
+
+    return TuplesPlan(joining_pairs, needed_columns, new_where_clause,
+                      selectivities=estimate_selectivities(query_tree),
+                      semi_joins=semi_joins,
+                      table_predicates=table_predicates,
+                      tuple_predicate=tuple_predicate,
+                      having_predicate=having_predicate,
+                      outer_join_predicates=outer_join_predicates)
+
+
+def filter_tuples(tuples, needed_columns, where_clause, table_versions=None):
+    """
+    Filter tuples with a pandas where clause. The columns of each label are taken from the frame
+    of its table (see the 'rome.core.rows.frames' module), which is cached when the version
+    number of the table is known.
+
+    This is the fallback of the criteria that are not compiled into predicates: criteria of
+    queries parsed from a SQL text, because the compiler of the 'rome.lang.sqlalchemy_compiler'
+    module rejects one of their constructs (such as LIKE, arithmetic, function calls or columns of
+    sub queries, in their criteria, selected columns, sort keys or group keys). It has known gaps:
+    pandas can not test NULL values in a where clause, so NULL values are replaced by 0 and
+    'IS NULL' criteria are rewritten as '== 0', and NULL and 0 are thus not distinguished; the
+    where clause is rewritten with regular expressions, which also rewrite words such as AND, OR
+    or IN in literal values written in the SQL text.
+    :param tuples: a list of tuples, where each tuple is a dict that associates labels with objects
+    :param needed_columns: a dict that contains the attributes needed by each label
+    :param where_clause: a pandas where clause
+    :param table_versions: (facultative) a dict that associates labels with tuples
+    (table_name, version), where version is the version number of the table read before its
+    objects were fetched
+    :return: a list of tuples
+    """
+    if table_versions is None:
+        table_versions = {}
+    frame_cache = get_frame_cache()
+    positions = range(len(tuples))
+    label_frames = []
+    for label in needed_columns:
+        columns = needed_columns[label]
+        label_objects = [x.get(label, None) for x in tuples]
+        present_objects = [x for x in label_objects if x is not None]
+        (table_name, version) = table_versions.get(label, (None, None))
+        if version is not None and all("id" in x for x in present_objects):
+            keys = [x["id"] if x is not None else None for x in label_objects]
+            frame = frame_cache.get_frame(table_name, version, columns, present_objects)
+        else:
+            keys = map(id, label_objects)
+            objects = dict((id(x), x) for x in present_objects)
+            frame = build_column_frame(objects.values(), columns, objects.keys())
+        # Labels that have no object in a tuple (outer joins) have NULL values
+        label_frame = frame.reindex(keys)
+        label_frame.index = positions
+        label_frame.columns = map(lambda x: "%s__%s" % (label, x), columns)
+        label_frames += [label_frame]
+    if len(label_frames) > 0:
+        dataframe = pd.concat(label_frames, axis=1)
+    else:
+        dataframe = pd.DataFrame(index=positions)
+
+    # NULL values are compared as 0 (see above)
+    dataframe = dataframe.fillna(value=0)
+    filtered_dataframe = dataframe.query(where_clause)
+    return map(lambda x: tuples[x], filtered_dataframe.index)
+
+
+def sql_panda_building_tuples(query_tree,
+                              lists_results,
+                              metadata=None,
+                              subqueries_variables=None,
+                              plan=None,
+                              parameters=None,
+                              limit=None,
+                              offset=0,
+                              parameter_values=None,
+                              table_versions=None):
+    """
+    Build tuples (join operator in relational algebra): tables are joined by the join executor of
+    the 'rome.core.rows.joins' module, and the resulting tuples are filtered with the criteria of
+    the query.
+    :param query_tree: a tree representation of the query
+    :param lists_results: a dict containing a list of objects corresponding
+    to each entity used in the query.
+    :param metadata: a dict that contains metadata that will be used to
+    analyse how data have been joined.
+    :param subqueries_variables: a dict that contains variables whose values
+    have been set in sub queries.
+    :param plan: (facultative) an instance of TuplesPlan computed for the query. When it is not
+    provided, the plan is computed from the query tree.
+    :param parameters: (facultative) a dict that contains the literal values of the placeholders
+    of the plan.
+    :param limit: (facultative) the maximum number of rows that should be returned
+    :param offset: (facultative) the number of rows that should be skipped
+    :param parameter_values: (facultative) a dict that contains the values of the placeholders
+    of the plan, used to evaluate the HAVING clause
+    :param table_versions: (facultative) a dict that associates labels with tuples
+    (table_name, version) containing the version number of their table, used to cache the frames
+    of the pandas where clause
+    :return: a list of rows
+    """
+
+    if not subqueries_variables:
+        subqueries_variables = {}
+    if plan is None:
+        plan = build_tuples_plan(query_tree)
+
+    labels = lists_results.keys()
+    if metadata is None:
+        metadata = {}
 
+    joining_pairs = plan.joining_pairs
+    needed_columns = plan.needed_columns
+
+    # Bind the values of the query in the where clause.
+    pandas_parameters = {}
+    if parameters:
+        for (name, value) in parameters.iteritems():
+            pandas_parameters[name] = value.replace("'", "\"")
+    new_where_clause = bind_parameters(plan.pandas_where_clause, pandas_parameters)
+
+    # Update where clause with variables collected in sub queries that are not executed as
+    # semi-joins: lists are evaluated by pandas as set membership tests.
+    for (variable_name, value) in subqueries_variables.iteritems():
+        if type(value) is list:
+            str_value = "[%s]" % (", ".join(map(literal_value, value)))
+        else:
+            str_value = literal_value(value)
+        new_where_clause = new_where_clause.replace(variable_name, str_value)
+
+    # Execute the semi-joins: the objects of each table are probed against the hash set of the
+    # values of the sub query or of the IN list.
+    if len(plan.semi_joins) > 0:
+        lists_results = dict(lists_results)
+        for semi_join in plan.semi_joins:
+            values = semi_join.values(subqueries_variables, parameter_values or {})
+            keys = semi_join.keys(values)
+            lists_results[semi_join.table_name] = semi_join.probe(
+                lists_results.get(semi_join.table_name, []), keys)
+
+    # Evaluate the predicates that involve a single table on its objects, before the join.
+    if len(plan.table_predicates) > 0:
+        lists_results = dict(lists_results)
+        for (label, predicate) in plan.table_predicates.iteritems():
+            matches = predicate.bind(parameter_values, subqueries_variables)
+            lists_results[label] = filter(lambda x: matches({label: x}),
+                                          lists_results.get(label, []))
+
+    # Join the tables.
+    optional_labels = []
+    if len(query_tree.outer_join_models) > 0:
+        optional_labels = filter(lambda x: x not in query_tree.outer_join_models, labels)
+    outer_join_conditions = {}
+    for (label, predicate) in plan.outer_join_predicates.iteritems():
+        outer_join_conditions[label] = (predicate.labels,
+                                        predicate.bind(parameter_values, subqueries_variables))
+    tuples = join_tables(lists_results, joining_pairs, optional_labels=optional_labels,
+                         selectivities=plan.selectivities,
+                         outer_join_conditions=outer_join_conditions)
     # Filter data according to where clause.
-    result = result.fillna(value=0)
-    filtered_result = result.query(new_where_clause) if new_where_clause != "1==1" else result
+    if plan.tuple_predicate is not None:
+        tuples = filter(plan.tuple_predicate.bind(parameter_values, subqueries_variables), tuples)
+    elif new_where_clause != "" and len(tuples) > 0:
+        tuples = filter_tuples(tuples, needed_columns, new_where_clause,
+                               table_versions=table_versions)
 
     # Filter duplicate tuples (ie "select A.x from A join B")
     selected_attributes_corrected = map(
         lambda a: a.replace("\"", "").replace(".", "__"), query_tree.attributes)
     table_in_selected_attributes = list(set(map(
         lambda x: x.split(".")[0].replace("\"", ""), query_tree.attributes)))
-    id_columns = map(lambda x: "%s__id" % (x), table_in_selected_attributes)
-
-    # Transform pandas data into dict.
-    possible_final_columns = list(set(
-        map(lambda l: "%s__id" % (l), labels)).intersection(filtered_result))
-    final_columns = list(set(possible_final_columns).intersection(id_columns))
-
-    final_tables = map(lambda x: x.split("__")[0], final_columns)
-    filtered_result = filtered_result[final_columns].drop_duplicates()
-    rows = []
-    for each in filtered_result.itertuples():
-        try:
-            row = {}
-            for (table_name, object_id) in zip(reversed(final_tables), reversed(each)):
-                row[table_name] = table_id_index[table_name][object_id]
-        except Exception:
-            traceback.print_exc()
-            pass
-        rows += [row]
-
-    # Process function calls
-    if len(query_tree.function_calls) > 0:
-        row = rows[0]
-        for attribute_index, function_name in query_tree.function_calls.iteritems(
-        ):
+    final_tables = filter(lambda x: x in table_in_selected_attributes, labels)
+
+    # Stop as soon as enough rows have been found, unless rows are aggregated.
+    needed_rows = None
+    if limit is not None and len(query_tree.function_calls) == 0 and \
+            len(query_tree.group_by) == 0:
+        needed_rows = offset + limit
+
+    def distinct_tuples():
+        known_rows = set()
+        for each in tuples:
+            row_key = tuple(map(lambda x: each[x]["id"] if each[x] is not None else None,
+                                final_tables))
+            if row_key in known_rows:
+                continue
+            known_rows.add(row_key)
+            yield each
+
+    if len(query_tree.function_calls) > 0 or len(query_tree.group_by) > 0:
+        # Tuples are grouped, and their aggregates computed, in a single pass over their raw
+        # values.
+        function_calls = []
+        for (attribute_index, function_name) in sorted(query_tree.function_calls.iteritems()):
             attribute_name = selected_attributes_corrected[attribute_index]
-            original_attribute_name = query_tree.attributes[attribute_index]
-
-            if attribute_name in filtered_result:
-                dataset = filtered_result[attribute_name]
-            else:
-                entity_target = original_attribute_name.split(".")[0]
-                attribute_target = original_attribute_name.split(".")[1]
-
-                data = map(lambda x: x[entity_target][attribute_target], rows)
-                dataset = pd.DataFrame(data=data, columns=["column"])["column"]
-
-            function = getattr(dataset, function_name)
-            value = function()
-
-            row_key = "%s(%s)" % (function_name, original_attribute_name)
-            row[row_key] = value
-        return [row]
-
-    # Reduce results
-    return rows
+            (entity_target, attribute_target) = attribute_name.split("__", 1)
+            row_key = "%s(%s)" % (function_name, query_tree.attributes[attribute_index])
+            function_calls += [(row_key, function_name, entity_target, attribute_target)]
+        if query_tree.having is not None:
+            function_calls += having_function_calls(query_tree.having)
+        having = None
+        if plan.having_predicate is not None:
+            having = plan.having_predicate.bind(parameter_values, subqueries_variables)
+        rows = []
+        for (first_tuple, values) in group_tuples(distinct_tuples(), query_tree.group_by,
+                                                  function_calls):
+            if having is not None:
+                group_row = dict(first_tuple) if first_tuple is not None else {}
+                group_row.update(values)
+                if not having(group_row):
+                    continue
+            row = {}
+            for table_name in final_tables:
+                row[table_name] = first_tuple[table_name] if first_tuple is not None else None
+            row.update(values)
+            rows += [row]
+        if len(query_tree.order_by) > 0:
+            rows = sort_tuples(rows, query_tree.order_by)
+    else:
+        # Sort tuples according to the ORDER BY clause: when a limit is set, only the first
+        # rows are kept in a bounded heap.
+        if len(query_tree.order_by) > 0:
+            selected_tuples = sort_tuples(distinct_tuples(), query_tree.order_by,
+                                          count=needed_rows)
+        else:
+            selected_tuples = itertools.islice(distinct_tuples(), needed_rows)
+        rows = []
+        for each in selected_tuples:
+            row = {}
+            for table_name in final_tables:
+                row[table_name] = each[table_name]
+            rows += [row]
+
+    # Apply the limit and the offset
+    if limit is not None:
+        return rows[offset:offset + limit]
+    return rows[offset:]
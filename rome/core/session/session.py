@@ -226,7 +226,7 @@ class Session(object):
         logging.debug("session %s committed (%s)" % (self.session_id, map(lambda x: find_an_identifier(x), self.session_objects_add)))
         for lock in self.acquired_locks:
             self.lock_manager.unlock(lock)
-            self.acquired_locks.remove(lock)
+        self.acquired_locks = []
         self.session_objects_add = []
         self.session_objects_delete = []
 
@@ -238,15 +238,17 @@ class Session(object):
         from sqlalchemy.sql.dml import Insert
         from rome.driver.database_driver import get_driver
         from utils import find_an_identifier_dict
+        from rome.utils.secondary_index_decorator import get_secondary_indexes
         if type(clause) is Insert:
             database_driver = get_driver()
+            secondary_indexes = get_secondary_indexes(clause.table.name)
             for value in params:
                 key_to_use = find_an_identifier_dict(value, clause.table.primary_key)
                 if key_to_use is None:
                     next_id = database_driver.next_key(clause.table.name)
                     key_to_use = next_id
                 value["id"] = key_to_use
-                database_driver.put(clause.table.name, key_to_use, value)
+                database_driver.put(clause.table.name, key_to_use, value, secondary_indexes)
 
     def expire(self, instance, attribute_names=None):
         pass
@@ -2,11 +2,11 @@ import logging
 
 import rome.driver.database_driver as database_driver
 from rome.core.dataformat.json import Encoder
-from rome.core.utils import LazyRelationship
+from rome.core.utils import LazyRelationship, LazyRelationshipBatch
 from sqlalchemy.orm.interfaces import ONETOMANY, MANYTOONE, MANYTOMANY
-from sqlalchemy.orm.properties import ColumnProperty, RelationshipProperty
 from oslo_db.exception import DBDeadlock
 
+from rome.core.orm.mapping import get_entity_metadata, get_mapping_registry
 from rome.core.orm.query import Query
 import functools
 import time
@@ -47,11 +47,7 @@ def get_class_registry(obj):
 
 
 def find_entity_class(tablename, class_registry):
-    for (entitity_class_name, entity_class) in class_registry.iteritems():
-        if hasattr(entity_class,
-                   "__table__") and entity_class.__table__.name == tablename:
-            return entity_class
-    return None
+    return get_mapping_registry().get_entity_classes(class_registry).get(tablename, None)
 
 
 def find_an_association_class(property_pairs, class_registry):
@@ -104,7 +100,7 @@ def find_an_identifier(obj, primary_key_components=None):
         identifier = getattr(obj, "id", None)
     else:
         if primary_key_components is None:
-            primary_key_components = obj._sa_class_manager.mapper.primary_key
+            primary_key_components = get_entity_metadata(obj.__class__).primary_key_components
         primary_key_parts = map(lambda x: "%s" % (getattr(obj, x.name)), primary_key_components)
         if None in primary_key_parts:
             return None
@@ -162,6 +158,11 @@ class ObjectAttributeRefresher(object):
         has_been_modified = False
         for left, right in attr.property.local_remote_pairs:
             attr_value = getattr(obj, attr_name, None)
+            if type(attr_value) is LazyRelationship:
+                # Relationships that have not been accessed yet are not loaded
+                if not attr_value.is_loaded:
+                    continue
+                attr_value = attr_value.data
             if attr_value is None:
                 continue
             elements = attr_value if hasattr(attr_value, "__len__") else [attr_value]
@@ -185,12 +186,8 @@ class ObjectAttributeRefresher(object):
                 right_entity = find_entity_class(right.table.name, class_registry)
                 query = self._generate_query(right_entity, right.__eq__(left_value))
                 relationship_field = LazyRelationship(query, right_entity)
-                # NOTE(badock): the following line is not lazy :-(
-                value = list(relationship_field)
-                if len(value) == 0 and len(obj.__dict__[attr_name]) == 0:
-                    continue
                 try:
-                    obj.__dict__[attr_name] = value
+                    obj.__dict__[attr_name] = relationship_field
                 except:
                     import traceback
                     traceback.print_exc()
@@ -222,7 +219,10 @@ class ObjectAttributeRefresher(object):
                     class_registry = get_class_registry(obj)
                     right_entity = find_entity_class(right.table.name, class_registry)
                     query = self._generate_query(right_entity, right.__eq__(left_value))
-                    relationship_field = LazyRelationship(query, right_entity, many=False)
+                    # When the relationship references the key of the objects, it is known
+                    primary_keys = [left_value] if right.name == "id" else None
+                    relationship_field = LazyRelationship(query, right_entity, many=False,
+                                                          primary_keys=primary_keys)
                     setattr(obj, attr_name, relationship_field)
             elif right_value is not None:
                 right_value_field_value = getattr(right_value, right.name, None)
@@ -230,78 +230,6 @@ class ObjectAttributeRefresher(object):
                     setattr(obj, left.name, right_value_field_value)
         return True
 
-    def refresh_many_to_many(self, obj, attr_name, attr):
-        """
-        Refresh a many-to-many relationship of a python object.
-        :param obj: a python object
-        :param attr_name: name of the relationship field
-        :param attr: relationship object
-        :return: a boolean which is True if the refresh worked
-        """
-        association_class = find_an_association_class(attr.property.local_remote_pairs,
-                                                      get_class_registry(obj))
-
-        if association_class is not None:
-            from rome.core.session.session import Session as RomeSession
-            association_attributes = find_associations_attributes(attr.property.local_remote_pairs)
-            tmp_session = RomeSession()
-
-            existing_associations = tmp_session.query(association_class).all()
-            for association in existing_associations:
-                pass
-
-            attribute_list = getattr(obj, attr_name)
-
-            # Prevent to load a lazy relationship by mistake
-            from rome.core.utils import LazyRelationship
-            if type(attribute_list) is LazyRelationship:
-                if not attribute_list.is_loaded:
-                    return
-
-            if len(attribute_list) == 0 and len(existing_associations) > 0:
-                # The 'attribute_list' may not have been populated: the following code will check if
-                # there are some objects (from  'existing_associations' variable) that should be
-                # inserted in the attribute_list property.
-                local_association_attribute_candidates = \
-                    filter(lambda x: x["local_table"] == obj.__table__.name, association_attributes)
-                remote_association_attribute_candidates = \
-                    filter(lambda x: x["remote"] != obj.__table__.name, association_attributes)
-                if len(local_association_attribute_candidates) == 0:
-                    return
-                local_attr = local_association_attribute_candidates[0]
-                remote_attr = remote_association_attribute_candidates[0]
-                matching_assocs = filter(lambda x:
-                                         getattr(obj, local_attr["local"])
-                                         == getattr(x, local_attr["remote"]),
-                                         existing_associations)
-
-                remote_values = map(lambda x: getattr(x, remote_attr["remote"]),
-                                    matching_assocs)
-                class_registry = get_class_registry(obj)
-                entity = find_entity_class(remote_attr["local_table"], class_registry)
-                remote_attribute = getattr(entity, remote_attr["local"])
-                query = tmp_session.query(entity).filter(remote_attribute.in_(remote_values))
-                lazy_relationship_field = LazyRelationship(query, entity)
-                obj.__dict__[attr_name] = lazy_relationship_field
-            else:
-                # The 'attribute_list' seems to have been populated correctly: will check if some
-                # association objects are not in the 'attribute_list' property.
-                for item in getattr(obj, attr_name):
-                    association_complete = True
-                    new_association = association_class()
-                    for attribute in association_attributes:
-                        target = obj if attribute["local_table"] == obj.__table__.name else item
-                        v = getattr(target, attribute["local"])
-                        if v is not None:
-                            setattr(new_association, attribute["remote"], v)
-                        else:
-                            association_complete = False
-                    if association_complete:
-                        tmp_session.add(new_association)
-
-            tmp_session.flush()
-        return True
-
     def _extract_load_and_noload_attributes(self, options):
         def _extract_attributes_from_options(options):
             attrs = []
@@ -315,42 +243,338 @@ class ObjectAttributeRefresher(object):
         no_load_attrs = _extract_attributes_from_options(no_load_options)
         return (load_attrs, no_load_attrs)
 
-    def refresh(self, obj, load_options=None):
+    def _related_objects_fetcher(self, right_entity, right, many):
         """
-        Refresh relationships objects according to foreign keys (and vice versa).
+        Build a function that fetches the objects of an entity class whose attribute 'right' has
+        one of several values, with a single query (or a single multi-key get).
+        :param right_entity: an entity class
+        :param right: the column of the entity class that is referenced by the relationship
+        :param many: a boolean which is True if several objects may have the same value
+        :return: a function that takes a list of values, and returns a dict that associates each
+        value with its objects (a list when 'many' is True, an object otherwise)
+        """
+        def fetch(values):
+            if not many and right.name == "id":
+                related_objects = Query(right_entity).get_many(values)
+            else:
+                related_objects = self._generate_query(right_entity, right.in_(values)).all()
+            result = {}
+            for related_object in related_objects:
+                value = getattr(related_object, right.name, None)
+                if many:
+                    result.setdefault(value, []).append(related_object)
+                else:
+                    result.setdefault(value, related_object)
+            return result
+        return fetch
+
+    def refresh_one_to_many_batch(self, objs, attr_name, attr, eager=False):
+        """
+        Refresh a one-to-many relationship of several python objects of the same class. The
+        related objects of all the objects are loaded with a single query, and distributed to the
+        objects according to the value of their foreign key: either immediately (eager loading),
+        or when the relationship of one of the objects is accessed for the first time.
+        :param objs: a list of python objects
+        :param attr_name: name of the relationship field
+        :param attr: relationship object
+        :param eager: a boolean which is True if the relationship should be loaded immediately
+        """
+        pairs = attr.property.local_remote_pairs
+        pending_objs = []
+        for obj in objs:
+            attr_value = getattr(obj, attr_name, None)
+            if attr_value is None or type(attr_value) is LazyRelationship:
+                self.refresh_one_to_many(obj, attr_name, attr)
+                continue
+            elements = attr_value if hasattr(attr_value, "__len__") else [attr_value]
+            if len(pairs) != 1 or len(elements) > 0:
+                # The foreign keys of the related objects may have to be updated
+                self.refresh_one_to_many(obj, attr_name, attr)
+            elif getattr(obj, pairs[0][0].name, None) is not None:
+                pending_objs += [obj]
+        if len(pending_objs) == 0:
+            return
+        (left, right) = pairs[0]
+        right_entity = find_entity_class(right.table.name, get_class_registry(pending_objs[0]))
+        fetch = self._related_objects_fetcher(right_entity, right, many=True)
+        if eager:
+            related_objects = fetch(list(set(map(lambda x: getattr(x, left.name),
+                                                 pending_objs))))
+            for obj in pending_objs:
+                value = related_objects.get(getattr(obj, left.name), [])
+                if len(value) == 0 and len(obj.__dict__[attr_name]) == 0:
+                    continue
+                obj.__dict__[attr_name] = value
+        else:
+            batch = LazyRelationshipBatch(fetch, many=True)
+            for obj in pending_objs:
+                relationship_field = LazyRelationship(None, right_entity)
+                batch.add(relationship_field, getattr(obj, left.name))
+                obj.__dict__[attr_name] = relationship_field
+
+    def refresh_many_to_one_batch(self, objs, attr_name, attr, eager=False):
+        """
+        Refresh a many-to-one relationship of several python objects of the same class. The
+        related objects of all the objects are loaded at once (with a multi-key get when the
+        relationship references their key): either immediately (eager loading), or when the
+        relationship of one of the objects is accessed for the first time.
+        :param objs: a list of python objects
+        :param attr_name: name of the relationship field
+        :param attr: relationship object
+        :param eager: a boolean which is True if the relationship should be loaded immediately
+        """
+        pairs = attr.property.local_remote_pairs
+        pending_objs = []
+        for obj in objs:
+            if len(pairs) == 1 and getattr(obj, pairs[0][0].name, None) is not None and \
+                    getattr(obj, attr_name, None) is None:
+                pending_objs += [obj]
+            else:
+                self.refresh_many_to_one(obj, attr_name, attr)
+        if len(pending_objs) == 0:
+            return
+        (left, right) = pairs[0]
+        right_entity = find_entity_class(right.table.name, get_class_registry(pending_objs[0]))
+        fetch = self._related_objects_fetcher(right_entity, right, many=False)
+        if eager:
+            related_objects = fetch(list(set(map(lambda x: getattr(x, left.name),
+                                                 pending_objs))))
+            for obj in pending_objs:
+                related_object = related_objects.get(getattr(obj, left.name), None)
+                if related_object is not None:
+                    obj.__dict__[attr_name] = related_object
+        else:
+            batch = LazyRelationshipBatch(fetch, many=False)
+            for obj in pending_objs:
+                left_value = getattr(obj, left.name)
+                # When the relationship references the key of the objects, it is known
+                primary_keys = [left_value] if right.name == "id" else None
+                relationship_field = LazyRelationship(None, right_entity, many=False,
+                                                      primary_keys=primary_keys)
+                batch.add(relationship_field, left_value)
+                setattr(obj, attr_name, relationship_field)
+
+    def _association_attributes(self, obj, attr):
+        """
+        Find how a many-to-many relationship of a python object goes through its association
+        table.
         :param obj: a python object
-        :param obj: a list of load options for relationships
-        :return: a boolean which is True if the object has been successfully refreshed
+        :param attr: relationship object
+        :return: a tuple (association_class, local_attr, remote_attr), where 'local_attr' and
+        'remote_attr' describe how the association table references respectively the table of
+        the object and the table of the related objects, or None if no association class is found
+        """
+        association_class = find_an_association_class(attr.property.local_remote_pairs,
+                                                      get_class_registry(obj))
+        if association_class is None:
+            return None
+        association_attributes = find_associations_attributes(attr.property.local_remote_pairs)
+        local_association_attribute_candidates = \
+            filter(lambda x: x["local_table"] == obj.__table__.name, association_attributes)
+        remote_association_attribute_candidates = \
+            filter(lambda x: x["local_table"] != obj.__table__.name, association_attributes)
+        if len(local_association_attribute_candidates) == 0 or \
+                len(remote_association_attribute_candidates) == 0:
+            return None
+        return (association_class, local_association_attribute_candidates[0],
+                remote_association_attribute_candidates[0])
+
+    def _associated_objects_fetcher(self, association_class, local_attr, remote_entity,
+                                    remote_attr):
+        """
+        Build a function that fetches the objects associated with several objects through an
+        association table: the associations are selected with a single query on the column that
+        references the objects (which is answered with a secondary index when the association
+        class declares one), and the associated objects with a single multi-key get (or a single
+        query when the association table does not reference their key).
+        :param association_class: the entity class of the association table
+        :param local_attr: how the association table references the objects
+        :param remote_entity: the entity class of the associated objects
+        :param remote_attr: how the association table references the associated objects
+        :return: a function that takes a list of values, and returns a dict that associates each
+        value with the list of its associated objects
+        """
+        def fetch(values):
+            association_column = getattr(association_class, local_attr["remote"])
+            associations = self._generate_query(association_class,
+                                                association_column.in_(values)).all()
+            remote_values = list(set(map(lambda x: getattr(x, remote_attr["remote"]),
+                                         associations)))
+            if len(remote_values) == 0:
+                return {}
+            if remote_attr["local"] == "id":
+                remote_objects = Query(remote_entity).get_many(remote_values)
+            else:
+                remote_column = getattr(remote_entity, remote_attr["local"])
+                remote_objects = self._generate_query(remote_entity,
+                                                      remote_column.in_(remote_values)).all()
+            remote_objects_by_value = {}
+            for remote_object in remote_objects:
+                remote_objects_by_value.setdefault(getattr(remote_object, remote_attr["local"]),
+                                                   remote_object)
+            result = {}
+            for association in associations:
+                remote_object = remote_objects_by_value.get(
+                    getattr(association, remote_attr["remote"]), None)
+                if remote_object is None:
+                    continue
+                related_objects = result.setdefault(getattr(association, local_attr["remote"]),
+                                                    [])
+                if remote_object not in related_objects:
+                    related_objects += [remote_object]
+            return result
+        return fetch
+
+    def _save_associations(self, obj, attribute_list, association_class, local_attr,
+                           remote_attr):
+        """
+        Create the association objects that are missing between a python object and the objects
+        of one of its many-to-many relationships.
+        :param obj: a python object
+        :param attribute_list: the list of objects related to 'obj'
+        :param association_class: the entity class of the association table
+        :param local_attr: how the association table references the object
+        :param remote_attr: how the association table references the related objects
+        :return: a boolean which is True if some association objects have been created
+        """
+        local_value = getattr(obj, local_attr["local"])
+        if local_value is None:
+            return False
+        association_column = getattr(association_class, local_attr["remote"])
+        existing_associations = self._generate_query(association_class,
+                                                     association_column == local_value).all()
+        existing_remote_values = set(map(lambda x: getattr(x, remote_attr["remote"]),
+                                         existing_associations))
+        new_associations = []
+        for item in attribute_list:
+            remote_value = getattr(item, remote_attr["local"])
+            if remote_value is None or remote_value in existing_remote_values:
+                continue
+            existing_remote_values.add(remote_value)
+            new_association = association_class()
+            setattr(new_association, local_attr["remote"], local_value)
+            setattr(new_association, remote_attr["remote"], remote_value)
+            new_associations += [new_association]
+        if len(new_associations) == 0:
+            return False
+        from rome.core.session.session import Session as RomeSession
+        tmp_session = RomeSession()
+        for new_association in new_associations:
+            tmp_session.add(new_association)
+        tmp_session.flush()
+        return True
+
+    def refresh_many_to_many_batch(self, objs, attr_name, attr, eager=False):
+        """
+        Refresh a many-to-many relationship of several python objects of the same class. The
+        relationships that have not been populated are loaded with a single lookup of the
+        association table for all the objects: either immediately (eager loading), or when the
+        relationship of one of the objects is accessed for the first time. Association objects
+        are created for the relationships that have been populated, when they do not exist yet.
+        :param objs: a list of python objects
+        :param attr_name: name of the relationship field
+        :param attr: relationship object
+        :param eager: a boolean which is True if the relationship should be loaded immediately
+        """
+        if len(objs) == 0:
+            return
+        association = self._association_attributes(objs[0], attr)
+        if association is None:
+            return
+        (association_class, local_attr, remote_attr) = association
+        pending_objs = []
+        for obj in objs:
+            attribute_list = getattr(obj, attr_name)
+            if type(attribute_list) is LazyRelationship:
+                # Prevent to load a lazy relationship by mistake
+                if not attribute_list.is_loaded:
+                    continue
+                attribute_list = attribute_list.data
+            if len(attribute_list) > 0:
+                self._save_associations(obj, attribute_list, association_class, local_attr,
+                                        remote_attr)
+            elif getattr(obj, local_attr["local"], None) is not None:
+                pending_objs += [obj]
+        if len(pending_objs) == 0:
+            return
+        remote_entity = find_entity_class(remote_attr["local_table"],
+                                          get_class_registry(pending_objs[0]))
+        fetch = self._associated_objects_fetcher(association_class, local_attr, remote_entity,
+                                                 remote_attr)
+        if eager:
+            related_objects = fetch(list(set(map(lambda x: getattr(x, local_attr["local"]),
+                                                 pending_objs))))
+            for obj in pending_objs:
+                value = related_objects.get(getattr(obj, local_attr["local"]), [])
+                if len(value) > 0:
+                    obj.__dict__[attr_name] = value
+        else:
+            batch = LazyRelationshipBatch(fetch, many=True)
+            for obj in pending_objs:
+                relationship_field = LazyRelationship(None, remote_entity)
+                batch.add(relationship_field, getattr(obj, local_attr["local"]))
+                obj.__dict__[attr_name] = relationship_field
+
+    def refresh_many_to_many(self, obj, attr_name, attr):
+        """
+        Refresh a many-to-many relationship of a python object.
+        :param obj: a python object
+        :param attr_name: name of the relationship field
+        :param attr: relationship object
+        :return: a boolean which is True if the refresh worked
+        """
+        self.refresh_many_to_many_batch([obj], attr_name, attr)
+        return True
+
+    def refresh_all(self, objs, load_options=None):
+        """
+        Refresh relationships objects of several python objects according to foreign keys (and
+        vice versa). Relationships are loaded with one query per relationship for all the objects
+        of a same class: relationships that are eagerly loaded (joinedload, subqueryload, ...) are
+        loaded immediately, and the other ones when one of the objects accesses the relationship
+        for the first time.
+        :param objs: a list of python objects
+        :param load_options: a list of load options for relationships
+        :return: a boolean which is True if the objects have been successfully refreshed
         """
         if load_options is None:
             load_options = []
         (load_attrs, no_load_attrs) = ([], [])
         if len(load_options) > 0:
             (load_attrs, no_load_attrs) = self._extract_load_and_noload_attributes(load_options)
-        for attr_name, attr in get_class_manager(obj).local_attrs.iteritems():
-            if type(attr.property) is RelationshipProperty:
-                if len(load_attrs) == 0 and len(no_load_attrs) == 0:
-                    pass
-                else:
-                    if attr_name in no_load_attrs:
-                        continue
-                    # if attr_name not in load_attrs:
-                    #     continue
-                if attr.property.direction is ONETOMANY:
-                    self.refresh_one_to_many(obj, attr_name, attr)
-                elif attr.property.direction is MANYTOONE:
-                    self.refresh_many_to_one(obj, attr_name, attr)
-                elif attr.property.direction is MANYTOMANY:
-                    self.refresh_many_to_many(obj, attr_name, attr)
+        objs_by_class = {}
+        for obj in objs:
+            objs_by_class.setdefault(obj.__class__, []).append(obj)
+        for (_class, class_objs) in objs_by_class.iteritems():
+            for relationship in get_entity_metadata(_class).relationships:
+                (attr_name, attr) = (relationship.name, relationship.attribute)
+                if attr_name in no_load_attrs:
+                    continue
+                eager = attr_name in load_attrs
+                if relationship.direction is ONETOMANY:
+                    self.refresh_one_to_many_batch(class_objs, attr_name, attr, eager=eager)
+                elif relationship.direction is MANYTOONE:
+                    self.refresh_many_to_one_batch(class_objs, attr_name, attr, eager=eager)
+                elif relationship.direction is MANYTOMANY:
+                    self.refresh_many_to_many_batch(class_objs, attr_name, attr, eager=eager)
                 else:
                     logging.error(
                         "Could not understand how to refresh the property '%s' of %s"
-                        % (attr, obj))
+                        % (attr, _class))
                     raise Exception(
                         "Could not understand how to refresh the property '%s' of %s"
-                        % (attr, obj))
+                        % (attr, _class))
         return True
 
+    def refresh(self, obj, load_options=None):
+        """
+        Refresh relationships objects according to foreign keys (and vice versa).
+        :param obj: a python object
+        :param obj: a list of load options for relationships
+        :return: a boolean which is True if the object has been successfully refreshed
+        """
+        return self.refresh_all([obj], load_options=load_options)
+
 
 class ObjectExtractor(object):
 
@@ -362,14 +586,9 @@ class ObjectExtractor(object):
         """
         json_encoder = Encoder()
         result = {}
-        for attr_name, attr in get_class_manager(obj).local_attrs.iteritems():
-            if type(attr.property) is ColumnProperty:
-                attr_encoded_value = json_encoder.encode(getattr(obj, attr_name,
-                                                                 None))
-                result[attr_name] = attr_encoded_value
-            elif type(attr.property) is RelationshipProperty:
-                logging.info(
-                    "Processing of RelationshipProperty is not yet implemented")
+        for attr_name in get_entity_metadata(obj.__class__).column_attributes:
+            attr_encoded_value = json_encoder.encode(getattr(obj, attr_name, None))
+            result[attr_name] = attr_encoded_value
         return result
 
 
@@ -387,6 +606,12 @@ class ObjectSaver(object):
         extractor = ObjectExtractor()
         attribute_refresher = ObjectAttributeRefresher()
 
+        # As in a SQL database, columns that have never been set take their default value
+        for column in get_entity_metadata(obj.__class__).columns:
+            if column.default is not None and column.default.is_scalar and \
+                    column.key not in obj.__dict__:
+                setattr(obj, column.key, column.default.arg)
+
         attribute_refresher.refresh(obj)
         obj_as_dict = extractor.extract(obj)
 
@@ -400,7 +625,8 @@ class ObjectSaver(object):
         obj_as_dict["id"] = key_to_use
 
         db_driver = database_driver.get_driver()
-        db_driver.put(tablename, key_to_use, obj_as_dict, [])
+        secondary_indexes = getattr(obj, "_secondary_indexes", [])
+        db_driver.put(tablename, key_to_use, obj_as_dict, secondary_indexes)
         db_driver.add_key(tablename, key_to_use)
 
         # Set the ID of the obj parameters
@@ -432,6 +658,7 @@ class ObjectSaver(object):
         obj_as_dict["id"] = key_to_use
 
         db_driver = database_driver.get_driver()
-        db_driver.remove_key(tablename, obj_as_dict["id"])
+        secondary_indexes = getattr(obj, "_secondary_indexes", [])
+        db_driver.remove_key(tablename, obj_as_dict["id"], secondary_indexes)
 
         return True
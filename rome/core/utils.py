@@ -43,19 +43,50 @@ def merge_dicts(dict1, dict2):
 
 
 def get_objects(tablename,
-                hints=None):
+                hints=None,
+                column_filter=None):
     """
     Get objects in database that belongs to a targeted set of objects.
     :param tablename: name of the targeted set objects
     :param hints: a list of hints that will help the database driver to find objects by using
     secondary indexes
+    :param column_filter: (facultative) a function that selects the objects of a table stored by
+    columns, used when no hint is given
     :return: a list of python objects (dictionary representation)
     """
     if hints is None:
         hints = []
+    if column_filter is not None and len(hints) == 0:
+        return database_driver.get_driver().getall_matching(tablename, column_filter)
     return database_driver.get_driver().getall(tablename, hints=hints)
 
 
+def get_populated_secondary_indexes(tablename, attributes):
+    """
+    Select the secondary indexes of a table that contain the entries of all its objects: hints on
+    the other indexes would miss the objects written before these indexes were declared.
+    :param tablename: a table name
+    :param attributes: a list of attributes that have a secondary index
+    :return: a list of attributes
+    """
+    driver = database_driver.get_driver()
+    return filter(lambda x: driver.is_secondary_index_populated(tablename, x), attributes)
+
+
+def get_table_versions(tablenames):
+    """
+    Get the version numbers of several tables: the version number of a table is incremented each
+    time one of its objects is modified.
+    :param tablenames: a list of table names
+    :return: a dict that associates each table name with its version number, or with None if the
+    database driver does not provide version numbers
+    """
+    try:
+        return database_driver.get_driver().get_version_numbers(tablenames)
+    except NotImplementedError:
+        return dict(map(lambda x: (x, None), tablenames))
+
+
 class CollectionAdapterWithoutEvents(CollectionAdapter):
 
     def append_with_event(self, item, initiator=None):
@@ -69,35 +100,90 @@ class InstanceStateWithoutBackref(InstanceState):
         pass
 
 
+class LazyRelationshipBatch(object):
+
+    """A group of lazy relationships of sibling objects (the objects of a same query result):
+    when one of them is accessed, the related objects of all of them are loaded at once."""
+
+    def __init__(self, fetch, many=True):
+        """
+        :param fetch: a function that takes a list of keys, and returns a dict that associates
+        each key with its related objects (a list when 'many' is True, an object otherwise)
+        :param many: a boolean which is True if each relationship contains several objects
+        """
+        self.fetch = fetch
+        self.many = many
+        self.members = []
+
+    def add(self, lazy_relationship, key):
+        """
+        Add a lazy relationship to the batch.
+        :param lazy_relationship: an instance of LazyRelationship
+        :param key: the value that designates the related objects of the relationship
+        """
+        self.members += [(lazy_relationship, key)]
+        lazy_relationship.batch = self
+
+    def load(self):
+        """
+        Load the relationships of the batch that have not been loaded yet.
+        """
+        pending_members = filter(lambda x: not x[0].is_loaded, self.members)
+        if len(pending_members) == 0:
+            return
+        related_objects = self.fetch(list(set(map(lambda x: x[1], pending_members))))
+        for (lazy_relationship, key) in pending_members:
+            lazy_relationship.data = related_objects.get(key, [] if self.many else None)
+            lazy_relationship.is_loaded = True
+        # The batch is not needed anymore
+        self.members = []
+
+
 class LazyRelationship(object):
 
-    def __init__(self, query, _class, many=True, request_uuid=None, info=None):
+    def __init__(self, query, _class, many=True, request_uuid=None, info=None,
+                 primary_keys=None):
         self.query = query
         self.many = many
         self.data = None
         self.is_loaded = False
         self._class = _class
         self.info = info
+        self.primary_keys = primary_keys
+        self.batch = None
 
     def load(self):
         """
-        Load from database data that is corresponding to the lazy relationship
+        Load from database data that is corresponding to the lazy relationship. When the
+        relationship belongs to a batch, the relationships of the sibling objects are loaded at
+        the same time. When the primary keys of the related objects are known, they are fetched
+        with a multi-key get instead of executing the query.
         """
+        if self.is_loaded is False and self.batch is not None:
+            self.batch.load()
         if self.is_loaded is False:
             from rome.core.session.utils import ObjectAttributeRefresher
             object_attribute_refresher = ObjectAttributeRefresher()
             if self.many:
-                self.data = self.query.all()
+                if self.primary_keys is not None:
+                    self.data = self.query.get_many(self.primary_keys)
+                else:
+                    self.data = self.query.all()
                 for obj in self.data:
                     if obj is not None:
                         object_attribute_refresher.refresh(obj)
             else:
-                self.data = self.query.first()
+                if self.primary_keys is not None:
+                    objects = self.query.get_many(self.primary_keys[:1])
+                    self.data = objects[0] if len(objects) > 0 else None
+                else:
+                    self.data = self.query.first()
                 if self.data is not None:
                     object_attribute_refresher.refresh(self.data)
             self.is_loaded = True
 
     def __getattr__(self, item):
+        # The bookkeeping objects of SQLAlchemy are built once, and then stored in the proxy
         if item in ["_sa_adapter"]:
             from sqlalchemy.orm.collections import InstrumentedList
             from sqlalchemy.orm.attributes import CollectionAttributeImpl
@@ -107,12 +193,17 @@ class LazyRelationship(object):
             state = InstanceState(self._class(), None)
             instrumented_list = InstrumentedList()
 
-            return CollectionAdapterWithoutEvents(attr, state, instrumented_list)
+            adapter = CollectionAdapterWithoutEvents(attr, state, instrumented_list)
+            self.__dict__[item] = adapter
+            return adapter
         if item in ["_sa_instance_state"]:
             fake_instance = self._class()
             class_manager = getattr(fake_instance, "_sa_class_manager")
-            return InstanceStateWithoutBackref(fake_instance, class_manager)
-        if item not in ["data", "many", "query", "_class", "is_loaded", "info"]:
+            state = InstanceStateWithoutBackref(fake_instance, class_manager)
+            self.__dict__[item] = state
+            return state
+        if item not in ["data", "many", "query", "_class", "is_loaded", "info", "primary_keys",
+                        "batch"]:
             self.load()
         if item == "iteritems":
             if self.is_relationship_list:
@@ -122,7 +213,8 @@ class LazyRelationship(object):
         return getattr(self.data, item, None)
 
     def __setattr__(self, name, value):
-        if name in ["data", "many", "query", "_class", "is_loaded", "__emulates__", "info"]:
+        if name in ["data", "many", "query", "_class", "is_loaded", "__emulates__", "info",
+                    "primary_keys", "batch"]:
             self.__dict__[name] = value
         else:
             self.load()
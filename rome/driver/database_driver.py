@@ -11,11 +11,12 @@ class DatabaseDriverInterface(object):
         """
         raise NotImplementedError
 
-    def remove_key(self, tablename, key):
+    def remove_key(self, tablename, key, secondary_indexes=None):
         """
         Remove a key from the keys associated to a table.
         :param tablename: a table name
         :param key: a key
+        :param secondary_indexes: (facultative) a list of secondary index
         """
         raise NotImplementedError
 
@@ -46,6 +47,28 @@ class DatabaseDriverInterface(object):
         """
         raise NotImplementedError
 
+    def is_secondary_index_populated(self, tablename, attribute):
+        """
+        Check if the secondary index of an attribute of a table is populated, i.e. if it contains
+        the entries of every object of the table. An index is populated when its first entry is
+        written in an empty table, or once it has been built with 'build_secondary_index': hints
+        on the other indexes should not be given to the driver, as they would miss objects.
+        :param tablename: a table name
+        :param attribute: the attribute of the secondary index
+        :return: a boolean
+        """
+        return False
+
+    def build_secondary_index(self, tablename, attribute):
+        """
+        Add the entries of the objects of a table to the secondary index of an attribute, and mark
+        the index as populated. This should be done once for the objects that were written before
+        the index was declared.
+        :param tablename: a table name
+        :param attribute: the attribute of the secondary index
+        """
+        raise NotImplementedError
+
     def get_version_number(self, tablename):
         """
         Return the version number of a table: each time a modification is made on a object of the
@@ -55,6 +78,15 @@ class DatabaseDriverInterface(object):
         """
         raise NotImplementedError
 
+    def get_version_numbers(self, tablenames):
+        """
+        Return the version numbers of several tables. Drivers that can read them in a single
+        request should override this method.
+        :param tablenames: a list of table names
+        :return: a dict that associates each table name with its version number
+        """
+        return dict(map(lambda x: (x, self.get_version_number(x)), tablenames))
+
     def get_object_version_number(self, tablename, key):
         """
         Return the version number of a an object of a table: each time a modification is made on an
@@ -75,6 +107,17 @@ class DatabaseDriverInterface(object):
         """
         raise NotImplementedError
 
+    def get_many(self, tablename, keys):
+        """
+        Get several objects from a given table. Drivers that can fetch several objects with a
+        single request should override this method.
+        :param tablename: a table name
+        :param keys: a list of object keys
+        :return: a list that contains, for each key, a python dictionary or None if no object has
+        this key
+        """
+        return map(lambda x: self.get(tablename, x), keys)
+
     def getall(self, tablename, hints=None):
         """
         Get all objects from a given table.
@@ -84,6 +127,32 @@ class DatabaseDriverInterface(object):
         """
         raise NotImplementedError
 
+    def getall_matching(self, tablename, column_filter):
+        """
+        Get the objects of a table that may match a filter evaluated on the columns of the table.
+        Drivers that store tables by columns should override this method, so that only the
+        selected objects are built: the other drivers return every object of the table.
+        :param tablename: a table name
+        :param column_filter: a function that takes a table stored by columns (an instance of
+        ColumnarTable) and returns the positions of the objects that may match
+        :return: a list of python dictionaries
+        """
+        return self.getall(tablename)
+
+    def scan(self, tablename, batch_size):
+        """
+        Iterate over the objects of a table by batches, where each object is returned once. Drivers
+        that can read a table by parts should override this method, so that the whole table is never
+        held in memory: the other drivers read every object of the table, and return them by
+        batches.
+        :param tablename: a table name
+        :param batch_size: the number of objects that should be read at once
+        :return: a generator of lists of python dictionaries
+        """
+        objects = self.getall(tablename)
+        for i in xrange(0, len(objects), batch_size):
+            yield objects[i:i + batch_size]
+
 
 DRIVER = None
 
@@ -106,7 +175,7 @@ def build_driver():
     if backend == "etcd":
         return EtcdDriver()
 
-    return MemoryDriver()
+    return MemoryDriver(storage=config.memory_storage())
 
 
 def get_driver():
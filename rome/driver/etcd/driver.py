@@ -7,6 +7,10 @@ from redlock import Redlock as Redlock
 
 from rome.conf.configuration import get_config
 
+# Number of keys above which 'get_many' reads the whole directory of a table, instead of reading
+# each key with its own request.
+GET_MANY_DIRECTORY_THRESHOLD = 32
+
 
 def chunks(elements, chunk_size):
     """
@@ -65,6 +69,8 @@ class EtcdDriver(DatabaseDriverInterface):
                              "port": 6379,
                              "db": 0},],
                            retry_count=10)
+        self.populated_indexes = set()
+        self.nonempty_tables = set()
 
     def add_key(self, tablename, key):
         """
@@ -75,16 +81,37 @@ class EtcdDriver(DatabaseDriverInterface):
         etcd_key = "%s_keys/%s" % (tablename, key)
         self.etcd_client.write(etcd_key, key)
 
-    def remove_key(self, tablename, key):
+    def remove_key(self, tablename, key, secondary_indexes=None):
         """
         Remove a key from the keys associated to a table.
         :param tablename: a table name
         :param key: a key
+        :param secondary_indexes: (facultative) a list of secondary index
         """
+        if secondary_indexes is None:
+            secondary_indexes = []
         etcd_table_keys_key = "%s_keys/%s" % (tablename, key)
         etcd_key = "/%s/%s" % (tablename, key)
         self.etcd_client.delete(etcd_table_keys_key)
-        self.etcd_client.delete(etcd_key)
+        if len(secondary_indexes) == 0:
+            self.etcd_client.delete(etcd_key)
+            self._incr_version_number(tablename)
+            return
+        # The object is removed with a compare-and-swap, so that the entries of its last value are
+        # removed from the secondary indexes.
+        while True:
+            try:
+                fetched = self.etcd_client.read(etcd_key)
+            except etcd.EtcdKeyNotFound:
+                return
+            try:
+                self.etcd_client.delete(etcd_key, prevIndex=fetched.modifiedIndex)
+                break
+            except (etcd.EtcdCompareFailed, etcd.EtcdKeyNotFound):
+                continue
+        self._incr_version_number(tablename)
+        self._remove_secondary_index_entries(tablename, key, ujson_loads(fetched.value), None,
+                                             secondary_indexes)
 
     def next_key(self, tablename):
         """
@@ -128,6 +155,31 @@ class EtcdDriver(DatabaseDriverInterface):
         except etcd.EtcdKeyNotFound:
             return []
 
+    def _incr_version_number(self, tablename):
+        """
+        Increment and return the version number of a table, with a compare-and-swap on its
+        current value. The version number is incremented once the object has been written, so
+        that the results read before the modification have an older version number.
+        :param tablename: a table name
+        :return: an integer
+        """
+        version_key = "version_number/%s" % (tablename)
+        while True:
+            try:
+                fetched = self.etcd_client.read(version_key)
+            except etcd.EtcdKeyNotFound:
+                try:
+                    self.etcd_client.write(version_key, 1, prevExist=False)
+                    return 1
+                except etcd.EtcdAlreadyExist:
+                    continue
+            version_number = int(fetched.value) + 1
+            try:
+                self.etcd_client.write(version_key, version_number, prevIndex=fetched.modifiedIndex)
+                return version_number
+            except (etcd.EtcdCompareFailed, etcd.EtcdKeyNotFound):
+                continue
+
     def get_version_number(self, tablename):
         """
         Return the version number of a table: each time a modification is made on a object of the
@@ -135,7 +187,28 @@ class EtcdDriver(DatabaseDriverInterface):
         :param tablename: a table name
         :return: an integer that corresponds to the version number of the table
         """
-        raise NotImplementedError
+        try:
+            return int(self.etcd_client.read("version_number/%s" % (tablename)).value)
+        except etcd.EtcdKeyNotFound:
+            return 0
+
+    def get_version_numbers(self, tablenames):
+        """
+        Return the version numbers of several tables, read with a single recursive request on the
+        directory of the version numbers.
+        :param tablenames: a list of table names
+        :return: a dict that associates each table name with its version number
+        """
+        result = dict(map(lambda x: (x, 0), tablenames))
+        try:
+            fetched = self.etcd_client.read("version_number", recursive=True)
+        except etcd.EtcdKeyNotFound:
+            return result
+        for child in fetched.children:
+            tablename = child.key.split("/")[-1]
+            if child.value is not None and tablename in result:
+                result[tablename] = int(child.value)
+        return result
 
     def get_object_version_number(self, tablename, key):
         """
@@ -160,17 +233,170 @@ class EtcdDriver(DatabaseDriverInterface):
             secondary_indexes = []
         json_value = ujson_dumps(value)
         etcd_key = "%s/%s" % (tablename, key)
-        etcd_sec_idx_key = "%s_%s" % (tablename, key)
-        fetched = self.etcd_client.write("/%s" % (etcd_key), json_value)
-        for secondary_index in secondary_indexes:
-            secondary_value = value[secondary_index]
-            fetched = self.etcd_client.write("sec_index/%s/%s/%s/%s" % (
-                tablename, secondary_index, secondary_value, etcd_sec_idx_key
-            ), etcd_sec_idx_key)
+        if len(secondary_indexes) > 0:
+            fetched = self._put_with_secondary_indexes(tablename, key, value, json_value,
+                                                       secondary_indexes)
+        else:
+            fetched = self.etcd_client.write("/%s" % (etcd_key), json_value)
+        self._incr_version_number(tablename)
         result = value if fetched else None
         result = convert_unicode_dict_to_utf8(result)
         return result
 
+    def _put_with_secondary_indexes(self, tablename, key, value, json_value, secondary_indexes):
+        """
+        Insert a value in a table, and update the secondary indexes of the table. The entries of
+        the new value are added before the value is written with a compare-and-swap on the
+        previous value of the object, and the entries of the previous value are removed once the
+        value is written: an object is never missing from the entries of its stored value, while
+        concurrent writes may leave extra entries, which only add candidates to the objects
+        matching a hint.
+        :param tablename: a table name
+        :param key: a string key
+        :param value: a value
+        :param json_value: the value serialized in JSON
+        :param secondary_indexes: a list of secondary index
+        :return: an instance of 'EtcdResult'
+        """
+        etcd_key = "/%s/%s" % (tablename, key)
+        unknown_indexes = filter(lambda x: not self.is_secondary_index_populated(tablename, x),
+                                 secondary_indexes)
+        table_was_empty = len(unknown_indexes) > 0 and self._is_table_empty(tablename)
+        while True:
+            try:
+                previous = self.etcd_client.read(etcd_key)
+                old_value = ujson_loads(previous.value)
+                condition = {"prevIndex": previous.modifiedIndex}
+            except etcd.EtcdKeyNotFound:
+                old_value = None
+                condition = {"prevExist": False}
+            self._add_secondary_index_entries(tablename, key, value, secondary_indexes)
+            try:
+                fetched = self.etcd_client.write(etcd_key, json_value, **condition)
+                break
+            except (etcd.EtcdCompareFailed, etcd.EtcdAlreadyExist, etcd.EtcdKeyNotFound):
+                continue
+        self._remove_secondary_index_entries(tablename, key, old_value, value, secondary_indexes)
+        if table_was_empty:
+            for secondary_index in unknown_indexes:
+                self.etcd_client.write("sec_index_populated/%s/%s" % (tablename, secondary_index),
+                                       1)
+                self.populated_indexes.add((tablename, secondary_index))
+        self.nonempty_tables.add(tablename)
+        return fetched
+
+    def _secondary_index_entry(self, tablename, key, secondary_index, value):
+        """
+        Compute the etcd key of the entry of an object in a secondary index.
+        :param tablename: a table name
+        :param key: the key of the object
+        :param secondary_index: the attribute of the secondary index
+        :param value: the value of the attribute
+        :return: a string
+        """
+        return "sec_index/%s/%s/%s/%s_%s" % (tablename, secondary_index, value, tablename, key)
+
+    def _add_secondary_index_entries(self, tablename, key, value, secondary_indexes):
+        """
+        Add the entries of a value of an object to the secondary indexes of a table.
+        :param tablename: a table name
+        :param key: the key of the object
+        :param value: a value of the object
+        :param secondary_indexes: a list of secondary index
+        """
+        for secondary_index in secondary_indexes:
+            if secondary_index in value:
+                self.etcd_client.write(self._secondary_index_entry(
+                    tablename, key, secondary_index, value[secondary_index]
+                ), "%s_%s" % (tablename, key))
+
+    def _remove_secondary_index_entries(self, tablename, key, old_value, new_value,
+                                        secondary_indexes):
+        """
+        Remove the entries of the previous value of an object from the secondary indexes of a
+        table, when they differ from the entries of its new value. As a concurrent write may have
+        set the object back to its previous value, the object is read again once the entries are
+        removed, and the entries of its current value are restored.
+        :param tablename: a table name
+        :param key: the key of the object
+        :param old_value: the previous value of the object (None if it did not exist)
+        :param new_value: the new value of the object (None if it has been removed)
+        :param secondary_indexes: a list of secondary index
+        """
+        if old_value is None:
+            return
+        removed_indexes = filter(lambda x: x in old_value and
+                                 (new_value is None or new_value.get(x, None) != old_value[x]),
+                                 secondary_indexes)
+        for secondary_index in removed_indexes:
+            try:
+                self.etcd_client.delete(self._secondary_index_entry(
+                    tablename, key, secondary_index, old_value[secondary_index]
+                ))
+            except etcd.EtcdKeyNotFound:
+                pass
+        if len(removed_indexes) > 0:
+            try:
+                fetched = self.etcd_client.read("/%s/%s" % (tablename, key))
+            except etcd.EtcdKeyNotFound:
+                return
+            self._add_secondary_index_entries(tablename, key, ujson_loads(fetched.value),
+                                              removed_indexes)
+
+    def _is_table_empty(self, tablename):
+        """
+        Check if a table contains no object. Tables that are not empty are remembered, so that
+        their directory is read once.
+        :param tablename: a table name
+        :return: a boolean
+        """
+        if tablename in self.nonempty_tables:
+            return False
+        try:
+            fetched = self.etcd_client.read("/%s" % (tablename))
+        except etcd.EtcdKeyNotFound:
+            return True
+        if any(map(lambda x: x.value is not None, fetched.children)):
+            self.nonempty_tables.add(tablename)
+            return False
+        return True
+
+    def is_secondary_index_populated(self, tablename, attribute):
+        """
+        Check if the secondary index of an attribute of a table is populated, i.e. if it contains
+        the entries of every object of the table. Populated indexes remain populated: they are
+        remembered, so that they are checked once.
+        :param tablename: a table name
+        :param attribute: the attribute of the secondary index
+        :return: a boolean
+        """
+        if (tablename, attribute) not in self.populated_indexes:
+            try:
+                self.etcd_client.read("sec_index_populated/%s/%s" % (tablename, attribute))
+            except etcd.EtcdKeyNotFound:
+                return False
+            self.populated_indexes.add((tablename, attribute))
+        return True
+
+    def build_secondary_index(self, tablename, attribute):
+        """
+        Add the entries of the objects of a table to the secondary index of an attribute, and mark
+        the index as populated. Objects that are modified or removed during the build may leave
+        extra entries in the index, which only add candidates to the objects matching a hint.
+        :param tablename: a table name
+        :param attribute: the attribute of the secondary index
+        """
+        try:
+            fetched = self.etcd_client.read("/%s" % (tablename), recursive=True)
+            children = filter(lambda x: x.value is not None, fetched.children)
+        except etcd.EtcdKeyNotFound:
+            children = []
+        for child in children:
+            self._add_secondary_index_entries(tablename, child.key.split("/")[-1],
+                                              ujson_loads(child.value), [attribute])
+        self.etcd_client.write("sec_index_populated/%s/%s" % (tablename, attribute), 1)
+        self.populated_indexes.add((tablename, attribute))
+
     def get(self, tablename, key, hint=None):
         """
         Get an object from a given table.
@@ -194,6 +420,30 @@ class EtcdDriver(DatabaseDriverInterface):
         except etcd.EtcdKeyNotFound:
             return None
 
+    def get_many(self, tablename, keys):
+        """
+        Get several objects from a given table. As the etcd client only reads a single key or a
+        whole directory per request, keys are read one by one, unless there are more than
+        GET_MANY_DIRECTORY_THRESHOLD keys: the directory of the table is then read with a single
+        recursive request.
+        :param tablename: a table name
+        :param keys: a list of object keys
+        :return: a list that contains, for each key, a python dictionary or None if no object has
+        this key
+        """
+        if len(keys) <= GET_MANY_DIRECTORY_THRESHOLD:
+            return map(lambda x: convert_unicode_dict_to_utf8(self.get(tablename, x)), keys)
+        try:
+            fetched = self.etcd_client.read("/%s" % (tablename), recursive=True)
+        except etcd.EtcdKeyNotFound:
+            return map(lambda x: None, keys)
+        values = {}
+        for child in fetched.children:
+            if child.value is not None:
+                values[child.key.split("/")[-1]] = child.value
+        return map(lambda x: convert_unicode_dict_to_utf8(ujson_loads(values["%s" % (x)]))
+                   if "%s" % (x) in values else None, keys)
+
     def _resolve_keys(self, tablename, keys):
         """
         Returns the objects that match a list of keys in a specified table.
@@ -201,7 +451,15 @@ class EtcdDriver(DatabaseDriverInterface):
         :param keys: a list of keys
         :return: a list of python objects
         """
-        fetched = list(self.etcd_client.get(tablename + "/").children)
+        if keys is None:
+            fetched = list(self.etcd_client.get(tablename + "/").children)
+        else:
+            fetched = []
+            for key in keys:
+                try:
+                    fetched += [self.etcd_client.read("/%s/%s" % (tablename, key))]
+                except etcd.EtcdKeyNotFound:
+                    pass
         if len(fetched) == 0:
             return []
         str_result = map(lambda x: x.value, fetched)
@@ -230,10 +488,16 @@ class EtcdDriver(DatabaseDriverInterface):
         else:
             id_hints = filter(lambda x: x[0] == "id", hints)
             non_id_hints = filter(lambda x: x[0] != "id", hints)
-            sec_keys = map(lambda h: "sec_index:%s:%s:%s" %
+            sec_keys = map(lambda h: "sec_index/%s/%s/%s" %
                            (tablename, h[0], h[1]), non_id_hints)
-            keys = map(lambda x: "%s:id:%s" % (tablename, x[1]), id_hints)
+            keys = map(lambda x: x[1], id_hints)
             for sec_key in sec_keys:
-                keys += self.etcd_client.read(sec_key)
-            keys = list(set(keys))
+                try:
+                    fetched = self.etcd_client.read(sec_key, recursive=True)
+                except etcd.EtcdKeyNotFound:
+                    continue
+                # Entries of secondary indexes have the form '<tablename>_<key>'
+                keys += map(lambda x: x.value[len(tablename) + 1:],
+                            filter(lambda x: x.value is not None, fetched.children))
+            keys = list(set(map(lambda x: "%s" % (x), keys)))
         return self._resolve_keys(tablename, keys)
@@ -0,0 +1,317 @@
+"""Columnar module.
+
+This module contains the columnar storage of the tables of the memory driver. Each column of a
+table is stored in a typed NumPy array (integers, floats and booleans) or in an array of Python
+objects (strings and other values), along with a mask of its NULL values and a mask of the objects
+that have a value for the column, and the position of each object in the columns is indexed by its
+key. Objects are updated in place, and a removed object is
+replaced by the last object of the table, so that the columns stay dense.
+
+Tables can be used as the dicts (key -> object) of the default storage of the memory driver: objects
+are built as dicts when they are read. Filters evaluated on the column arrays select the positions
+of the objects that should be built.
+
+"""
+
+import threading
+from itertools import izip
+
+import numpy
+
+DTYPES = {
+    "bool": numpy.bool_,
+    "int": numpy.int64,
+    "float": numpy.float64,
+    "string": numpy.object_,
+    "object": numpy.object_,
+}
+
+# Strings of a column are shared between the objects that have the same value, until the column
+# has this number of distinct values
+INTERNING_LIMIT = 4096
+
+
+def value_kind(value):
+    """
+    Find the kind of column that can store a value.
+    :param value: a python value (not None)
+    :return: a string, which is a key of DTYPES
+    """
+    value_type = type(value)
+    if value_type is bool:
+        return "bool"
+    if value_type is int:
+        return "int"
+    if value_type is float:
+        return "float"
+    if isinstance(value, basestring):
+        return "string"
+    return "object"
+
+
+class Column(object):
+
+    """A column of a table: an array of values, a mask of NULL values, and a mask of the objects
+    that have a value for the column (objects that do not have the column are also NULL, but they
+    are built without it, as in the dicts of the default storage). The kind of a column is the kind
+    of its first value that is not NULL (None until then), and becomes 'object' when a value of
+    another kind is stored."""
+
+    def __init__(self, capacity):
+        self.kind = None
+        self.values = numpy.empty(capacity, dtype=numpy.object_)
+        self.nulls = numpy.ones(capacity, dtype=numpy.bool_)
+        self.present = numpy.zeros(capacity, dtype=numpy.bool_)
+        self.distinct_values = {}
+
+    def resize(self, capacity):
+        """
+        Change the number of values that the column can store.
+        :param capacity: an integer
+        """
+        size = min(capacity, len(self.values))
+        if self.values.dtype == numpy.object_:
+            values = numpy.empty(capacity, dtype=numpy.object_)
+        else:
+            values = numpy.zeros(capacity, dtype=self.values.dtype)
+        values[:size] = self.values[:size]
+        nulls = numpy.ones(capacity, dtype=numpy.bool_)
+        nulls[:size] = self.nulls[:size]
+        present = numpy.zeros(capacity, dtype=numpy.bool_)
+        present[:size] = self.present[:size]
+        (self.values, self.nulls, self.present) = (values, nulls, present)
+
+    def _change_kind(self, kind):
+        if self.kind is None:
+            if DTYPES[kind] is not numpy.object_:
+                self.values = numpy.zeros(len(self.values), dtype=DTYPES[kind])
+        elif self.values.dtype != numpy.object_:
+            # Values of typed arrays are converted to the equivalent python values
+            values = self.values.astype(numpy.object_)
+            values[self.nulls] = None
+            self.values = values
+        self.kind = kind
+        self.distinct_values = {}
+
+    def set(self, position, value):
+        """
+        Set the value of an object.
+        :param position: the position of the object
+        :param value: a python value
+        """
+        if value is None:
+            self.clear(position)
+            self.present[position] = True
+            return
+        if self.kind != "object":
+            kind = value_kind(value)
+            if kind != self.kind:
+                self._change_kind(kind if self.kind is None else "object")
+        if self.kind == "string":
+            # The type is part of the key, as str and unicode values may be equal
+            if len(self.distinct_values) < INTERNING_LIMIT:
+                value = self.distinct_values.setdefault((type(value), value), value)
+            else:
+                value = self.distinct_values.get((type(value), value), value)
+        self.values[position] = value
+        self.nulls[position] = False
+        self.present[position] = True
+
+    def move(self, source, destination):
+        """
+        Copy the value of an object at another position, and clear its former position.
+        :param source: the position of the object
+        :param destination: the new position of the object
+        """
+        self.values[destination] = self.values[source]
+        self.nulls[destination] = self.nulls[source]
+        self.present[destination] = self.present[source]
+        self.clear(source)
+
+    def clear(self, position):
+        """
+        Clear the value stored at a position: the object no longer has a value for the column.
+        :param position: a position
+        """
+        self.nulls[position] = True
+        self.present[position] = False
+        if self.values.dtype == numpy.object_:
+            self.values[position] = None
+
+    def tolist(self, positions):
+        """
+        Return the values of several objects.
+        :param positions: an array of positions
+        :return: a list of python values
+        """
+        values = self.values[positions].tolist()
+        if self.values.dtype != numpy.object_:
+            for index in numpy.flatnonzero(self.nulls[positions]):
+                values[index] = None
+        return values
+
+
+class ColumnarTable(object):
+
+    """A table stored by columns, which can be used as a dict that associates keys with objects."""
+
+    def __init__(self, capacity=16):
+        self.size = 0
+        self.capacity = capacity
+        self.keys = []
+        self.positions = {}
+        self.columns = {}
+        self.column_names = []
+        self.lock = threading.RLock()
+
+    def _reserve(self, size):
+        if size <= self.capacity:
+            return
+        while self.capacity < size:
+            self.capacity *= 2
+        for column in self.columns.itervalues():
+            column.resize(self.capacity)
+
+    def column(self, name):
+        """
+        Return the arrays of a column.
+        :param name: a column name
+        :return: a tuple (kind, values, nulls), where values and nulls are arrays that contain one
+        item per object of the table, or None if the table has no such column
+        """
+        column = self.columns.get(name, None)
+        if column is None:
+            return None
+        return column.kind, column.values[:self.size], column.nulls[:self.size]
+
+    def put(self, key, value):
+        """
+        Insert or replace an object.
+        :param key: the key of the object
+        :param value: a dict
+        """
+        with self.lock:
+            position = self.positions.get(key, None)
+            if position is None:
+                position = self.size
+                self._reserve(position + 1)
+                self.positions[key] = position
+                self.keys.append(key)
+                self.size += 1
+            for (name, column) in self.columns.iteritems():
+                if name not in value:
+                    column.clear(position)
+            for (name, column_value) in value.iteritems():
+                column = self.columns.get(name, None)
+                if column is None:
+                    column = Column(self.capacity)
+                    self.columns[name] = column
+                    self.column_names.append(name)
+                column.set(position, column_value)
+
+    def remove(self, key):
+        """
+        Remove an object: the last object of the table takes its position.
+        :param key: the key of the object
+        :return: the object (a dict), or None if no object has this key
+        """
+        with self.lock:
+            position = self.positions.get(key, None)
+            if position is None:
+                return None
+            value = self.row(position)
+            last_position = self.size - 1
+            last_key = self.keys.pop()
+            del self.positions[key]
+            if position != last_position:
+                for column in self.columns.itervalues():
+                    column.move(last_position, position)
+                self.keys[position] = last_key
+                self.positions[last_key] = position
+            else:
+                for column in self.columns.itervalues():
+                    column.clear(position)
+            self.size -= 1
+            return value
+
+    def row(self, position):
+        """
+        Build the object stored at a position.
+        :param position: a position
+        :return: a dict
+        """
+        return self.rows([position])[0]
+
+    def rows(self, positions=None):
+        """
+        Build the objects stored at several positions. Objects only contain the columns for which
+        they have a value.
+        :param positions: (facultative) an array of positions, by default every position
+        :return: a list of dicts
+        """
+        with self.lock:
+            if positions is None:
+                positions = numpy.arange(self.size)
+            names = self.column_names
+            if len(names) == 0:
+                return map(lambda x: {}, positions)
+            columns = map(lambda x: self.columns[x].tolist(positions), names)
+            presences = map(lambda x: self.columns[x].present[positions], names)
+            if all(map(lambda x: x.all(), presences)):
+                return [dict(izip(names, values)) for values in izip(*columns)]
+            presences = map(lambda x: x.tolist(), presences)
+            return [dict((name, value) for (name, value, present)
+                         in izip(names, values, row_presences) if present)
+                    for (values, row_presences) in izip(izip(*columns), izip(*presences))]
+
+    def get_many(self, keys):
+        """
+        Build the objects that have several keys.
+        :param keys: a list of keys
+        :return: a list of dicts, without the keys that are not in the table
+        """
+        with self.lock:
+            positions = [self.positions[x] for x in keys if x in self.positions]
+            return self.rows(numpy.array(positions, dtype=numpy.int64))
+
+    def select(self, column_filter):
+        """
+        Build the objects selected by a filter evaluated on the columns of the table.
+        :param column_filter: a function that takes a table and returns an array of positions
+        :return: a list of dicts
+        """
+        with self.lock:
+            return self.rows(column_filter(self))
+
+    # The following methods enable to use a table as a dict
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.keys))
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.row(self.positions[key])
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def get(self, key, default=None):
+        with self.lock:
+            position = self.positions.get(key, None)
+            return self.row(position) if position is not None else default
+
+    def pop(self, key):
+        value = self.remove(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def values(self):
+        return self.rows()
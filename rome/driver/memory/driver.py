@@ -1,15 +1,45 @@
 from rome.driver.database_driver import DatabaseDriverInterface
+from rome.driver.memory.columnar import ColumnarTable
+
+
+def index_keys(value):
+    """
+    Compute the keys of the entries of a value in a secondary index. Values are indexed with their
+    type, so that None and "None", or 1 and "1", have distinct entries; but as strings compared
+    with numbers are converted to numbers in queries, strings that represent a number are also
+    indexed by this number.
+    :param value: the value of an attribute of an object, or the value of a hint
+    :return: a list of hashable values
+    """
+    if isinstance(value, dict):
+        value = value.get("value", None)
+    elif isinstance(value, list):
+        value = tuple(value)
+    keys = [value]
+    if isinstance(value, basestring):
+        try:
+            number = float(value)
+        except ValueError:
+            return keys
+        # NaN values are not equal to themselves, and could not be found in the index
+        if number == number:
+            keys += [number]
+    return keys
 
 
 class MemoryDriver(DatabaseDriverInterface):
 
-    """A Driver that enables to manipulate a python dictionary as it was a database."""
+    """A Driver that enables to manipulate a python dictionary as it was a database. Tables are
+    either stored as dicts of objects (the "dict" storage), or by columns (the "columnar" storage,
+    see the 'rome.driver.memory.columnar' module)."""
 
-    def __init__(self):
+    def __init__(self, storage="dict"):
+        self.storage = storage
         self.database = {
             "keys": {},
             "tables": {},
             "sec_indexes": {},
+            "populated_sec_indexes": {},
             "next_keys": {},
             "version_numbers": {},
             "object_version_numbers": {}
@@ -23,9 +53,14 @@ class MemoryDriver(DatabaseDriverInterface):
         if tablename not in self.database["keys"]:
             self.database["keys"][tablename] = []
         if tablename not in self.database["tables"]:
-            self.database["tables"][tablename] = {}
+            if self.storage == "columnar":
+                self.database["tables"][tablename] = ColumnarTable()
+            else:
+                self.database["tables"][tablename] = {}
         if tablename not in self.database["sec_indexes"]:
             self.database["sec_indexes"][tablename] = {}
+        if tablename not in self.database["populated_sec_indexes"]:
+            self.database["populated_sec_indexes"][tablename] = set()
         if tablename not in self.database["next_keys"]:
             self.database["next_keys"][tablename] = 1
         if tablename not in self.database["version_numbers"]:
@@ -43,18 +78,72 @@ class MemoryDriver(DatabaseDriverInterface):
             self._init_table(tablename)
         self.database["keys"][tablename] += [key]
 
-    def remove_key(self, tablename, key):
+    def remove_key(self, tablename, key, secondary_indexes=None):
         """
         Remove a key from the keys associated to a table.
         :param tablename: a table name
         :param key: a key
+        :param secondary_indexes: (facultative) a list of secondary index
         """
+        if secondary_indexes is None:
+            secondary_indexes = []
         if tablename in self.database["keys"]:
             filtered_keys = filter(lambda k: k != key, self.database["keys"][tablename])
             self.database["keys"][tablename] = filtered_keys
         if tablename in self.database["tables"]:
             if key in self.database["tables"][tablename]:
-                self.database["tables"][tablename].pop(key)
+                self._incr_version_number(tablename)
+                old_value = self.database["tables"][tablename].pop(key)
+                self._update_secondary_indexes(tablename, key, old_value, None,
+                                               secondary_indexes)
+
+    def _update_secondary_indexes(self, tablename, key, old_value, new_value, secondary_indexes):
+        """
+        Update the secondary indexes of a table, when an object is modified.
+        :param tablename: a table name
+        :param key: the key of the object
+        :param old_value: the previous value of the object (None if it did not exist)
+        :param new_value: the new value of the object (None if it has been removed)
+        :param secondary_indexes: a list of secondary index
+        """
+        table_indexes = self.database["sec_indexes"][tablename]
+        for secondary_index in secondary_indexes:
+            index = table_indexes.setdefault(secondary_index, {})
+            if old_value is not None and secondary_index in old_value:
+                for old_index_key in index_keys(old_value[secondary_index]):
+                    if old_index_key in index:
+                        index[old_index_key].discard(key)
+                        if len(index[old_index_key]) == 0:
+                            index.pop(old_index_key)
+            if new_value is not None and secondary_index in new_value:
+                for new_index_key in index_keys(new_value[secondary_index]):
+                    index.setdefault(new_index_key, set()).add(key)
+
+    def is_secondary_index_populated(self, tablename, attribute):
+        """
+        Check if the secondary index of an attribute of a table is populated, i.e. if it contains
+        the entries of every object of the table.
+        :param tablename: a table name
+        :param attribute: the attribute of the secondary index
+        :return: a boolean
+        """
+        if tablename not in self.database["populated_sec_indexes"]:
+            self._init_table(tablename)
+        return attribute in self.database["populated_sec_indexes"][tablename]
+
+    def build_secondary_index(self, tablename, attribute):
+        """
+        Add the entries of the objects of a table to the secondary index of an attribute, and mark
+        the index as populated.
+        :param tablename: a table name
+        :param attribute: the attribute of the secondary index
+        """
+        if tablename not in self.database["populated_sec_indexes"]:
+            self._init_table(tablename)
+        table = self.database["tables"][tablename]
+        for key in list(table):
+            self._update_secondary_indexes(tablename, key, None, table[key], [attribute])
+        self.database["populated_sec_indexes"][tablename].add(attribute)
 
     def next_key(self, tablename):
         """
@@ -96,7 +185,13 @@ class MemoryDriver(DatabaseDriverInterface):
         object_version_number = self.get_object_version_number(tablename, key)
         value["___version_number"] = object_version_number
         # Set the value in database
-        self.database["tables"][tablename][key] = value
+        table = self.database["tables"][tablename]
+        old_value = table.get(key, None)
+        if len(table) == 0:
+            # The indexes of an empty table contain the entries of all its objects
+            self.database["populated_sec_indexes"][tablename].update(secondary_indexes)
+        table[key] = value
+        self._update_secondary_indexes(tablename, key, old_value, value, secondary_indexes)
 
     def get_version_number(self, tablename):
         """
@@ -160,6 +255,26 @@ class MemoryDriver(DatabaseDriverInterface):
         else:
             return 0
 
+    def _find_key(self, table, value):
+        """
+        Find the key of a table that corresponds to a value of the 'id' attribute: the value may
+        have been given as a string, while keys are integers. Strings are converted as in the
+        comparisons of queries.
+        :param table: a python dictionary that contains the objects of a table
+        :param value: a value of the 'id' attribute
+        :return: a key of the table, or None if no object matches the value
+        """
+        if value in table:
+            return value
+        if isinstance(value, basestring):
+            try:
+                key = int(value)
+            except ValueError:
+                return None
+            if key in table:
+                return key
+        return None
+
     def get(self, tablename, key, hint=None):
         """
         Get an object from a given table.
@@ -175,6 +290,19 @@ class MemoryDriver(DatabaseDriverInterface):
         else:
             return None
 
+    def get_many(self, tablename, keys):
+        """
+        Get several objects from a given table.
+        :param tablename: a table name
+        :param keys: a list of object keys
+        :return: a list that contains, for each key, a python dictionary or None if no object has
+        this key
+        """
+        if tablename not in self.database["object_version_numbers"]:
+            self._init_table(tablename)
+        table = self.database["tables"][tablename]
+        return map(lambda x: table.get(self._find_key(table, x), None), keys)
+
     def getall(self, tablename, hints=None):
         """
         Get all objects from a given table.
@@ -186,5 +314,54 @@ class MemoryDriver(DatabaseDriverInterface):
             hints = []
         if not tablename in self.database["object_version_numbers"]:
             self._init_table(tablename)
-        result = map(lambda (k, v): v, self.database["tables"][tablename].iteritems())
-        return result
+        table = self.database["tables"][tablename]
+        if len(hints) == 0:
+            return table.values()
+        table_indexes = self.database["sec_indexes"][tablename]
+        keys = set()
+        for (attribute, value) in hints:
+            if attribute == "id":
+                keys.add(self._find_key(table, value))
+            else:
+                index = table_indexes.get(attribute, {})
+                for index_key in index_keys(value):
+                    keys.update(index.get(index_key, []))
+        return map(lambda k: table[k], filter(lambda k: k in table, keys))
+
+    def getall_matching(self, tablename, column_filter):
+        """
+        Get the objects of a table that may match a filter. With the columnar storage, the filter
+        is evaluated on the columns of the table, and only the selected objects are built.
+        :param tablename: a table name
+        :param column_filter: a function that takes a table stored by columns (an instance of
+        ColumnarTable) and returns the positions of the objects that may match
+        :return: a list of python dictionaries
+        """
+        if tablename not in self.database["object_version_numbers"]:
+            self._init_table(tablename)
+        table = self.database["tables"][tablename]
+        if self.storage != "columnar":
+            return table.values()
+        return table.select(column_filter)
+
+    def scan(self, tablename, batch_size):
+        """
+        Iterate over the objects of a table by batches. The keys of the table are read when the
+        scan starts: objects that are removed during the scan are skipped, and objects that are
+        added are not returned.
+        :param tablename: a table name
+        :param batch_size: the number of objects that should be read at once
+        :return: a generator of lists of python dictionaries
+        """
+        if tablename not in self.database["object_version_numbers"]:
+            self._init_table(tablename)
+        table = self.database["tables"][tablename]
+        keys = list(table)
+        for i in xrange(0, len(keys), batch_size):
+            batch_keys = keys[i:i + batch_size]
+            if self.storage == "columnar":
+                objects = table.get_many(batch_keys)
+            else:
+                objects = [table[k] for k in batch_keys if k in table]
+            if len(objects) > 0:
+                yield objects
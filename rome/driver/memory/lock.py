@@ -23,13 +23,14 @@ class MemoryLock(object):
         retry = 0
         while retry < self.retry_count:
             with self.modification_lock:
-                if "name" not in self.locks:
+                if name not in self.locks:
                     self.locks[name] = {
                         "name": name,
                         "ttl": ttl,
                         "time": current_milli_time()
                     }
                     return True
+            retry += 1
             time.sleep(random.uniform(0.005, 0.010))
         return False
 
@@ -1,11 +1,10 @@
 from ujson import loads as ujson_loads
 from ujson import dumps as ujson_dumps
+from redis.exceptions import WatchError
 
 from rome.conf.configuration import get_config
 from rome.driver.database_driver import DatabaseDriverInterface
 
-DATABASE_CACHE = {}
-
 
 def chunks(elements, chunk_size):
     """
@@ -57,8 +56,12 @@ class RedisDriver(DatabaseDriverInterface):
 
     """A Driver that enables to manipulate a Redis database."""
 
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, transactions=True):
         self.redis_client = redis_client
+        # Clustered redis databases do not support transactions on keys of several nodes: objects
+        # and their secondary indexes are then updated without transactions.
+        self.transactions = transactions
+        self.populated_indexes = set()
 
     def add_key(self, tablename, key):
         """
@@ -68,16 +71,26 @@ class RedisDriver(DatabaseDriverInterface):
         """
         pass
 
-    def remove_key(self, tablename, key):
+    def remove_key(self, tablename, key, secondary_indexes=None):
         """
         Remove a key from the keys associated to a table.
         :param tablename: a table name
         :param key: a key
+        :param secondary_indexes: (facultative) a list of secondary index
         """
+        if secondary_indexes is None:
+            secondary_indexes = []
         redis_key = "%s:id:%s" % (tablename, key)
+        if len(secondary_indexes) > 0 and self.transactions:
+            self._remove_in_transaction(tablename, key, secondary_indexes)
+            return
+        if len(secondary_indexes) > 0:
+            self._update_secondary_indexes(tablename, key, None, secondary_indexes)
         self.redis_client.hdel(tablename, redis_key)
         self._incr_version_number(tablename)
-        self._reset_object_version_number(tablename, key)
+        # The version number of the object is kept: an object created later with the same key
+        # gets a new version number, so that its values are not taken from the object cache
+        self._incr_object_version_number(tablename, key)
 
     def next_key(self, tablename):
         """
@@ -138,6 +151,18 @@ class RedisDriver(DatabaseDriverInterface):
         version_number = self.redis_client.get("version_number:%s" % (tablename))
         return version_number
 
+    def get_version_numbers(self, tablenames):
+        """
+        Return the version numbers of several tables, read with a single request.
+        :param tablenames: a list of table names
+        :return: a dict that associates each table name with its version number
+        """
+        if len(tablenames) == 0:
+            return {}
+        version_numbers = self.redis_client.mget(map(lambda x: "version_number:%s" % (x),
+                                                     tablenames))
+        return dict(zip(tablenames, version_numbers))
+
     def get_object_version_number(self, tablename, key):
         """
         Return the version number of a an object of a table: each time a modification is made on an
@@ -163,6 +188,8 @@ class RedisDriver(DatabaseDriverInterface):
         """
         if secondary_indexes is None:
             secondary_indexes = []
+        if len(secondary_indexes) > 0 and self.transactions:
+            return self._put_in_transaction(tablename, key, value, secondary_indexes)
 
         # Increase version numbers of the table and the object
         self._incr_version_number(tablename)
@@ -170,20 +197,166 @@ class RedisDriver(DatabaseDriverInterface):
         # Add the version number
         object_version_number = self.get_object_version_number(tablename, key)
         value["___version_number"] = object_version_number
+        # Update secondary indexes, before the previous value is overwritten.
+        if len(secondary_indexes) > 0:
+            self._update_secondary_indexes(tablename, key, value, secondary_indexes)
         # Dump python object to JSON field.
         json_value = ujson_dumps(value)
         fetched = self.redis_client.hset(tablename,
                                          "%s:id:%s" % (tablename, key),
                                          json_value)
-        for secondary_index in secondary_indexes:
-            secondary_value = value[secondary_index]
-            sec_index_key = "sec_index:%s:%s:%s" % (tablename, secondary_index, secondary_value)
-            sec_index_value = "%s:id:%s" % (tablename, key)
-            fetched = self.redis_client.sadd(sec_index_key, sec_index_value)
         result = value if fetched else None
         result = convert_unicode_dict_to_utf8(result)
         return result
 
+    def _put_in_transaction(self, tablename, key, value, secondary_indexes):
+        """
+        Insert a value in a table, and update the secondary indexes of the table in the same
+        transaction. The version number of the object is watched while its previous value is
+        read: if the object is modified concurrently, the transaction is retried, so that the
+        entries of the secondary indexes always correspond to the stored value.
+        :param tablename: a table name
+        :param key: a string key
+        :param value: a value
+        :param secondary_indexes: a list of secondary index
+        :return: a dict that represents the value that has been inserted
+        """
+        redis_key = "%s:id:%s" % (tablename, key)
+        object_version_key = "object_version_number:%s:%s" % (tablename, key)
+        with self.redis_client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(object_version_key)
+                    fetched = pipe.hget(tablename, redis_key)
+                    old_value = ujson_loads(fetched) if fetched is not None else None
+                    table_was_empty = old_value is None and pipe.hlen(tablename) == 0
+                    object_version_number = int(pipe.get(object_version_key) or 0) + 1
+                    value["___version_number"] = object_version_number
+                    pipe.multi()
+                    pipe.incr("version_number:%s" % (tablename), 1)
+                    pipe.set(object_version_key, object_version_number)
+                    self._queue_secondary_index_updates(pipe, tablename, redis_key, old_value,
+                                                        value, secondary_indexes,
+                                                        table_was_empty)
+                    pipe.hset(tablename, redis_key, ujson_dumps(value))
+                    fetched = pipe.execute()[-1]
+                    break
+                except WatchError:
+                    continue
+        if table_was_empty:
+            self.populated_indexes.update(map(lambda x: (tablename, x), secondary_indexes))
+        result = value if fetched else None
+        result = convert_unicode_dict_to_utf8(result)
+        return result
+
+    def _remove_in_transaction(self, tablename, key, secondary_indexes):
+        """
+        Remove an object from a table, and remove its entries from the secondary indexes of the
+        table in the same transaction (see '_put_in_transaction').
+        :param tablename: a table name
+        :param key: a key
+        :param secondary_indexes: a list of secondary index
+        """
+        redis_key = "%s:id:%s" % (tablename, key)
+        object_version_key = "object_version_number:%s:%s" % (tablename, key)
+        with self.redis_client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(object_version_key)
+                    fetched = pipe.hget(tablename, redis_key)
+                    old_value = ujson_loads(fetched) if fetched is not None else None
+                    pipe.multi()
+                    self._queue_secondary_index_updates(pipe, tablename, redis_key, old_value,
+                                                        None, secondary_indexes)
+                    pipe.hdel(tablename, redis_key)
+                    pipe.incr("version_number:%s" % (tablename), 1)
+                    # The version number of the object is kept (see 'remove_key')
+                    pipe.incr(object_version_key, 1)
+                    pipe.execute()
+                    break
+                except WatchError:
+                    continue
+
+    def _update_secondary_indexes(self, tablename, key, new_value, secondary_indexes):
+        """
+        Update the secondary indexes of a table, when an object is modified without transactions:
+        the entries of the previous value of the object are replaced by the entries of its new
+        value.
+        :param tablename: a table name
+        :param key: the key of the object
+        :param new_value: the new value of the object (None if it is removed)
+        :param secondary_indexes: a list of secondary index
+        """
+        redis_key = "%s:id:%s" % (tablename, key)
+        fetched = self.redis_client.hget(tablename, redis_key)
+        old_value = ujson_loads(fetched) if fetched is not None else None
+        table_was_empty = old_value is None and new_value is not None and \
+            self.redis_client.hlen(tablename) == 0
+        pipe = self.redis_client.pipeline()
+        self._queue_secondary_index_updates(pipe, tablename, redis_key, old_value, new_value,
+                                            secondary_indexes, table_was_empty)
+        pipe.execute()
+
+    def _queue_secondary_index_updates(self, pipe, tablename, redis_key, old_value, new_value,
+                                       secondary_indexes, table_was_empty=False):
+        """
+        Add to a pipeline the requests that replace the entries of the previous value of an object
+        by the entries of its new value, in the secondary indexes of a table.
+        :param pipe: a redis pipeline
+        :param tablename: a table name
+        :param redis_key: the key of the object in the hash of the table
+        :param old_value: the previous value of the object (None if it did not exist)
+        :param new_value: the new value of the object (None if it is removed)
+        :param secondary_indexes: a list of secondary index
+        :param table_was_empty: True if the object is the first object of the table, in which
+        case the secondary indexes are marked as populated
+        """
+        for secondary_index in secondary_indexes:
+            if old_value is not None and secondary_index in old_value:
+                sec_index_key = "sec_index:%s:%s:%s" % (tablename, secondary_index,
+                                                        old_value[secondary_index])
+                pipe.srem(sec_index_key, redis_key)
+            if new_value is not None and secondary_index in new_value:
+                sec_index_key = "sec_index:%s:%s:%s" % (tablename, secondary_index,
+                                                        new_value[secondary_index])
+                pipe.sadd(sec_index_key, redis_key)
+            if table_was_empty:
+                pipe.set("sec_index_populated:%s:%s" % (tablename, secondary_index), 1)
+
+    def is_secondary_index_populated(self, tablename, attribute):
+        """
+        Check if the secondary index of an attribute of a table is populated, i.e. if it contains
+        the entries of every object of the table. Populated indexes remain populated: they are
+        remembered, so that they are checked once.
+        :param tablename: a table name
+        :param attribute: the attribute of the secondary index
+        :return: a boolean
+        """
+        if (tablename, attribute) not in self.populated_indexes:
+            if self.redis_client.get("sec_index_populated:%s:%s" % (tablename, attribute)) is None:
+                return False
+            self.populated_indexes.add((tablename, attribute))
+        return True
+
+    def build_secondary_index(self, tablename, attribute):
+        """
+        Add the entries of the objects of a table to the secondary index of an attribute, and mark
+        the index as populated. The table is read with HSCAN requests: objects that are modified
+        or removed during the build may leave extra entries in the index, which only add
+        candidates to the objects matching a hint.
+        :param tablename: a table name
+        :param attribute: the attribute of the secondary index
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        for (redis_key, fetched) in self.redis_client.hscan_iter(tablename, count=1000):
+            self._queue_secondary_index_updates(pipe, tablename, redis_key, None,
+                                                ujson_loads(fetched), [attribute])
+            if len(pipe) >= 1000:
+                pipe.execute()
+        pipe.execute()
+        self.redis_client.set("sec_index_populated:%s:%s" % (tablename, attribute), 1)
+        self.populated_indexes.add((tablename, attribute))
+
     def get(self, tablename, key, hint=None):
         """
         Get an object from a given table.
@@ -195,13 +368,30 @@ class RedisDriver(DatabaseDriverInterface):
         redis_key = "%s:id:%s" % (tablename, key)
         if hint is not None:
             hint_key = "sec_index:%s:%s:%s" % (tablename, hint[0], hint[1])
-            redis_keys = self.redis_client.smembers(hint_key)
+            redis_keys = list(self.redis_client.smembers(hint_key))
+            if len(redis_keys) == 0:
+                return None
             redis_key = redis_keys[0]
         fetched = self.redis_client.hget(tablename, redis_key)
         # Parse result from JSON to python dict.
         result = ujson_loads(fetched) if fetched is not None else None
         return result
 
+    def get_many(self, tablename, keys):
+        """
+        Get several objects from a given table, with a single HMGET request.
+        :param tablename: a table name
+        :param keys: a list of object keys
+        :return: a list that contains, for each key, a python dictionary or None if no object has
+        this key
+        """
+        if len(keys) == 0:
+            return []
+        redis_keys = map(lambda x: "%s:id:%s" % (tablename, x), keys)
+        fetched = self.redis_client.hmget(tablename, redis_keys)
+        return map(lambda x: convert_unicode_dict_to_utf8(ujson_loads(x))
+                   if x is not None else None, fetched)
+
     def _resolve_keys(self, tablename, keys):
         """
         Returns the objects that match a list of keys in a specified table.
@@ -234,13 +424,6 @@ class RedisDriver(DatabaseDriverInterface):
         """
         if hints is None:
             hints = []
-        # Test if a copy of the data is in the database cache
-        if get_config().database_caching():
-            version_number = self.get_version_number(tablename)
-            hashcode = hash(str(hints))
-            hash_key = "%s_%s_%s" % (tablename, version_number, hashcode)
-            if hash_key in DATABASE_CACHE:
-                return DATABASE_CACHE[hash_key]
         if len(hints) == 0:
             keys = self.keys(tablename)
         else:
@@ -251,11 +434,34 @@ class RedisDriver(DatabaseDriverInterface):
             for sec_key in sec_keys:
                 keys += self.redis_client.smembers(sec_key)
         keys = list(set(keys))
-        values = self._resolve_keys(tablename, keys)
-        # Put the resulting data is in the database cache
-        if get_config().database_caching():
-            DATABASE_CACHE[hash_key] = values
-        return values
+        return self._resolve_keys(tablename, keys)
+
+    def scan(self, tablename, batch_size):
+        """
+        Iterate over the objects of a table by batches, read with HSCAN requests. HSCAN returns
+        every object that is in the table during the whole scan, but it may return an object
+        several times when the table is resized during the scan: the redis keys of the objects
+        already returned are kept (not the objects), so that each object is returned once.
+        :param tablename: a table name
+        :param batch_size: the number of objects that should be read at once (a hint given to
+        redis, which may return slightly more or fewer objects per request)
+        :return: a generator of lists of python dictionaries
+        """
+        known_keys = set()
+        cursor = 0
+        while True:
+            (cursor, fetched) = self.redis_client.hscan(tablename, cursor=cursor, count=batch_size)
+            str_result = []
+            for (redis_key, value) in fetched.iteritems():
+                if redis_key not in known_keys and value is not None:
+                    known_keys.add(redis_key)
+                    str_result += [value]
+            if len(str_result) > 0:
+                # Transform the list of JSON string into a single string (boost performances).
+                result = ujson_loads("[%s]" % (",".join(str_result)))
+                yield map(lambda x: convert_unicode_dict_to_utf8(x), result)
+            if cursor == 0:
+                break
 
 
 def build_redis_driver(clustered=False):
@@ -277,4 +483,4 @@ def build_redis_driver(clustered=False):
         client = StrictRedisCluster(
             startup_nodes=startup_nodes,
             decode_responses=True)
-    return RedisDriver(client)
+    return RedisDriver(client, transactions=not clustered)
@@ -0,0 +1,165 @@
+"""Result cache module.
+
+This module contains a cache of the results read from the database, which works with every
+database driver. A result is cached with the version numbers of the tables it was read from: it is
+reused as long as none of these tables has been modified, and it is discarded as soon as one of
+them is modified. The version numbers of a result must be read before the result itself, so that a
+result is never associated with versions more recent than its content.
+
+The cache keeps a bounded number of results, whose total size (estimated when they are cached) is
+also bounded: the least recently used results are evicted first. Results are cached only for the
+tables for which the cache is enabled in the configuration.
+
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+from rome.conf.configuration import get_config
+
+# Size of the sample of items used to estimate the size of long lists
+SIZE_SAMPLE_LENGTH = 16
+
+
+def estimate_size(value):
+    """
+    Estimate the number of bytes used by a value made of lists, tuples and dicts. The size of
+    long lists is extrapolated from the size of their first items.
+    :param value: a python value
+    :return: an integer
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for (key, item) in value.iteritems():
+            size += estimate_size(key) + estimate_size(item)
+    elif isinstance(value, (list, tuple)):
+        sample = value[:SIZE_SAMPLE_LENGTH]
+        if len(sample) > 0:
+            sample_size = sum(map(estimate_size, sample))
+            size += sample_size * len(value) / len(sample)
+    return size
+
+
+class ResultCache(object):
+
+    """A cache of results, validated by the version numbers of the tables they were read from."""
+
+    def __init__(self, max_entries=None, max_bytes=None, enabled=False, table_settings=None):
+        if table_settings is None:
+            table_settings = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.table_settings = dict(map(lambda x: (x[0].lower(), x[1]), table_settings.items()))
+        self.results = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_enabled(self, tablenames):
+        """
+        Check if the results read from several tables can be cached.
+        :param tablenames: a list of table names
+        :return: a boolean that is True if the cache is enabled for every table
+        """
+        return all(map(lambda x: self.table_settings.get(x.lower(), self.enabled), tablenames))
+
+    def get(self, key, versions):
+        """
+        Return a cached result, if none of the tables it was read from has been modified.
+        :param key: a hashable value that identifies the result
+        :param versions: a dict that contains the current version number of each table of the
+        result
+        :return: the result, or None if it is not cached
+        """
+        with self.lock:
+            entry = self.results.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            (entry_versions, result, size) = entry
+            if entry_versions != versions:
+                self.size -= size
+                self.misses += 1
+                return None
+            # Entries are moved to the end of the dict when they are used
+            self.results[key] = entry
+            self.hits += 1
+            return result
+
+    def put(self, key, versions, result):
+        """
+        Cache a result.
+        :param key: a hashable value that identifies the result
+        :param versions: a dict that contains the version number of each table of the result, read
+        before the result. Results whose versions are unknown (None) are not cached.
+        :param result: a result
+        """
+        if None in versions.values():
+            return
+        size = estimate_size(result)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            previous_entry = self.results.pop(key, None)
+            if previous_entry is not None:
+                self.size -= previous_entry[2]
+            self.results[key] = (versions, result, size)
+            self.size += size
+            self._evict()
+
+    def _evict(self):
+        # Remove the least recently used entries, until the cache fits in its limits
+        while len(self.results) > 0 and \
+                ((self.max_entries is not None and len(self.results) > self.max_entries) or
+                 (self.max_bytes is not None and self.size > self.max_bytes)):
+            (_, entry) = self.results.popitem(last=False)
+            self.size -= entry[2]
+            self.evictions += 1
+
+    def statistics(self):
+        """
+        Return statistics about the usage of the cache.
+        :return: a dict that contains the number of hits, misses, evictions and cached results,
+        and the estimated size of the cached results
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.results),
+            "bytes": self.size
+        }
+
+    def clear(self):
+        """
+        Remove every result from the cache, and reset its statistics.
+        """
+        with self.lock:
+            self.results.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+RESULT_CACHE = None
+
+
+def get_result_cache():
+    """
+    Return a singleton instance of the 'ResultCache' class, configured by the 'ResultCache' and
+    'ResultCacheTables' sections of the configuration.
+    :return: an instance of the 'ResultCache' class
+    """
+    global RESULT_CACHE
+    if RESULT_CACHE is None:
+        config = get_config()
+        RESULT_CACHE = ResultCache(max_entries=config.result_cache_size(),
+                                   max_bytes=config.result_cache_bytes(),
+                                   enabled=config.result_cache_enabled(),
+                                   table_settings=config.result_cache_tables())
+    return RESULT_CACHE
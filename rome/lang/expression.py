@@ -0,0 +1,179 @@
+"""Expression module.
+
+This module contains a typed representation of the expressions (where clauses and joining
+clauses) of a query tree. Each expression is rendered as the SQL text that the query parser
+produces for the same expression, so that it can be used wherever a parsed clause is expected.
+
+"""
+
+
+class Expression(object):
+
+    """Base class of the nodes of an expression tree."""
+
+    def render(self):
+        """
+        Render the expression as a SQL text.
+        :return: a string
+        """
+        raise NotImplementedError
+
+    def labels(self):
+        """
+        Find the tables (or aliases) whose columns are used in the expression.
+        :return: a set of labels
+        """
+        return set()
+
+    def __str__(self):
+        return self.render()
+
+    def __repr__(self):
+        return self.render()
+
+
+class ColumnReference(Expression):
+
+    """A reference to a column of a table (or of an alias of a table)."""
+
+    def __init__(self, table, column, text):
+        self.table = table
+        self.column = column
+        self.text = text
+
+    def render(self):
+        return self.text
+
+    def labels(self):
+        return set([self.table])
+
+
+class Placeholder(Expression):
+
+    """A named placeholder, whose value is bound when the query is executed. The type of the
+    value (a SQLAlchemy type) is kept when it is known."""
+
+    def __init__(self, name, type_=None):
+        self.name = name
+        self.type = type_
+
+    def render(self):
+        return ":%s" % (self.name)
+
+
+class Constant(Expression):
+
+    """A constant value that is part of the shape of the query (NULL, true, false)."""
+
+    def __init__(self, value, text):
+        self.value = value
+        self.text = text
+
+    def render(self):
+        return self.text
+
+
+class Variable(Expression):
+
+    """A variable whose value is the result of a sub query."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def render(self):
+        return self.name
+
+
+class FunctionCall(Expression):
+
+    """A call to an aggregate function (count, sum, avg, min or max), used in HAVING clauses."""
+
+    def __init__(self, name, argument):
+        self.name = name
+        self.argument = argument
+
+    def render(self):
+        return "%s(%s)" % (self.name, self.argument.render())
+
+    def labels(self):
+        return self.argument.labels()
+
+
+class ValueList(Expression):
+
+    """A parenthesized list of values (right operand of the IN operator)."""
+
+    def __init__(self, items):
+        self.items = items
+
+    def render(self):
+        return "(%s)" % (", ".join(map(lambda x: x.render(), self.items)))
+
+    def labels(self):
+        return reduce(lambda x, y: x | y, map(lambda x: x.labels(), self.items), set())
+
+
+class BinaryComparison(Expression):
+
+    """A comparison between two operands: '=', '!=', '<', '<=', '>', '>=', 'IN', 'NOT IN', 'IS'
+    and 'IS NOT'."""
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+    def render(self):
+        return "%s %s %s" % (self.left.render(), self.operator, self.right.render())
+
+    def labels(self):
+        return self.left.labels() | self.right.labels()
+
+
+class BooleanClause(Expression):
+
+    """A conjunction ('AND') or a disjunction ('OR') of several expressions."""
+
+    def __init__(self, operator, operands):
+        self.operator = operator
+        self.operands = operands
+
+    def render(self):
+        def render_operand(operand):
+            if isinstance(operand, (BooleanClause, Negation)):
+                return "(%s)" % (operand.render())
+            return operand.render()
+        separator = " %s " % (self.operator)
+        return separator.join(map(render_operand, self.operands))
+
+    def labels(self):
+        return reduce(lambda x, y: x | y, map(lambda x: x.labels(), self.operands), set())
+
+
+class Negation(Expression):
+
+    """The negation of an expression."""
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def render(self):
+        return "NOT (%s)" % (self.operand.render())
+
+    def labels(self):
+        return self.operand.labels()
+
+
+class Ordering(Expression):
+
+    """A term of the ORDER BY clause of a query: an operand and a sorting direction."""
+
+    def __init__(self, operand, descending=False):
+        self.operand = operand
+        self.descending = descending
+
+    def render(self):
+        return "%s %s" % (self.operand.render(), "DESC" if self.descending else "ASC")
+
+    def labels(self):
+        return self.operand.labels()
@@ -3,12 +3,19 @@ import sqlparse
 import uuid
 import logging
 from sqlparse.sql import Token, IdentifierList, Identifier, Where, Comparison, Parenthesis, Function
+from sqlparse.tokens import Name, Number
+from rome.lang.expression import ColumnReference, Constant, Ordering, Placeholder
 import re
 
 SELECT_PART = 1
 FROM_PART = 2
 WHERE_PART = 3
 ORDER_PART = 4
+LIMIT_PART = 5
+OFFSET_PART = 6
+GROUP_PART = 7
+
+PLACEHOLDER_PATTERN = re.compile(r":([_a-zA-Z][_a-zA-Z0-9]*)")
 
 
 class QueryParserResult(object):
@@ -22,6 +29,34 @@ class QueryParserResult(object):
         self.aliases = {}
         self.function_calls = {}
         self.outer_join_models = []
+        self.group_by = []
+        self.having = None
+        self.order_by = []
+        self.limit = None
+        self.offset = None
+
+    def signature(self):
+        """
+        Compute a string that identifies the shape of the query: two query trees that only differ
+        by the values bound to their placeholders have the same signature.
+        :return: a string
+        """
+        variables = map(lambda x: "%s=[%s]" % (x[0], x[1].signature()),
+                        sorted(self.variables.items()))
+        parts = [self.attributes,
+                 self.models,
+                 sorted(self.aliases.items()),
+                 sorted(self.function_calls.items()),
+                 self.outer_join_models,
+                 map(str, self.where_clauses),
+                 map(str, self.joining_clauses),
+                 map(str, self.group_by),
+                 self.having,
+                 map(str, self.order_by),
+                 self.limit,
+                 self.offset,
+                 variables]
+        return "|".join(map(str, parts))
 
 
 def correct_invalid_property(term):
@@ -36,6 +71,20 @@ def correct_invalid_property(term):
     return term
 
 
+def bind_parameters(expression, parameters):
+    """
+    Replace the named placeholders (such as ':id_1') of an expression by their values.
+    Placeholders that do not have a value in parameters are left untouched.
+    :param expression: a string expression
+    :param parameters: a dict that associates placeholder names with string values
+    :return: a modified string expression
+    """
+    if not parameters:
+        return expression
+    return PLACEHOLDER_PATTERN.sub(lambda m: parameters.get(m.group(1), m.group(0)),
+                                   expression)
+
+
 class QueryParser(object):
 
     def __init__(self):
@@ -98,6 +147,44 @@ class QueryParser(object):
                 query.aliases[alias_name] = tablename
         return query
 
+    def parse_column_identifier(self, id_candidate, query):
+        # Parse a column of a GROUP BY or ORDER BY clause, which may be followed by a sorting
+        # direction: return a tuple (column, descending).
+        words = id_candidate.value.split()
+        descending = False
+        if words[-1].upper() in ["ASC", "DESC"]:
+            descending = words[-1].upper() == "DESC"
+            words = words[:-1]
+        column_text = correct_invalid_property(" ".join(words)).replace("\"", "")
+        if "." in column_text:
+            (table_name, column_name) = column_text.split(".", 1)
+        else:
+            table_name = query.models[0] if len(query.models) > 0 else None
+            column_name = column_text
+        return ColumnReference(table_name, column_name, column_text), descending
+
+    def parse_group_identifier_list(self, identifier_candidates, query):
+        for identifier_candidate in identifier_candidates.tokens:
+            self.parse_group_identifier(identifier_candidate, query)
+        return query
+
+    def parse_group_identifier(self, id_candidate, query):
+        if type(id_candidate) is Identifier and id_candidate.value.strip() != "":
+            (column, _) = self.parse_column_identifier(id_candidate, query)
+            query.group_by += [column]
+        return query
+
+    def parse_order_identifier_list(self, identifier_candidates, query):
+        for identifier_candidate in identifier_candidates.tokens:
+            self.parse_order_identifier(identifier_candidate, query)
+        return query
+
+    def parse_order_identifier(self, id_candidate, query):
+        if type(id_candidate) is Identifier and id_candidate.value.strip() != "":
+            (column, descending) = self.parse_column_identifier(id_candidate, query)
+            query.order_by += [Ordering(column, descending)]
+        return query
+
     def parse_where_clause(self, where_terms, query, joining_clause=False):
 
         def parse_parenthesis(parenthesis_term, query):
@@ -155,14 +242,17 @@ class QueryParser(object):
             "SELECT": SELECT_PART,
             "FROM": FROM_PART,
             "WHERE": WHERE_PART,
+            "GROUP": GROUP_PART,
             "ORDER": ORDER_PART,
+            "LIMIT": LIMIT_PART,
+            "OFFSET": OFFSET_PART,
         }
         expected_part = -1
         for term in terms:
 
             # Try to detect if the term is part of the SELECT, FROM or WHERE
             if type(term) is Token:
-                if term.value.upper() in ["SELECT", "FROM", "WHERE", "ORDER"]:
+                if term.value.upper() in parts_identifier:
                     expected_part = parts_identifier[term.value.upper()]
             elif type(term) is Where:
                 expected_part = WHERE_PART
@@ -175,6 +265,16 @@ class QueryParser(object):
                     query.attributes = ["*"]
                 elif term.value == "LEFT OUTER JOIN":
                     query.outer_join_models = query.models[:]
+                elif expected_part in [LIMIT_PART, OFFSET_PART] and \
+                        term.ttype in [Name.Placeholder, Number.Integer]:
+                    if term.ttype is Name.Placeholder:
+                        value = Placeholder(term.value[1:])
+                    else:
+                        value = Constant(int(term.value), term.value)
+                    if expected_part == LIMIT_PART:
+                        query.limit = value
+                    else:
+                        query.offset = value
                 else:
                     pass
             elif type(term) is IdentifierList and expected_part == SELECT_PART:
@@ -185,6 +285,14 @@ class QueryParser(object):
                 self.parse_from_identifier_list(term, query)
             elif type(term) is Identifier and expected_part == FROM_PART:
                 self.parse_from_identifier(term, query)
+            elif type(term) is IdentifierList and expected_part == GROUP_PART:
+                self.parse_group_identifier_list(term, query)
+            elif type(term) is Identifier and expected_part == GROUP_PART:
+                self.parse_group_identifier(term, query)
+            elif type(term) is IdentifierList and expected_part == ORDER_PART:
+                self.parse_order_identifier_list(term, query)
+            elif type(term) is Identifier and expected_part == ORDER_PART:
+                self.parse_order_identifier(term, query)
             elif type(term) is Where and expected_part == WHERE_PART:
                 self.parse_where_clause(term, query)
             elif type(term) is Comparison and expected_part == FROM_PART:
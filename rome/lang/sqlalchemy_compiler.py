@@ -0,0 +1,302 @@
+"""SQLAlchemy compiler module.
+
+This module contains a compiler that builds the tree representation of a query (an instance of
+QueryParserResult) directly from the expression tree of a SQLAlchemy query, without rendering it
+as a SQL text that would have to be parsed again. Literal values are replaced by typed
+placeholders, and the where clauses and joining clauses are made of the expressions defined in
+the 'rome.lang.expression' module.
+
+Queries that use constructs not supported by this compiler raise an UnsupportedExpression
+exception: such queries should be parsed with the 'QueryParser' of the 'rome.lang.sql_parser'
+module.
+
+"""
+
+from sqlalchemy import util
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import (BinaryExpression, BindParameter, BooleanClauseList,
+                                     ClauseList, ColumnClause, False_, Grouping, Label, Null,
+                                     True_, UnaryExpression, _anonymous_label,
+                                     _textual_label_reference)
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.selectable import Alias, Join, Select, ScalarSelect, TableClause
+
+from rome.core.orm.utils import LITERAL_DIALECT
+from rome.lang.expression import (BinaryComparison, BooleanClause, ColumnReference, Constant,
+                                  FunctionCall, Negation, Ordering, Placeholder, ValueList,
+                                  Variable)
+from rome.lang.sql_parser import QueryParserResult
+
+COMPARISON_OPERATORS = {
+    operators.eq: "=",
+    operators.ne: "!=",
+    operators.lt: "<",
+    operators.le: "<=",
+    operators.gt: ">",
+    operators.ge: ">=",
+    operators.in_op: "IN",
+    operators.notin_op: "NOT IN",
+    operators.is_: "IS",
+    operators.isnot: "IS NOT",
+}
+
+ORDERING_OPERATORS = {
+    operators.asc_op: False,
+    operators.desc_op: True,
+}
+
+BOOLEAN_OPERATORS = {
+    operators.and_: "AND",
+    operators.or_: "OR",
+}
+
+
+class UnsupportedExpression(Exception):
+
+    """Raised when a query contains a construct that cannot be compiled."""
+
+    pass
+
+
+class QueryCompiler(object):
+
+    def __init__(self):
+        self.preparer = LITERAL_DIALECT.identifier_preparer
+        self.parameters = {}
+        self.parameter_types = {}
+        self.parameters_count = 0
+        self.subqueries_count = 0
+        self.anonymous_names = util.PopulateDict(self._anonymous_name)
+        self.selectable_names = {}
+        self.allow_function_calls = False
+
+    def _anonymous_name(self, key):
+        # Same naming scheme as SQLAlchemy's compiler: '<name>_<n>'
+        (_, derived) = key.split(" ", 1)
+        counter = self.anonymous_names.get(derived, 1)
+        self.anonymous_names[derived] = counter + 1
+        return "%s_%s" % (derived, counter)
+
+    def selectable_name(self, selectable):
+        if selectable not in self.selectable_names:
+            name = selectable.name
+            if isinstance(name, _anonymous_label):
+                name = name.apply_map(self.anonymous_names)
+            self.selectable_names[selectable] = name
+        return self.selectable_names[selectable]
+
+    def compile_column(self, column):
+        table = column.table
+        if isinstance(table, Alias):
+            table = table.original
+            if not isinstance(table, TableClause):
+                raise UnsupportedExpression("Columns of sub queries are not supported")
+            table_name = self.selectable_name(column.table)
+        elif isinstance(table, TableClause):
+            table_name = self.selectable_name(table)
+        else:
+            raise UnsupportedExpression("Column '%s' does not belong to a table" % (column))
+        text = "%s.%s" % (self.preparer.quote(table_name), column.name)
+        return ColumnReference(table_name, column.name, text)
+
+    def compile_placeholder(self, bind):
+        self.parameters_count += 1
+        name = "param_%d" % (self.parameters_count)
+        self.parameters[name] = bind.effective_value
+        self.parameter_types[name] = bind.type
+        return Placeholder(name, bind.type)
+
+    def compile_subquery(self, select, query):
+        self.subqueries_count += 1
+        name = "__subquery_%d__" % (self.subqueries_count)
+        query.variables[name] = self.compile_select(select)
+        return Variable(name)
+
+    def compile_operand(self, element, query):
+        if isinstance(element, Label):
+            element = element.element
+        if isinstance(element, ScalarSelect):
+            element = element.element
+        if isinstance(element, Alias) and isinstance(element.original, Select):
+            element = element.original
+        if isinstance(element, Grouping):
+            element = element.element
+        if isinstance(element, ColumnClause) and not element.is_literal:
+            return self.compile_column(element)
+        if isinstance(element, BindParameter):
+            return self.compile_placeholder(element)
+        if isinstance(element, Null):
+            return Constant(None, "NULL")
+        if isinstance(element, (True_, False_)):
+            return Constant(isinstance(element, True_),
+                            "true" if isinstance(element, True_) else "false")
+        if isinstance(element, Select):
+            return self.compile_subquery(element, query)
+        if isinstance(element, FunctionElement) and self.allow_function_calls:
+            arguments = element.clauses.clauses
+            if len(arguments) != 1:
+                raise UnsupportedExpression("Unsupported function call '%s'" % (element.name))
+            return FunctionCall(element.name, self.compile_operand(arguments[0], query))
+        if isinstance(element, ClauseList):
+            return ValueList(map(lambda x: self.compile_operand(x, query), element.clauses))
+        raise UnsupportedExpression("Unsupported operand '%s'" % (type(element).__name__))
+
+    def compile_expression(self, element, query):
+        if isinstance(element, Grouping):
+            return self.compile_expression(element.element, query)
+        if isinstance(element, BooleanClauseList):
+            if element.operator not in BOOLEAN_OPERATORS:
+                raise UnsupportedExpression("Unsupported operator '%s'" % (element.operator))
+            operands = filter(lambda x: not isinstance(x, True_), element.clauses)
+            operands = map(lambda x: self.compile_expression(x, query), operands)
+            if len(operands) == 1:
+                return operands[0]
+            return BooleanClause(BOOLEAN_OPERATORS[element.operator], operands)
+        if isinstance(element, BinaryExpression):
+            if element.operator not in COMPARISON_OPERATORS:
+                raise UnsupportedExpression("Unsupported operator '%s'" % (element.operator))
+            left = self.compile_operand(element.left, query)
+            right = self.compile_operand(element.right, query)
+            return BinaryComparison(left, COMPARISON_OPERATORS[element.operator], right)
+        if isinstance(element, UnaryExpression) and element.operator is operators.inv:
+            return Negation(self.compile_expression(element.element, query))
+        if isinstance(element, (True_, False_)):
+            return self.compile_operand(element, query)
+        raise UnsupportedExpression("Unsupported expression '%s'" % (type(element).__name__))
+
+    def compile_conjuncts(self, element, query):
+        if isinstance(element, Grouping):
+            return self.compile_conjuncts(element.element, query)
+        if isinstance(element, BooleanClauseList) and element.operator is operators.and_:
+            result = []
+            for clause in element.clauses:
+                result += self.compile_conjuncts(clause, query)
+            return result
+        if isinstance(element, True_):
+            return []
+        return [self.compile_expression(element, query)]
+
+    def compile_from(self, from_, query, optional_labels, optional=False):
+        # The labels of the tables on the right side of an outer join are optional: rows of the
+        # other tables are kept when they have no matching object in these tables
+        if isinstance(from_, Join):
+            self.compile_from(from_.left, query, optional_labels, optional)
+            self.compile_from(from_.right, query, optional_labels, optional or from_.isouter)
+            query.joining_clauses += self.compile_conjuncts(from_.onclause, query)
+        elif isinstance(from_, Alias) and isinstance(from_.original, TableClause):
+            alias_name = self.selectable_name(from_)
+            query.models += [from_.original.name]
+            query.aliases[alias_name] = from_.original.name
+            if optional:
+                optional_labels += [alias_name]
+        elif isinstance(from_, TableClause):
+            query.models += [self.selectable_name(from_)]
+            if optional:
+                optional_labels += [self.selectable_name(from_)]
+        else:
+            raise UnsupportedExpression("Unsupported selectable '%s'" % (type(from_).__name__))
+
+    def compile_attribute(self, column, query):
+        if isinstance(column, Label):
+            column = column.element
+        if isinstance(column, FunctionElement):
+            arguments = column.clauses.clauses
+            if len(arguments) != 1:
+                raise UnsupportedExpression("Unsupported function call '%s'" % (column.name))
+            query.function_calls[len(query.attributes)] = column.name
+            column = arguments[0]
+        if not isinstance(column, ColumnClause) or column.is_literal:
+            raise UnsupportedExpression("Unsupported column '%s'" % (type(column).__name__))
+        reference = self.compile_column(column)
+        query.attributes += ["%s.%s" % (self.preparer.quote(reference.table),
+                                        self.preparer.quote(column.name))]
+
+    def resolve_label(self, name, select):
+        # Textual sort keys (such as asc("id")) designate a selected column, or else a column of
+        # one of the tables of the query.
+        candidates = []
+        for column in select._raw_columns:
+            if isinstance(column, TableClause):
+                candidates += list(column.columns)
+            else:
+                candidates += [column]
+        for column in candidates:
+            if isinstance(column, Label) and column.name == name:
+                return column.element
+            if isinstance(column, ColumnClause) and column.name == name:
+                return column
+        for from_ in select.froms:
+            for column in from_.columns:
+                if column.name == name:
+                    return column
+        raise UnsupportedExpression("Unknown sort key '%s'" % (name))
+
+    def compile_ordering(self, element, select):
+        descending = False
+        if isinstance(element, UnaryExpression) and element.modifier is not None:
+            if element.modifier not in ORDERING_OPERATORS:
+                raise UnsupportedExpression("Unsupported ordering '%s'" % (element.modifier))
+            descending = ORDERING_OPERATORS[element.modifier]
+            element = element.element
+        if isinstance(element, Label):
+            element = element.element
+        if isinstance(element, _textual_label_reference):
+            element = self.resolve_label(element.element, select)
+        if not isinstance(element, ColumnClause) or element.is_literal:
+            raise UnsupportedExpression("Unsupported sort key '%s'" % (type(element).__name__))
+        return Ordering(self.compile_column(element), descending)
+
+    def compile_select(self, select):
+        query = QueryParserResult()
+        for column in select._raw_columns:
+            if isinstance(column, TableClause):
+                for table_column in column.columns:
+                    self.compile_attribute(table_column, query)
+            else:
+                self.compile_attribute(column, query)
+        optional_labels = []
+        for from_ in select.froms:
+            self.compile_from(from_, query, optional_labels)
+        if len(optional_labels) > 0:
+            labels = query.models + sorted(query.aliases.keys())
+            query.outer_join_models = filter(lambda x: x not in optional_labels, labels)
+        if select._whereclause is not None:
+            conjuncts = self.compile_conjuncts(select._whereclause, query)
+            if len(conjuncts) == 1:
+                query.where_clauses += conjuncts
+            elif len(conjuncts) > 1:
+                query.where_clauses += [BooleanClause("AND", conjuncts)]
+        for clause in select._group_by_clause.clauses:
+            if isinstance(clause, Label):
+                clause = clause.element
+            if not isinstance(clause, ColumnClause) or clause.is_literal:
+                raise UnsupportedExpression("Unsupported group key '%s'" % (type(clause).__name__))
+            query.group_by += [self.compile_column(clause)]
+        if select._having is not None:
+            # Aggregate functions are only allowed in HAVING clauses
+            self.allow_function_calls = True
+            query.having = self.compile_expression(select._having, query)
+            self.allow_function_calls = False
+        for clause in select._order_by_clause.clauses:
+            query.order_by += [self.compile_ordering(clause, select)]
+        if select._limit_clause is not None:
+            query.limit = self.compile_operand(select._limit_clause, query)
+        if select._offset_clause is not None:
+            query.offset = self.compile_operand(select._offset_clause, query)
+        return query
+
+    def compile(self, statement):
+        """
+        Compile a SQLAlchemy query into a query tree.
+        :param statement: a SQLAlchemy query or select statement
+        :return: a tuple (query_tree, parameters, parameter_types), where parameters is a dict that
+        associates the name of each placeholder of the tree with its value, and parameter_types a
+        dict that associates the name of each placeholder with the SQLAlchemy type of its value
+        """
+        import sqlalchemy.orm
+        if isinstance(statement, sqlalchemy.orm.Query):
+            statement = statement.selectable
+        if not isinstance(statement, Select):
+            raise UnsupportedExpression("Unsupported statement '%s'" % (type(statement).__name__))
+        query_tree = self.compile_select(statement)
+        return query_tree, self.parameters, self.parameter_types
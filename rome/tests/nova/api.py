@@ -675,13 +675,12 @@ def _compute_node_fetchall(context, filters=None, limit=None, marker=None):
         except exception.ComputeHostNotFound:
             raise exception.MarkerNotFound(marker=marker)
         query = query.filter(models.ComputeNode.id > marker)
-
-    results = query.all()
+    query = query.order_by(asc(models.ComputeNode.id))
 
     if limit is not None:
-        results = results[0:limit]
+        query = query.limit(limit)
 
-    return results
+    return query.all()
 
 
 @pick_context_manager_reader
@@ -1303,20 +1302,14 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
 
     network_or_none = or_(models.FixedIp.network_id == network_id,
                           models.FixedIp.network_id == null())
-    fixed_ip_refs = model_query(context, models.FixedIp, read_deleted="no").\
+    fixed_ip_ref = model_query(context, models.FixedIp, read_deleted="no").\
                            filter(network_or_none).\
                            filter_by(reserved=False).\
                            filter_by(instance_uuid=None).\
                            filter_by(host=None).\
                            filter_by(leased=False).\
-                           all()
-
-    fixed_ip_refs = sorted(fixed_ip_refs, key=lambda x: x.updated_at)
-
-    if len(fixed_ip_refs) > 0:
-        fixed_ip_ref = fixed_ip_refs[0]
-    else:
-        fixed_ip_ref = None
+                           order_by(asc(models.FixedIp.updated_at)).\
+                           first()
 
     if not fixed_ip_ref:
         raise exception.NoMoreFixedIps(net=network_id)
@@ -30,6 +30,7 @@ from sqlalchemy import orm
 from sqlalchemy import ForeignKey, DateTime, Boolean, Text, Float
 
 from nova.db.sqlalchemy import types
+from rome.utils.secondary_index_decorator import secondary_index_decorator
 
 CONF = cfg.CONF
 BASE = declarative_base()
@@ -193,6 +194,8 @@ class Certificate(BASE, NovaBase, models.SoftDeleteMixin):
     file_name = Column(String(255))
 
 
+@secondary_index_decorator("uuid")
+@secondary_index_decorator("host")
 class Instance(BASE, NovaBase, models.SoftDeleteMixin):
     """Represents a guest VM."""
     __tablename__ = 'instances'
@@ -624,6 +627,8 @@ class BlockDeviceMapping(BASE, NovaBase, models.SoftDeleteMixin):
     tag = Column(String(255))
 
 
+@secondary_index_decorator("instance_uuid")
+@secondary_index_decorator("security_group_id")
 class SecurityGroupInstanceAssociation(BASE, NovaBase, models.SoftDeleteMixin):
     __tablename__ = 'security_group_instance_association'
     __table_args__ = (
@@ -849,6 +854,7 @@ class VirtualInterface(BASE, NovaBase, models.SoftDeleteMixin):
 
 
 # TODO(vish): can these both come from the same baseclass?
+@secondary_index_decorator("address")
 class FixedIp(BASE, NovaBase, models.SoftDeleteMixin):
     """Represents a fixed IP for an instance."""
     __tablename__ = 'fixed_ips'
@@ -1092,6 +1098,8 @@ class Cell(BASE, NovaBase, models.SoftDeleteMixin):
 
 # NOTE(alaski): This table exists in the nova_api database and its usage here
 # is deprecated.
+@secondary_index_decorator("host")
+@secondary_index_decorator("aggregate_id")
 class AggregateHost(BASE, NovaBase, models.SoftDeleteMixin):
     """Represents a host that is member of an aggregate."""
     __tablename__ = 'aggregate_hosts'
@@ -0,0 +1,79 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql.selectable import Exists
+from sqlalchemy.sql.functions import count, max, min, sum
+
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+from rome.core.session.utils import ObjectAttributeRefresher
+
+Base = declarative_base()
+
+
+class Usage(Base):
+    __tablename__ = "AggregatesUsages"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(String)
+    in_use = Column(Integer)
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Usage).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 9):
+        usage = Usage()
+        usage.id = i
+        usage.project_id = "project%s" % (i % 2)
+        usage.in_use = i * 10 if i != 4 else None
+        session.add(usage)
+    session.commit()
+
+
+class TestAggregates(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_count_and_has_rows_do_not_build_objects(self):
+        with mock.patch.object(ObjectAttributeRefresher, "refresh") as refresh:
+            self.assertEqual(Query(Usage).count(), 8)
+            self.assertEqual(Query(Usage).filter(Usage.project_id == "project1").count(), 4)
+            self.assertEqual(Query(Usage).filter(Usage.project_id == "project2").count(), 0)
+            self.assertTrue(Query(Usage).filter(Usage.id > 7).has_rows())
+            self.assertFalse(Query(Usage).filter(Usage.id > 8).has_rows())
+            self.assertEqual(refresh.call_count, 0)
+        # exists() keeps the semantics of SQLAlchemy
+        self.assertIsInstance(Query(Usage).exists(), Exists)
+
+    def test_aggregates(self):
+        def value(function, project_id):
+            query = Query(function(Usage.in_use)).filter(Usage.project_id == project_id)
+            return query.all()[0][0]
+        self.assertEqual(map(lambda x: value(x, "project0"), [count, sum, min, max]),
+                         [3, 160, 20, 80])
+        self.assertEqual(map(lambda x: value(x, "project2"), [count, sum, min, max]),
+                         [0, None, None, None])
+
+
+    def test_group_by_and_having(self):
+        def rows(query):
+            return sorted(map(lambda x: tuple(x[0]), query.all()))
+        query = Query(Usage.project_id, count(Usage.in_use), sum(Usage.in_use), max(Usage.id))
+        self.assertEqual(rows(query.group_by(Usage.project_id)),
+                         [("project0", 3, 160, 8), ("project1", 4, 160, 7)])
+        self.assertEqual(rows(query.group_by(Usage.project_id).having(count(Usage.in_use) > 3)),
+                         [("project1", 4, 160, 7)])
+        self.assertEqual(rows(query.filter(Usage.id > 8).group_by(Usage.project_id)), [])
+        query = Query(Usage.project_id, Usage.in_use, count(Usage.id))
+        self.assertEqual(len(query.group_by(Usage.project_id, Usage.in_use).all()), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
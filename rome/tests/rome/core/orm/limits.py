@@ -0,0 +1,65 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
+
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+
+Base = declarative_base()
+
+
+class Node(Base):
+    __tablename__ = "LimitsNodes"
+
+    id = Column(Integer, primary_key=True)
+    host = Column(String)
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Node).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 11):
+        node = Node()
+        node.id = i
+        node.host = "host%s" % (i % 2)
+        session.add(node)
+    session.commit()
+
+
+class TestLimits(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_limit_and_offset(self):
+        self.assertEqual(len(Query(Node).limit(3).all()), 3)
+        self.assertEqual(len(Query(Node).filter(Node.host == "host1").limit(10).all()), 5)
+        self.assertEqual(len(Query(Node).offset(8).all()), 2)
+        self.assertEqual(len(Query(Node).limit(4).offset(8).all()), 2)
+        self.assertEqual(len(Query(Node).limit(0).all()), 0)
+        all_ids = map(lambda x: x.id, Query(Node).all())
+        self.assertEqual(map(lambda x: x.id, Query(Node).limit(3).offset(2).all()),
+                         all_ids[2:5])
+
+    def test_first_and_one_build_few_objects(self):
+        from rome.core.session.utils import ObjectAttributeRefresher
+        with mock.patch.object(ObjectAttributeRefresher, "refresh_all") as refresh_all:
+            node = Query(Node).filter(Node.host == "host0").first()
+            self.assertEqual(node.host, "host0")
+            self.assertEqual(len(refresh_all.call_args[0][0]), 1)
+        with mock.patch.object(ObjectAttributeRefresher, "refresh_all") as refresh_all:
+            self.assertRaises(MultipleResultsFound, Query(Node).one)
+            self.assertEqual(len(refresh_all.call_args[0][0]), 2)
+        self.assertRaises(NoResultFound, Query(Node).filter(Node.host == "host2").one)
+        self.assertEqual(Query(Node).filter(Node.id == 4).one().id, 4)
+        self.assertIsNone(Query(Node).filter(Node.host == "host2").first())
+
+
+if __name__ == '__main__':
+    unittest.main()
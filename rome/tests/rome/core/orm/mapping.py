@@ -0,0 +1,94 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, ForeignKey, Integer, String, orm
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
+from sqlalchemy.orm.interfaces import MANYTOONE, ONETOMANY
+
+from rome.core.orm.mapping import EntityMetadata, get_entity_metadata, get_mapping_registry
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+
+Base = declarative_base()
+
+
+class Owner(Base):
+    __tablename__ = "MappingOwners"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Pet(Base):
+    __tablename__ = "MappingPets"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, default="rex")
+    owner_id = Column(Integer, ForeignKey("MappingOwners.id"))
+
+    owner = relationship(Owner, backref=orm.backref("pets"), foreign_keys=owner_id)
+
+
+class TestMapping(unittest.TestCase):
+
+    def test_entity_metadata(self):
+        metadata = get_entity_metadata(Pet)
+        self.assertEqual(metadata.table_name, "MappingPets")
+        self.assertEqual(metadata.column_names, ["id", "name", "owner_id"])
+        self.assertEqual(sorted(metadata.column_attributes), ["id", "name", "owner_id"])
+        self.assertIs(type(metadata.column_types["owner_id"]), Integer)
+        self.assertEqual(map(lambda x: x.name, metadata.primary_key_components), ["id"])
+        self.assertEqual(map(lambda x: (x.name, x.direction), metadata.relationships),
+                         [("owner", MANYTOONE)])
+        self.assertIs(get_entity_metadata(Pet), metadata)
+
+    def test_backrefs_are_registered(self):
+        relationships = get_entity_metadata(Owner).relationships
+        self.assertEqual(map(lambda x: (x.name, x.direction), relationships),
+                         [("pets", ONETOMANY)])
+        (left, right) = relationships[0].local_remote_pairs[0]
+        self.assertEqual((left.name, right.name), ("id", "owner_id"))
+
+    def test_entity_classes(self):
+        entity_classes = get_mapping_registry().get_entity_classes(Base._decl_class_registry)
+        self.assertIs(entity_classes["MappingPets"], Pet)
+        self.assertIs(entity_classes["MappingOwners"], Owner)
+
+    def test_new_mappers_clear_the_registry(self):
+        metadata = get_entity_metadata(Owner)
+
+        class Toy(Base):
+            __tablename__ = "MappingToys"
+
+            id = Column(Integer, primary_key=True)
+            owner_id = Column(Integer, ForeignKey("MappingOwners.id"))
+
+            owner = relationship(Owner, backref=orm.backref("toys"), foreign_keys=owner_id)
+
+        self.assertIsNot(get_entity_metadata(Owner), metadata)
+        self.assertEqual(sorted(map(lambda x: x.name, get_entity_metadata(Owner).relationships)),
+                         ["pets", "toys"])
+        entity_classes = get_mapping_registry().get_entity_classes(Base._decl_class_registry)
+        self.assertIs(entity_classes["MappingToys"], Toy)
+
+    def test_metadata_is_built_once(self):
+        session = Session()
+        for obj in Query(Pet).all():
+            session.delete(obj)
+        session.commit()
+        get_entity_metadata(Pet)
+        with mock.patch.object(EntityMetadata, "__init__") as init:
+            session = Session()
+            for i in range(1, 4):
+                pet = Pet()
+                pet.id = i
+                session.add(pet)
+            session.commit()
+            pets = Query(Pet).all()
+            self.assertEqual(init.call_count, 0)
+        self.assertEqual(map(lambda x: x.name, pets), ["rex", "rex", "rex"])
+
+
+if __name__ == '__main__':
+    unittest.main()
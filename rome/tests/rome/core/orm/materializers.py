@@ -0,0 +1,94 @@
+import datetime
+import unittest
+
+import netaddr
+import pytz
+from sqlalchemy import Column, DateTime, Integer, PickleType, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.dataformat.json import Decoder, Encoder
+from rome.core.orm.mapping import get_mapping_registry
+from rome.core.orm.materializers import column_decoder, get_materializer
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+
+Base = declarative_base()
+
+
+class Server(Base):
+    __tablename__ = "MaterializersServers"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    address = Column(String)
+    created_at = Column(DateTime)
+    extra = Column(PickleType)
+    comment_ = Column("comment", String)
+
+
+class TestMaterializers(unittest.TestCase):
+
+    def test_datetime_decoder(self):
+        encoder = Encoder()
+        decode = column_decoder(DateTime(), Decoder())
+        date = datetime.datetime(2016, 2, 29, 13, 37, 42, 123)
+        self.assertEqual(decode(encoder.encode(date)), date)
+        utc_date = pytz.utc.localize(date)
+        self.assertEqual(decode(encoder.encode(utc_date)), utc_date)
+        self.assertEqual(decode(encoder.encode(utc_date)).tzinfo, pytz.utc)
+        # Dates written in another format are parsed with strptime
+        self.assertEqual(decode({"simplify_strategy": "datetime", "timezone": "None",
+                                 "value": "2016-01-01 00:00:00.5"}),
+                         datetime.datetime(2016, 1, 1, 0, 0, 0, 500000))
+        self.assertIsNone(decode(None))
+
+    def test_scalar_decoder(self):
+        decode = column_decoder(String(), Decoder())
+        self.assertEqual(decode("foo"), "foo")
+        network = netaddr.IPNetwork("10.0.0.0/24")
+        self.assertEqual(decode(Encoder().encode(network)), network)
+
+    def test_materialize(self):
+        materializer = get_materializer(Server)
+        self.assertIs(get_materializer(Server), materializer)
+        date = datetime.datetime(2016, 1, 1)
+        server = materializer.materialize({"id": 1, "name": "server1",
+                                           "created_at": Encoder().encode(date),
+                                           "extra": {"a": [1, 2]}, "___version_number": 3})
+        self.assertIs(type(server), Server)
+        self.assertEqual((server.id, server.name, server.address, server.created_at),
+                         (1, "server1", None, date))
+        self.assertEqual(server.extra, {"a": [1, 2]})
+        self.assertEqual(getattr(server, "___version_number"), 3)
+
+    def test_clearing_the_mapping_registry_clears_materializers(self):
+        materializer = get_materializer(Server)
+        get_mapping_registry().clear()
+        self.assertIsNot(get_materializer(Server), materializer)
+
+    def test_materialized_objects_can_be_saved(self):
+        session = Session()
+        for obj in Query(Server).all():
+            session.delete(obj)
+        session.commit()
+        session = Session()
+        server = Server()
+        server.id = 1
+        server.name = "server1"
+        server.created_at = datetime.datetime(2016, 1, 1)
+        server.comment_ = "first server"
+        session.add(server)
+        session.commit()
+        server = Query(Server).first()
+        self.assertEqual(server.created_at, datetime.datetime(2016, 1, 1))
+        # Columns are materialized with the name of their attribute
+        self.assertEqual(server.comment_, "first server")
+        server.name = "server2"
+        session = Session()
+        session.add(server)
+        session.commit()
+        self.assertEqual(map(lambda x: x.name, Query(Server).all()), ["server2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import datetime
+import unittest
+
+from sqlalchemy import Column, DateTime, Integer, PickleType, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm import object_cache
+from rome.core.orm.object_cache import DecodedObjectCache, get_object_cache
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+from rome.driver import database_driver
+from rome.driver.memory.driver import MemoryDriver
+from rome.driver.result_cache import estimate_size
+
+Base = declarative_base()
+
+
+class Volume(Base):
+    __tablename__ = "ObjectCacheVolumes"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    created_at = Column(DateTime)
+    metadata_ = Column("metadata", PickleType)
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Volume).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 4):
+        volume = Volume()
+        volume.id = i
+        volume.name = "volume%s" % (i)
+        volume.created_at = datetime.datetime(2016, 1, i)
+        volume.metadata_ = {"tags": [i]}
+        session.add(volume)
+    session.commit()
+
+
+class TestDecodedObjectCache(unittest.TestCase):
+
+    def test_snapshots_are_immutable(self):
+        cache = DecodedObjectCache()
+        values = [1, "a", {"tags": [1]}]
+        cache.put(("T", 1, 1), ("id", "name", "extra"), values)
+        values[2]["tags"].append(2)
+        cached_values = cache.get(("T", 1, 1), ("id", "name", "extra"))
+        self.assertEqual(cached_values, [1, "a", {"tags": [1]}])
+        cached_values[2]["tags"].append(3)
+        self.assertEqual(cache.get(("T", 1, 1), ("id", "name", "extra")), [1, "a", {"tags": [1]}])
+        self.assertIsNone(cache.get(("T", 1, 2), ("id", "name", "extra")))
+        self.assertIsNone(cache.get(("T", 1, 1), ("id",)))
+        statistics = cache.statistics()
+        self.assertEqual((statistics["hits"], statistics["misses"], statistics["size"]), (2, 2, 1))
+
+    def test_size_limit(self):
+        size = estimate_size((1, "a"))
+        cache = DecodedObjectCache(max_bytes=2 * size)
+        for key in range(1, 4):
+            cache.put(("T", key, 1), ("id", "name"), [key, "a"])
+        cache.get(("T", 2, 1), ("id", "name"))
+        cache.put(("T", 4, 1), ("id", "name"), [4, "a"])
+        # The object 2 has been read, and is given a second chance
+        self.assertEqual(sorted(cache.snapshots.keys()), [("T", 2, 1), ("T", 4, 1)])
+        self.assertEqual(cache.statistics()["evictions"], 2)
+
+
+class TestObjectCacheQueries(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+        get_object_cache().clear()
+
+    def test_unmodified_objects_are_not_decoded(self):
+        self.assertEqual(map(lambda x: x.name, Query(Volume).all()),
+                         ["volume1", "volume2", "volume3"])
+        self.assertEqual(get_object_cache().statistics()["misses"], 3)
+        volumes = Query(Volume).all()
+        self.assertEqual(get_object_cache().statistics()["hits"], 3)
+        self.assertEqual(map(lambda x: x.created_at, volumes),
+                         map(lambda x: datetime.datetime(2016, 1, x), range(1, 4)))
+        # Values of the cache are not shared between objects
+        volumes[0].metadata_["tags"].append(4)
+        self.assertEqual(Query(Volume).filter(Volume.id == 1).one().metadata_, {"tags": [1]})
+
+    def test_modified_objects_are_decoded(self):
+        Query(Volume).all()
+        session = Session()
+        volume = Query(Volume).filter(Volume.id == 2).one()
+        volume.name = "renamed"
+        session.add(volume)
+        session.commit()
+        self.assertEqual(map(lambda x: x.name, Query(Volume).all()),
+                         ["volume1", "renamed", "volume3"])
+
+    def test_cache_is_bound_to_the_driver(self):
+        cache = get_object_cache()
+        driver = database_driver.DRIVER
+        database_driver.DRIVER = MemoryDriver()
+        try:
+            self.assertIsNot(get_object_cache(), cache)
+            self.assertEqual(get_object_cache().statistics()["size"], 0)
+        finally:
+            database_driver.DRIVER = driver
+            object_cache.OBJECT_CACHE_DRIVER = None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql.expression import asc, desc
+from oslo_db.sqlalchemy import utils as sqlalchemyutils
+
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+
+Base = declarative_base()
+
+
+class Host(Base):
+    __tablename__ = "OrderingHosts"
+
+    id = Column(Integer, primary_key=True)
+    zone = Column(String)
+    weight = Column(Integer)
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Host).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 11):
+        host = Host()
+        host.id = i
+        host.zone = "zone%s" % (i % 3)
+        host.weight = (i * 7) % 10 if i != 5 else None
+        session.add(host)
+    session.commit()
+
+
+def ids(objects):
+    return map(lambda x: x.id, objects)
+
+
+class TestOrdering(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_order_by(self):
+        self.assertEqual(ids(Query(Host).order_by(Host.id.desc()).all()), range(10, 0, -1))
+        self.assertEqual(ids(Query(Host).order_by(asc("id")).all()), range(1, 11))
+        # NULL values are smaller than any other value
+        self.assertEqual(ids(Query(Host).order_by(Host.weight).all()),
+                         [5, 10, 3, 6, 9, 2, 8, 1, 4, 7])
+
+    def test_multiple_sort_keys(self):
+        hosts = Query(Host).order_by(asc(Host.zone), desc(Host.id)).all()
+        self.assertEqual(ids(hosts), [9, 6, 3, 10, 7, 4, 1, 8, 5, 2])
+
+    def test_top_k(self):
+        self.assertEqual(ids(Query(Host).order_by(Host.id.desc()).limit(3).all()), [10, 9, 8])
+        self.assertEqual(ids(Query(Host).order_by(Host.id.desc()).limit(3).offset(2).all()),
+                         [8, 7, 6])
+        self.assertEqual(Query(Host).order_by(desc(Host.weight)).first().id, 7)
+
+    def test_marker_pagination(self):
+        pages = []
+        marker = None
+        while True:
+            query = sqlalchemyutils.paginate_query(Query(Host), Host, 4, ["zone", "id"],
+                                                   marker=marker, sort_dirs=["asc", "desc"])
+            page = query.all()
+            if len(page) == 0:
+                break
+            pages += [ids(page)]
+            marker = page[-1]
+        self.assertEqual(pages, [[9, 6, 3, 10], [7, 4, 1, 8], [5, 2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.plan_cache import QueryPlanCache
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+
+Base = declarative_base()
+
+
+class Fruit(Base):
+    __tablename__ = "PlanCacheFruits"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    color = Column(String)
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Fruit).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for (i, (name, color)) in enumerate([("apple", "red"), ("banana", "yellow"),
+                                         ("cherry", "red"), ("lemon", "yellow")]):
+        fruit = Fruit()
+        fruit.id = i + 1
+        fruit.name = name
+        fruit.color = color
+        session.add(fruit)
+    session.commit()
+
+
+class TestPlanCache(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_queries_with_same_shape_share_plan(self):
+        cache = QueryPlanCache(size_limit=10)
+        (plan_1, parameters_1) = cache.get_plan(Query(Fruit).filter(Fruit.color == "red").sa_query)
+        (plan_2, parameters_2) = cache.get_plan(Query(Fruit).filter(Fruit.color == "yellow").sa_query)
+        (plan_3, _) = cache.get_plan(Query(Fruit).filter(Fruit.name == "red").sa_query)
+        self.assertIs(plan_1, plan_2)
+        self.assertIsNot(plan_1, plan_3)
+        self.assertEqual(parameters_1.values(), ["red"])
+        self.assertEqual(parameters_2.values(), ["yellow"])
+        self.assertEqual(cache.statistics(), {"hits": 1, "misses": 2, "size": 2})
+
+    def test_least_recently_used_plans_are_evicted(self):
+        cache = QueryPlanCache(size_limit=2)
+        (plan_1, _) = cache.get_plan(Query(Fruit).filter(Fruit.color == "red").sa_query)
+        cache.get_plan(Query(Fruit).filter(Fruit.name == "apple").sa_query)
+        cache.get_plan(Query(Fruit).filter(Fruit.color == "yellow").sa_query)
+        cache.get_plan(Query(Fruit).filter(Fruit.id > 2).sa_query)
+        (plan_2, _) = cache.get_plan(Query(Fruit).filter(Fruit.color == "blue").sa_query)
+        self.assertIs(plan_1, plan_2)
+        self.assertEqual(cache.statistics(), {"hits": 2, "misses": 3, "size": 2})
+
+    def test_cached_plan_binds_new_values(self):
+        for (color, names) in [("red", ["apple", "cherry"]), ("yellow", ["banana", "lemon"]),
+                               ("red", ["apple", "cherry"]), ("blue", [])]:
+            fruits = Query(Fruit).filter(Fruit.color == color).all()
+            self.assertEqual(sorted(map(lambda x: x.name, fruits)), names)
+
+    def test_cached_plan_binds_in_values(self):
+        for ids in [[1], [2], [1, 3], [2, 4]]:
+            fruits = Query(Fruit).filter(Fruit.id.in_(ids)).all()
+            self.assertEqual(sorted(map(lambda x: x.id, fruits)), ids)
+        fruits = Query(Fruit).filter(~Fruit.id.in_([1])).all()
+        self.assertEqual(sorted(map(lambda x: x.id, fruits)), [2, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, ForeignKey, Integer, String, orm
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import joinedload, relationship
+
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+from rome.driver.database_driver import get_driver
+from rome.utils.secondary_index_decorator import secondary_index_decorator
+
+Base = declarative_base()
+
+
+class Team(Base):
+    __tablename__ = "RelationshipsTeams"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Tag(Base):
+    __tablename__ = "RelationshipsTags"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+@secondary_index_decorator("player_id")
+class PlayerTag(Base):
+    __tablename__ = "RelationshipsPlayerTags"
+
+    id = Column(Integer, primary_key=True)
+    player_id = Column(Integer, ForeignKey("RelationshipsPlayers.id"))
+    tag_id = Column(Integer, ForeignKey("RelationshipsTags.id"))
+
+
+class Player(Base):
+    __tablename__ = "RelationshipsPlayers"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    team_id = Column(Integer, ForeignKey("RelationshipsTeams.id"))
+
+    team = relationship(Team, backref=orm.backref("players"), foreign_keys=team_id)
+    tags = relationship(Tag, secondary="RelationshipsPlayerTags",
+                        primaryjoin="Player.id == PlayerTag.player_id",
+                        secondaryjoin="PlayerTag.tag_id == Tag.id")
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(PlayerTag).all() + Query(Tag).all() + Query(Player).all() + \
+            Query(Team).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 3):
+        team = Team()
+        team.id = i
+        team.name = "team%s" % (i)
+        session.add(team)
+    for i in range(1, 5):
+        player = Player()
+        player.id = i
+        player.name = "player%s" % (i)
+        player.team_id = 1 + i % 2
+        session.add(player)
+    for i in range(1, 4):
+        tag = Tag()
+        tag.id = i
+        tag.name = "tag%s" % (i)
+        session.add(tag)
+    for (i, (player_id, tag_id)) in enumerate([(1, 1), (1, 2), (2, 2), (3, 3)]):
+        player_tag = PlayerTag()
+        player_tag.id = i + 1
+        player_tag.player_id = player_id
+        player_tag.tag_id = tag_id
+        session.add(player_tag)
+    session.commit()
+
+
+class TestRelationships(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_get_many(self):
+        players = Query(Player).get_many([3, 42, 1, 3])
+        self.assertEqual(map(lambda x: x.id, players), [3, 1])
+        self.assertEqual(Query(Player).get_many([]), [])
+
+    def test_many_to_one_uses_keys(self):
+        player = Query(Player).filter(Player.name == "player1").first()
+        self.assertEqual(player.__dict__["team"].primary_keys, [2])
+        driver = get_driver()
+        with mock.patch.object(driver, "get_many", wraps=driver.get_many) as get_many:
+            self.assertEqual(player.team.name, "team2")
+            get_many.assert_any_call("RelationshipsTeams", [2])
+
+    def test_one_to_many_is_lazy_and_batched(self):
+        from rome.core.rows import rows
+        with mock.patch.object(rows, "get_objects", wraps=rows.get_objects) as get_objects:
+            teams = Query(Team).all()
+
+            def players_scans():
+                return filter(lambda x: x[0][0] == "RelationshipsPlayers",
+                              get_objects.call_args_list)
+            self.assertEqual(len(players_scans()), 0)
+            players = dict(map(lambda x: (x.name, sorted(map(lambda y: y.id, x.players))), teams))
+            self.assertEqual(len(players_scans()), 1)
+        self.assertEqual(players, {"team1": [2, 4], "team2": [1, 3]})
+
+    def test_many_to_one_is_lazy_and_batched(self):
+        players = Query(Player).all()
+        driver = get_driver()
+        with mock.patch.object(driver, "get_many", wraps=driver.get_many) as get_many:
+            teams = dict(map(lambda x: (x.id, x.team.name), players))
+            teams_gets = filter(lambda x: x[0][0] == "RelationshipsTeams",
+                                get_many.call_args_list)
+            self.assertEqual(len(teams_gets), 1)
+            self.assertEqual(sorted(teams_gets[0][0][1]), [1, 2])
+        self.assertEqual(teams, {1: "team2", 2: "team1", 3: "team2", 4: "team1"})
+
+    def test_proxy_bookkeeping_is_built_once(self):
+        player = Query(Player).filter(Player.name == "player1").first()
+        team = player.__dict__["team"]
+        self.assertIs(team._sa_instance_state, team._sa_instance_state)
+        self.assertIs(team._sa_adapter, team._sa_adapter)
+        self.assertFalse(team.is_loaded)
+
+    def test_eager_many_to_one_is_batched(self):
+        driver = get_driver()
+        with mock.patch.object(driver, "get_many", wraps=driver.get_many) as get_many:
+            players = Query(Player).options(joinedload("team")).all()
+            teams_gets = filter(lambda x: x[0][0] == "RelationshipsTeams",
+                                get_many.call_args_list)
+            self.assertEqual(len(teams_gets), 1)
+            self.assertEqual(sorted(teams_gets[0][0][1]), [1, 2])
+        teams = dict(map(lambda x: (x.id, x.__dict__["team"].name), players))
+        self.assertEqual(teams, {1: "team2", 2: "team1", 3: "team2", 4: "team1"})
+
+    def test_many_to_many_uses_index_and_keys(self):
+        from rome.core.rows import rows
+        players = Query(Player).all()
+        driver = get_driver()
+        with mock.patch.object(rows, "get_objects", wraps=rows.get_objects) as get_objects:
+            with mock.patch.object(driver, "get_many", wraps=driver.get_many) as get_many:
+                tags = dict(map(lambda x: (x.id, sorted(map(lambda y: y.name, x.tags))),
+                                players))
+                associations_scans = filter(lambda x: x[0][0] == "RelationshipsPlayerTags",
+                                            get_objects.call_args_list)
+                self.assertEqual(len(associations_scans), 1)
+                self.assertEqual(sorted(associations_scans[0][1]["hints"]),
+                                 [("player_id", 1), ("player_id", 2), ("player_id", 3),
+                                  ("player_id", 4)])
+                tags_gets = filter(lambda x: x[0][0] == "RelationshipsTags",
+                                   get_many.call_args_list)
+                self.assertEqual(len(tags_gets), 1)
+                self.assertEqual(sorted(tags_gets[0][0][1]), [1, 2, 3])
+        self.assertEqual(tags, {1: ["tag1", "tag2"], 2: ["tag2"], 3: ["tag3"], 4: []})
+
+    def test_many_to_many_saves_missing_associations(self):
+        from rome.core.session.utils import ObjectAttributeRefresher
+        player = Query(Player).filter(Player.name == "player4").first()
+        player.__dict__["tags"] = Query(Tag).filter(Tag.id.in_([1, 3])).all()
+        refresher = ObjectAttributeRefresher()
+        refresher.refresh(player)
+        self.assertEqual(len(Query(PlayerTag).filter(PlayerTag.player_id == 4).all()), 2)
+        from rome.core.session.session import Session as RomeSession
+        with mock.patch.object(RomeSession, "flush") as flush:
+            refresher.refresh(player)
+            self.assertEqual(flush.call_count, 0)
+        self.assertEqual(len(Query(PlayerTag).filter(PlayerTag.player_id == 4).all()), 2)
+        player = Query(Player).filter(Player.name == "player4").first()
+        self.assertEqual(sorted(map(lambda x: x.name, player.tags)), ["tag1", "tag3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
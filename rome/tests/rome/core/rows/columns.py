@@ -0,0 +1,134 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.query import Query
+from rome.core.rows.columns import ColumnFilter
+from rome.core.session.session import Session
+from rome.driver import database_driver
+from rome.driver.memory.columnar import ColumnarTable
+from rome.driver.memory.driver import MemoryDriver
+from rome.lang.expression import (BinaryComparison, BooleanClause, ColumnReference, Constant,
+                                  Negation, Placeholder, ValueList)
+
+Base = declarative_base()
+
+
+class Host(Base):
+    __tablename__ = "ColumnsHosts"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    vcpus = Column(Integer)
+
+
+def column(name):
+    return ColumnReference("T", name, "T.%s" % (name))
+
+
+def constant(value):
+    return Constant(value, repr(value))
+
+
+def selected_keys(table, expressions, parameters=None):
+    positions = ColumnFilter("T", expressions).bind(parameters)(table)
+    return sorted(map(lambda x: table.keys[x], positions))
+
+
+class TestColumnFilters(unittest.TestCase):
+
+    def setUp(self):
+        self.table = ColumnarTable()
+        for key in range(1, 7):
+            self.table[key] = {"id": key, "name": "host%s" % (key % 3) if key != 6 else None,
+                               "vcpus": key if key != 5 else None}
+
+    def test_comparisons(self):
+        self.assertEqual(selected_keys(self.table, [BinaryComparison(column("vcpus"), ">",
+                                                                     constant(2))]), [3, 4, 6])
+        self.assertEqual(selected_keys(self.table, [BinaryComparison(constant(2), ">",
+                                                                     column("vcpus"))]), [1])
+        # Strings compared with integer columns are converted to integers
+        self.assertEqual(selected_keys(self.table, [BinaryComparison(column("vcpus"), "=",
+                                                                     Placeholder("v"))],
+                                       {"v": "4"}), [4])
+        self.assertEqual(selected_keys(self.table, [BinaryComparison(column("name"), "!=",
+                                                                     constant("host1"))]),
+                         [2, 3, 5])
+        # A comparison with NULL is never TRUE
+        self.assertEqual(selected_keys(self.table, [BinaryComparison(column("vcpus"), "=",
+                                                                     constant(None))]), [])
+
+    def test_null_tests(self):
+        self.assertEqual(selected_keys(self.table, [BinaryComparison(column("vcpus"), "IS",
+                                                                     constant(None))]), [5])
+        self.assertEqual(selected_keys(self.table, [BinaryComparison(column("name"), "IS NOT",
+                                                                     constant(None))]),
+                         [1, 2, 3, 4, 5])
+        self.assertEqual(selected_keys(self.table, [BinaryComparison(column("missing"), "IS",
+                                                                     constant(None))]),
+                         [1, 2, 3, 4, 5, 6])
+
+    def test_in_lists(self):
+        in_list = BinaryComparison(column("name"), "IN",
+                                   ValueList([constant("host1"), constant(None)]))
+        self.assertEqual(selected_keys(self.table, [in_list]), [1, 4])
+        # NOT IN is never TRUE when the list contains NULL
+        not_in_list = BinaryComparison(column("name"), "NOT IN",
+                                       ValueList([constant("host1"), constant(None)]))
+        self.assertEqual(selected_keys(self.table, [not_in_list]), [])
+        not_in_list = BinaryComparison(column("vcpus"), "NOT IN",
+                                       ValueList([constant(1), constant("2")]))
+        self.assertEqual(selected_keys(self.table, [not_in_list]), [3, 4, 6])
+        # Strings are converted to the type of the column, as in equalities
+        in_list = BinaryComparison(column("vcpus"), "IN", ValueList([Placeholder("v")]))
+        for (value, keys) in [("04", [4]), (" 4", [4]), ("4.0", [])]:
+            self.assertEqual(selected_keys(self.table, [in_list], {"v": value}), keys)
+
+    def test_boolean_clauses(self):
+        expression = BooleanClause("OR", [
+            BinaryComparison(column("vcpus"), "<", constant(2)),
+            Negation(BinaryComparison(column("name"), "=", constant("host0")))])
+        self.assertEqual(selected_keys(self.table, [expression]), [1, 2, 4, 5])
+
+    def test_unsupported_comparisons_are_skipped(self):
+        # Strings of the column would be converted to numbers by the predicate of the table
+        expressions = [BinaryComparison(column("name"), "=", constant(2)),
+                       BinaryComparison(column("vcpus"), "<=", constant(3))]
+        self.assertEqual(selected_keys(self.table, expressions), [1, 2, 3])
+
+
+class TestColumnarQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = database_driver.DRIVER
+        database_driver.DRIVER = MemoryDriver(storage="columnar")
+        session = Session()
+        for i in range(1, 9):
+            host = Host()
+            host.id = i
+            host.name = "host%s" % (i % 4)
+            host.vcpus = i
+            session.add(host)
+        session.commit()
+
+    def tearDown(self):
+        database_driver.DRIVER = self.driver
+
+    def test_queries(self):
+        driver = database_driver.DRIVER
+        with mock.patch.object(driver, "getall_matching",
+                               wraps=driver.getall_matching) as getall_matching:
+            hosts = Query(Host).filter(Host.vcpus > 2).filter(Host.name.in_(["host1",
+                                                                             "host2"])).all()
+            self.assertEqual(getall_matching.call_count, 1)
+        self.assertEqual(sorted(map(lambda x: x.id, hosts)), [5, 6])
+        hosts = Query(Host).filter(Host.name == "host3").filter(Host.vcpus != 3).all()
+        self.assertEqual(map(lambda x: x.id, hosts), [7])
+        self.assertEqual(Query(Host).count(), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import datetime
+import unittest
+
+import mock
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.dataformat.json import Encoder
+from rome.core.orm.query import Query
+from rome.core.rows import frames
+from rome.core.rows.frames import ColumnFrameCache, get_frame_cache
+from rome.core.rows.tuples import filter_tuples
+from rome.core.session.session import Session
+from rome.lang.sqlalchemy_compiler import QueryCompiler, UnsupportedExpression
+
+Base = declarative_base()
+
+
+class Bucket(Base):
+    __tablename__ = "FramesBuckets"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    size = Column(Integer)
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Bucket).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 7):
+        bucket = Bucket()
+        bucket.id = i
+        bucket.name = "bucket%s" % (i % 2)
+        bucket.size = i
+        session.add(bucket)
+    session.commit()
+
+
+def ids(objects):
+    return sorted(map(lambda x: x.id, objects))
+
+
+class TestColumnFrameCache(unittest.TestCase):
+
+    def test_frames_are_validated_by_version(self):
+        cache = ColumnFrameCache()
+        objects = [{"id": 1, "x": 1}, {"id": 2, "x": None}, {"id": 1, "x": 1}]
+        frame = cache.get_frame("T", 1, ["x"], objects)
+        self.assertEqual(sorted(frame["x"]), [0, 1])
+        self.assertIs(cache.get_frame("T", 1, ["x"], objects[:1]), frame)
+        # Frames are completed with the objects they do not contain
+        frame = cache.get_frame("T", 1, ["x"], [{"id": 3, "x": 3}, objects[0]])
+        self.assertEqual(sorted(frame.index), [1, 2, 3])
+        frame = cache.get_frame("T", 2, ["x"], [{"id": 1, "x": 4}])
+        self.assertEqual(list(frame["x"]), [4])
+        self.assertEqual(cache.statistics(), {"hits": 1, "misses": 3, "size": 1})
+
+    def test_size_limit(self):
+        cache = ColumnFrameCache(size_limit=2)
+        for table_name in ["A", "B", "C"]:
+            cache.get_frame(table_name, 1, ["x"], [{"id": 1, "x": 1}])
+        self.assertEqual(sorted(map(lambda x: x[0], cache.frames)), ["B", "C"])
+
+    def test_filter_tuples(self):
+        date = Encoder().encode(datetime.datetime(2016, 1, 1))
+        tuples = [{"A": {"id": 1, "x": 1, "d": date}, "B": {"id": 1, "y": "a"}},
+                  {"A": {"id": 2, "x": 2, "d": None}, "B": None},
+                  {"A": {"id": 1, "x": 1, "d": date}, "B": {"id": 2, "y": "b"}}]
+        needed_columns = {"A": ["x", "d"], "B": ["y"]}
+        table_versions = {"A": ("A", 1), "B": ("B", 1)}
+        for versions in [None, table_versions, table_versions]:
+            self.assertEqual(filter_tuples(tuples, needed_columns, "A__x == 1 and B__y == \"b\"",
+                                           table_versions=versions), tuples[2:])
+            self.assertEqual(filter_tuples(tuples, needed_columns, "B__y == 0",
+                                           table_versions=versions), tuples[1:2])
+            self.assertEqual(filter_tuples(tuples, needed_columns,
+                                           "A__d == \"%s\"" % (date["value"]),
+                                           table_versions=versions), [tuples[0], tuples[2]])
+
+
+class TestFramesQueries(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+        get_frame_cache().clear()
+
+    def test_unmodified_tables_reuse_frames(self):
+        # Queries that cannot be compiled are parsed, and filtered with a pandas where clause
+        query = Query(Bucket)
+        with mock.patch.object(QueryCompiler, "compile", side_effect=UnsupportedExpression()), \
+                mock.patch("rome.core.rows.frames.build_column_frame",
+                           wraps=frames.build_column_frame) as build_column_frame:
+            self.assertEqual(ids(query.filter(Bucket.size > 2).all()), [3, 4, 5, 6])
+            self.assertEqual(ids(query.filter(Bucket.size > 4).all()), [5, 6])
+            self.assertEqual(build_column_frame.call_count, 1)
+            session = Session()
+            bucket = Bucket()
+            bucket.id = 7
+            bucket.size = 7
+            session.add(bucket)
+            session.commit()
+            self.assertEqual(ids(query.filter(Bucket.size > 4).all()), [5, 6, 7])
+            self.assertEqual(build_column_frame.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
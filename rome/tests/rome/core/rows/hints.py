@@ -0,0 +1,116 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.plan_cache import QueryPlanCache
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+from rome.driver import database_driver
+from rome.utils.secondary_index_decorator import secondary_index_decorator
+
+Base = declarative_base()
+
+
+class Shelf(Base):
+    __tablename__ = "HintsShelves"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+@secondary_index_decorator("label")
+class Jar(Base):
+    __tablename__ = "HintsJars"
+
+    id = Column(Integer, primary_key=True)
+    label = Column(String)
+    shelf_id = Column(Integer, ForeignKey("HintsShelves.id"))
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Jar).all() + Query(Shelf).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 3):
+        shelf = Shelf()
+        shelf.id = i
+        shelf.name = "shelf%s" % (i)
+        session.add(shelf)
+    for i in range(1, 7):
+        jar = Jar()
+        jar.id = i
+        jar.label = "jar%s" % (i)
+        jar.shelf_id = 1 + i % 2
+        session.add(jar)
+    session.commit()
+
+
+def hint_candidates(query):
+    (plan, parameters) = QueryPlanCache().get_plan(query.sa_query)
+    hints = []
+    for candidate in plan.hint_candidates:
+        hints += candidate.bind(parameters)
+    return sorted(map(lambda x: (x.table_name, x.attribute, x.value), hints))
+
+
+class TestHints(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_hint_candidates(self):
+        self.assertEqual(hint_candidates(Query(Jar).filter(Jar.id == 3)),
+                         [("HintsJars", "id", 3)])
+        self.assertEqual(hint_candidates(Query(Jar).filter(Jar.id.in_([2, 4]))
+                                         .filter(Jar.label == "jar2")),
+                         [("HintsJars", "id", 2), ("HintsJars", "id", 4),
+                          ("HintsJars", "label", "jar2")])
+        self.assertEqual(hint_candidates(Query(Jar).filter(Jar.id > 3)), [])
+        self.assertEqual(hint_candidates(Query(Jar).filter((Jar.id == 3) | (Jar.id == 4))), [])
+        self.assertEqual(hint_candidates(Query(Shelf).outerjoin(Jar, Shelf.id == Jar.shelf_id)
+                                         .filter(Jar.id == 1)), [])
+
+    def test_hints_are_given_to_driver(self):
+        from rome.core.rows import rows
+        with mock.patch.object(rows, "get_objects", wraps=rows.get_objects) as get_objects:
+            jars = Query(Jar).join(Shelf, Shelf.id == Jar.shelf_id)\
+                .filter(Jar.id.in_([2, 5])).filter(Jar.label != "jar5").all()
+            self.assertEqual(map(lambda x: x.id, jars), [2])
+            get_objects.assert_any_call("HintsJars", hints=[("id", 2), ("id", 5)])
+
+    def test_secondary_index_hints(self):
+        from rome.core.rows import rows
+        with mock.patch.object(rows, "get_objects", wraps=rows.get_objects) as get_objects:
+            jars = Query(Jar).filter(Jar.label == "jar3").filter(Jar.shelf_id == 2).all()
+            self.assertEqual(map(lambda x: x.id, jars), [3])
+            get_objects.assert_called_once_with("HintsJars", hints=[("label", "jar3")])
+        session = Session()
+        jar = Query(Jar).filter(Jar.id == 3).one()
+        jar.label = "jar7"
+        session.add(jar)
+        session.commit()
+        self.assertEqual(Query(Jar).filter(Jar.label == "jar3").all(), [])
+        self.assertEqual(map(lambda x: x.id, Query(Jar).filter(Jar.label == "jar7").all()), [3])
+
+    def test_hints_need_populated_secondary_indexes(self):
+        from rome.core.rows import rows
+        driver = database_driver.get_driver()
+        with mock.patch.object(driver, "is_secondary_index_populated", return_value=False), \
+                mock.patch.object(rows, "get_objects", wraps=rows.get_objects) as get_objects:
+            jars = Query(Jar).filter(Jar.label == "jar3").all()
+            self.assertEqual(map(lambda x: x.id, jars), [3])
+            self.assertEqual(get_objects.call_args[1].get("hints", []), [])
+
+    def test_hints_with_join(self):
+        jars = Query(Jar).join(Shelf, Shelf.id == Jar.shelf_id).filter(Shelf.id == 2).all()
+        self.assertEqual(sorted(map(lambda x: x.id, jars)), [1, 3, 5])
+        jars = Query(Jar).filter(Jar.id == "4").all()
+        self.assertEqual(map(lambda x: x.id, jars), [4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from rome.core.rows.joins import join_tables
+
+AUTHORS = [{"id": 1, "name": "a1"}, {"id": 2, "name": "a2"}, {"id": 3, "name": "a3"}]
+BOOKS = [{"id": 1, "author_id": 2}, {"id": 2, "author_id": 2}, {"id": 3, "author_id": 3},
+         {"id": 4, "author_id": None}]
+
+
+def ids(tuples, labels):
+    return sorted(map(lambda x: tuple(map(lambda l: x[l]["id"] if x[l] is not None else None,
+                                          labels)),
+                      tuples))
+
+
+class TestJoins(unittest.TestCase):
+
+    def test_inner_join(self):
+        for books in [BOOKS, BOOKS[:1]]:
+            tuples = join_tables({"Authors": AUTHORS, "Books": books},
+                                 [["Authors.id", "Books.author_id"]])
+            expected = filter(lambda x: x[0] is not None,
+                              map(lambda x: (x["author_id"], x["id"]), books))
+            self.assertEqual(ids(tuples, ["Authors", "Books"]), sorted(expected))
+
+    def test_left_outer_join(self):
+        for books in [BOOKS, BOOKS[:1], []]:
+            tuples = join_tables({"Authors": AUTHORS, "Books": books},
+                                 [["Authors.id", "Books.author_id"]],
+                                 optional_labels=["Books"])
+            matched = filter(lambda x: x[0] is not None,
+                             map(lambda x: (x["author_id"], x["id"]), books))
+            unmatched = map(lambda x: (x["id"], None),
+                            filter(lambda x: x["id"] not in map(lambda y: y[0], matched),
+                                   AUTHORS))
+            self.assertEqual(ids(tuples, ["Authors", "Books"]), sorted(matched + unmatched))
+
+    def test_outer_join_conditions(self):
+        condition = (set(["Authors", "Books"]), lambda x: x["Books"]["id"] >= x["Authors"]["id"])
+        for joining_pairs in [[["Authors.id", "Books.author_id"]], []]:
+            tuples = join_tables({"Authors": AUTHORS, "Books": BOOKS[:3]}, joining_pairs,
+                                 optional_labels=["Books"],
+                                 outer_join_conditions={"Books": condition})
+            expected = [(1, None), (2, 2), (3, 3)]
+            if len(joining_pairs) == 0:
+                expected = [(1, 1), (1, 2), (1, 3), (2, 2), (2, 3), (3, 3)]
+            self.assertEqual(ids(tuples, ["Authors", "Books"]), expected)
+
+    def test_cartesian_product_and_empty_tables(self):
+        tuples = join_tables({"Authors": AUTHORS[:2], "Books": BOOKS[:2]}, [])
+        self.assertEqual(ids(tuples, ["Authors", "Books"]), [(1, 1), (1, 2), (2, 1), (2, 2)])
+        self.assertEqual(join_tables({"Authors": AUTHORS, "Books": []},
+                                     [["Authors.id", "Books.author_id"]]), [])
+
+    def test_additional_joining_pair(self):
+        tuples = join_tables({"Authors": AUTHORS, "Books": BOOKS},
+                             [["Authors.id", "Books.author_id"], ["Authors.id", "Books.id"]])
+        self.assertEqual(ids(tuples, ["Authors", "Books"]), [(2, 2), (3, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.plan_cache import QueryPlanCache
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+
+Base = declarative_base()
+
+
+class Rack(Base):
+    __tablename__ = "LookupsRacks"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Host(Base):
+    __tablename__ = "LookupsHosts"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    deleted = Column(Integer, default=0)
+    rack_id = Column(Integer, ForeignKey("LookupsRacks.id"))
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Host).all(filter_deleted=False) + Query(Rack).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    rack = Rack()
+    rack.id = 1
+    rack.name = "rack1"
+    session.add(rack)
+    for i in range(1, 7):
+        host = Host()
+        host.id = i
+        host.name = "host%s" % (i % 2)
+        host.rack_id = 1
+        host.deleted = i if i == 6 else 0
+        session.add(host)
+    session.commit()
+
+
+def key_lookup(query):
+    (plan, _) = QueryPlanCache().get_plan(query.sa_query)
+    return plan.key_lookup
+
+
+class TestLookups(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_key_lookup_detection(self):
+        self.assertIsNotNone(key_lookup(Query(Host).filter_by(id=3)))
+        self.assertIsNotNone(key_lookup(Query(Host).filter(Host.id.in_([2, 4]))))
+        self.assertIsNotNone(key_lookup(Query(Host).filter(Host.id == 3)
+                                        .filter(Host.deleted == 0)))
+        self.assertIsNone(key_lookup(Query(Host).filter(Host.name == "host1")))
+        self.assertIsNone(key_lookup(Query(Host).filter(Host.id > 3)))
+        self.assertIsNone(key_lookup(Query(Host).filter((Host.id == 3) | (Host.id == 4))))
+        self.assertIsNone(key_lookup(Query(Host).filter(Host.id.notin_([2, 4]))))
+        self.assertIsNone(key_lookup(Query(Host).join(Rack, Rack.id == Host.rack_id)
+                                     .filter(Host.id == 3)))
+        self.assertIsNone(key_lookup(Query(Host).filter(Host.id == 3).order_by(Host.name)))
+
+    def test_key_lookup_skips_scans(self):
+        from rome.core.rows import rows
+        with mock.patch.object(rows, "get_objects") as get_objects:
+            self.assertEqual(Query(Host).filter_by(id=3).one().name, "host1")
+            hosts = Query(Host).filter(Host.id.in_([4, 2, 4, 42])).all()
+            self.assertEqual(map(lambda x: x.id, hosts), [4, 2])
+            self.assertEqual(get_objects.call_count, 0)
+
+    def test_key_lookup_criteria(self):
+        hosts = Query(Host).filter(Host.id.in_([1, 2, 3])).filter(Host.name == "host1").all()
+        self.assertEqual(map(lambda x: x.id, hosts), [1, 3])
+        self.assertEqual(Query(Host).filter(Host.id == "5").count(), 1)
+        self.assertEqual(Query(Host).filter(Host.id == 6).all(), [])
+        self.assertEqual(Query(Host).filter(Host.id == 6).all(filter_deleted=False), [])
+        query = Query(Host).filter(Host.id == 6)
+        query.read_deleted = "yes"
+        self.assertEqual(map(lambda x: x.id, query.all()), [6])
+        hosts = Query(Host).filter(Host.id.in_([1, 2, 3, 4])).limit(2).offset(1).all()
+        self.assertEqual(map(lambda x: x.id, hosts), [2, 3])
+
+    def test_get(self):
+        from rome.core.rows import rows
+        with mock.patch.object(rows, "get_objects") as get_objects:
+            self.assertEqual(Query(Host).get(4).name, "host0")
+            self.assertEqual(Query(Host).get((1,)).id, 1)
+            self.assertIsNone(Query(Host).get(42))
+            self.assertIsNone(Query(Host).get(6))
+            self.assertEqual(get_objects.call_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
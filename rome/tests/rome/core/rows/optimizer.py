@@ -0,0 +1,78 @@
+import unittest
+
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.query import Query
+from rome.core.rows.optimizer import estimate_selectivities, order_joins
+from rome.lang.sqlalchemy_compiler import QueryCompiler
+
+Base = declarative_base()
+
+
+class Network(Base):
+    __tablename__ = "networks"
+
+    id = Column(Integer, primary_key=True)
+
+
+class Instance(Base):
+    __tablename__ = "instances"
+
+    id = Column(Integer, primary_key=True)
+    host = Column(String)
+    uuid = Column(String)
+
+
+class FixedIp(Base):
+    __tablename__ = "fixed_ips"
+
+    id = Column(Integer, primary_key=True)
+    address = Column(String)
+    instance_uuid = Column(String, ForeignKey("instances.uuid"))
+    network_id = Column(Integer, ForeignKey("networks.id"))
+
+
+JOINING_PAIRS = [["fixed_ips.network_id", "networks.id"],
+                 ["fixed_ips.instance_uuid", "instances.uuid"]]
+
+
+def selectivities(query):
+    (query_tree, _, _) = QueryCompiler().compile(query.sa_query)
+    return estimate_selectivities(query_tree)
+
+
+class TestOptimizer(unittest.TestCase):
+
+    def test_selectivities(self):
+        estimates = selectivities(Query(FixedIp, Instance)
+                                  .filter(FixedIp.address == "10.0.0.2")
+                                  .filter(FixedIp.instance_uuid == Instance.uuid)
+                                  .filter(Instance.id.in_([1, 2])))
+        self.assertEqual(sorted(estimates.keys()), ["fixed_ips", "instances"])
+        self.assertEqual(estimates["fixed_ips"].estimate(1000), 100)
+        self.assertEqual(estimates["instances"].estimate(1000), 2)
+
+    def test_start_from_selective_side(self):
+        cardinalities = {"fixed_ips": 5000, "instances": 1000, "networks": 10}
+        (pairs, labels) = order_joins(cardinalities, JOINING_PAIRS)
+        self.assertEqual(labels, ["networks", "instances", "fixed_ips"])
+        self.assertEqual(pairs[0], ["networks.id", "fixed_ips.network_id"])
+
+        estimates = selectivities(Query(FixedIp).filter(FixedIp.address == "10.0.0.2"))
+        estimates["fixed_ips"].max_rows = 1
+        (pairs, labels) = order_joins(cardinalities, JOINING_PAIRS, selectivities=estimates)
+        self.assertEqual(labels[0], "fixed_ips")
+        self.assertEqual(map(lambda x: x[0].split(".")[0], pairs), ["fixed_ips", "fixed_ips"])
+
+    def test_optional_tables_are_joined_last(self):
+        cardinalities = {"fixed_ips": 5000, "instances": 1000, "networks": 10}
+        (pairs, labels) = order_joins(cardinalities, JOINING_PAIRS,
+                                      optional_labels=["networks"])
+        self.assertEqual(labels, ["instances", "fixed_ips", "networks"])
+        self.assertEqual(pairs, [["instances.uuid", "fixed_ips.instance_uuid"],
+                                 ["fixed_ips.network_id", "networks.id"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import unittest
+
+from sqlalchemy import Column, ForeignKey, Integer, String, and_, func, or_
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.plan_cache import QueryPlanCache
+from rome.core.orm.query import Query
+from rome.core.rows.predicates import Predicate
+from rome.core.session.session import Session
+from rome.lang.expression import (BinaryComparison, BooleanClause, ColumnReference, Constant,
+                                  Negation, Placeholder, ValueList)
+
+Base = declarative_base()
+
+
+class Box(Base):
+    __tablename__ = "PredicatesBoxes"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Item(Base):
+    __tablename__ = "PredicatesItems"
+
+    id = Column(Integer, primary_key=True)
+    box_id = Column(Integer, ForeignKey("PredicatesBoxes.id"))
+    color = Column(String)
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Item).all() + Query(Box).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 3):
+        box = Box()
+        box.id = i
+        box.name = "box%s" % (i)
+        session.add(box)
+    for i in range(1, 7):
+        item = Item()
+        item.id = i
+        item.box_id = 1 + i % 2
+        item.color = "red" if i % 3 == 0 else ("blue" if i % 3 == 1 else None)
+        session.add(item)
+    session.commit()
+
+
+def uses_pandas(query):
+    (plan, _) = QueryPlanCache().get_plan(query.sa_query)
+    return plan.tuples_plan.uses_pandas()
+
+
+def column(name):
+    return ColumnReference("T", name, "\"T\".%s" % (name))
+
+
+def matches(expression, obj, parameters=None):
+    return Predicate(expression).bind(parameters)({"T": obj})
+
+
+class TestPredicates(unittest.TestCase):
+
+    def test_null_comparisons(self):
+        equality = BinaryComparison(column("a"), "=", Placeholder("param_1"))
+        self.assertTrue(matches(equality, {"a": 1}, {"param_1": 1}))
+        self.assertFalse(matches(equality, {"a": None}, {"param_1": 1}))
+        # NOT (NULL = 1) is UNKNOWN: the row does not match either
+        self.assertFalse(matches(Negation(equality), {"a": None}, {"param_1": 1}))
+        self.assertTrue(matches(Negation(equality), {"a": 2}, {"param_1": 1}))
+        self.assertTrue(matches(BinaryComparison(column("a"), "IS", Constant(None, "NULL")),
+                                {"a": None}))
+        self.assertFalse(matches(BinaryComparison(column("a"), "IS NOT", Constant(None, "NULL")),
+                                 {"a": None}))
+
+    def test_boolean_clauses(self):
+        unknown = BinaryComparison(column("a"), "=", Placeholder("param_1"))
+        true = Constant(True, "true")
+        false = Constant(False, "false")
+        obj = {"a": None}
+        self.assertTrue(matches(BooleanClause("OR", [unknown, true]), obj))
+        self.assertFalse(matches(BooleanClause("OR", [unknown, false]), obj))
+        self.assertFalse(matches(Negation(BooleanClause("AND", [unknown, true])), obj))
+        self.assertTrue(matches(Negation(BooleanClause("AND", [unknown, false])), obj))
+
+    def test_membership(self):
+        values = ValueList([Placeholder("param_1"), Placeholder("param_2")])
+        parameters = {"param_1": 1, "param_2": None}
+        in_list = BinaryComparison(column("a"), "IN", values)
+        not_in_list = BinaryComparison(column("a"), "NOT IN", values)
+        self.assertTrue(matches(in_list, {"a": 1}, parameters))
+        self.assertFalse(matches(in_list, {"a": 2}, parameters))
+        # 2 NOT IN (1, NULL) is UNKNOWN
+        self.assertFalse(matches(not_in_list, {"a": 2}, parameters))
+        self.assertTrue(matches(not_in_list, {"a": 2}, {"param_1": 1, "param_2": 3}))
+        self.assertTrue(matches(in_list, {"a": "1"}, parameters))
+
+    def test_membership_follows_equality(self):
+        in_list = BinaryComparison(column("a"), "IN", ValueList([Placeholder("param_1")]))
+        equality = BinaryComparison(column("a"), "=", Placeholder("param_1"))
+        values = [1, 2, 1.0, 1.5, "1", "01", "1.0", "1.5", " 1", "x", True, "True"]
+        for value in values:
+            for parameter in values:
+                (obj, parameters) = ({"a": value}, {"param_1": parameter})
+                self.assertEqual(matches(in_list, obj, parameters),
+                                 matches(equality, obj, parameters), (value, parameter))
+
+    def test_coercion(self):
+        comparison = BinaryComparison(column("a"), ">", Placeholder("param_1"))
+        self.assertTrue(matches(comparison, {"a": "10"}, {"param_1": 9}))
+        self.assertFalse(matches(comparison, {"a": 8}, {"param_1": "9"}))
+
+    def test_plan(self):
+        init_objects()
+        query = Query(Item, Box).filter(Item.box_id == Box.id).filter(Item.color == "red")
+        (plan, _) = QueryPlanCache().get_plan(query.sa_query)
+        tuples_plan = plan.tuples_plan
+        self.assertEqual(tuples_plan.pandas_where_clause, "")
+        self.assertEqual(tuples_plan.joining_pairs,
+                         [["PredicatesBoxes.id", "PredicatesItems.box_id"]])
+        self.assertEqual(tuples_plan.table_predicates.keys(), ["PredicatesItems"])
+        self.assertIsNone(tuples_plan.tuple_predicate)
+        self.assertEqual(sorted(map(lambda x: x[0].id, query.all())), [3, 6])
+
+    def test_null_semantics_in_queries(self):
+        init_objects()
+        query = Query(Item).filter(Item.color != "red")
+        self.assertEqual(sorted(map(lambda x: x.id, query.all())), [1, 4])
+        query = Query(Item).filter(or_(Item.color == None, Item.box_id == 2))
+        self.assertEqual(sorted(map(lambda x: x.id, query.all())), [1, 2, 3, 5])
+
+    def test_pandas_fallback(self):
+        init_objects()
+        # Criteria are filtered with pandas only when the compiler rejects a construct of the
+        # query (see the 'rome.lang.sqlalchemy_compiler' module), and the query is parsed from its
+        # SQL text: NULL values are then compared as 0.
+        boxes = Query(Box.id).subquery()
+        parsed_queries = [
+            Query(Item).filter(Item.color.like("r%")),
+            Query(Item).filter(Item.id.between(2, 4)),
+            Query(Item).filter(Item.id + 1 > 3),
+            Query(Item).filter(func.lower(Item.color) == "red"),
+            Query(Item).filter(Item.box_id == boxes.c.id),
+            Query(Item.id + 1).filter(Item.color == None),
+            Query(Item).filter(Item.color == None).order_by(Item.id + 1),
+            Query(func.count(Item.id)).filter(Item.color == None).group_by(Item.id + 1),
+        ]
+        for query in parsed_queries:
+            self.assertTrue(uses_pandas(query), str(query))
+        compiled_queries = [
+            Query(Item).filter(Item.color == None),
+            Query(Item).filter(or_(Item.color.in_(["red", "blue"]), ~(Item.id > 3))),
+            Query(Item).filter(Item.box_id.in_(Query(Box.id).filter(Box.name == "box1"))),
+            Query(Item, Box).outerjoin(Box, Item.box_id == Box.id).filter(Box.name != None),
+            Query(func.count(Item.id)).filter(Item.color == None).group_by(Item.box_id).having(
+                func.count(Item.id) > 1),
+        ]
+        for query in compiled_queries:
+            self.assertFalse(uses_pandas(query), str(query))
+
+    def test_outer_join_criteria(self):
+        init_objects()
+
+        def ids(query):
+            return sorted(map(lambda x: (x[0].id, x[1].id if x[1] is not None else None),
+                              query.all()))
+        # Boxes whose items do not satisfy the ON clause are kept without items
+        query = Query(Box, Item).outerjoin(Item, and_(Box.id == Item.box_id, Item.id < Box.id))
+        self.assertEqual(ids(query), [(1, None), (2, 1)])
+        query = Query(Box, Item).outerjoin(Item, and_(Box.id == Item.box_id, Box.name == "box2"))
+        self.assertEqual(ids(query), [(1, None), (2, 1), (2, 3), (2, 5)])
+        query = Query(Box, Item).outerjoin(Item, and_(Box.id == Item.box_id, Item.color == "red"))
+        self.assertEqual(ids(query), [(1, 6), (2, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
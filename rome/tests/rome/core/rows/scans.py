@@ -0,0 +1,107 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.plan_cache import QueryPlanCache
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+from rome.driver import database_driver
+from rome.utils.secondary_index_decorator import secondary_index_decorator
+
+Base = declarative_base()
+
+
+class Rack(Base):
+    __tablename__ = "ScansRacks"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+@secondary_index_decorator("rack_id")
+class Host(Base):
+    __tablename__ = "ScansHosts"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    deleted = Column(Integer, default=0)
+    rack_id = Column(Integer, ForeignKey("ScansRacks.id"))
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Host).all(filter_deleted=False) + Query(Rack).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    rack = Rack()
+    rack.id = 1
+    rack.name = "rack1"
+    session.add(rack)
+    for i in range(1, 11):
+        host = Host()
+        host.id = i
+        host.name = "host%s" % (i % 2)
+        host.rack_id = 1
+        host.deleted = i if i == 10 else 0
+        session.add(host)
+    session.commit()
+
+
+def table_scan(query):
+    (plan, _) = QueryPlanCache().get_plan(query.sa_query)
+    return plan.table_scan
+
+
+class TestScans(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_table_scan_detection(self):
+        self.assertIsNotNone(table_scan(Query(Host)))
+        self.assertIsNotNone(table_scan(Query(Host).filter(Host.name == "host1")))
+        self.assertIsNotNone(table_scan(Query(Host.name).filter(Host.id > 3)))
+        self.assertIsNone(table_scan(Query(Host).filter_by(id=3)))
+        self.assertIsNone(table_scan(Query(Host).filter(Host.name.in_(["host1"]))))
+        self.assertIsNone(table_scan(Query(Host).join(Rack, Rack.id == Host.rack_id)))
+        self.assertIsNone(table_scan(Query(Host).order_by(Host.name)))
+
+    def test_yield_per_reads_tables_by_batches(self):
+        driver = database_driver.get_driver()
+        query = Query(Host).filter(Host.name == "host1").yield_per(2)
+        with mock.patch.object(driver, "getall", wraps=driver.getall) as getall, \
+                mock.patch.object(driver, "scan", wraps=driver.scan) as scan:
+            hosts = iter(query)
+            first_host = next(hosts)
+            self.assertEqual(first_host.name, "host1")
+            self.assertEqual(sorted([first_host.id] + map(lambda x: x.id, hosts)), [1, 3, 5, 7, 9])
+            self.assertEqual(getall.call_count, 0)
+            self.assertEqual(scan.call_args, mock.call("ScansHosts", 2))
+            # Objects that can be read with a secondary index are not scanned
+            query = Query(Host).filter(Host.rack_id == 1).yield_per(2)
+            self.assertEqual(len(list(query)), 9)
+            self.assertEqual(scan.call_count, 1)
+
+    def test_yield_per_criteria(self):
+        query = Query(Host).yield_per(3)
+        self.assertEqual(sorted(map(lambda x: x.id, query)), range(1, 10))
+        query = Query(Host).yield_per(3)
+        query.read_deleted = "only"
+        self.assertEqual(map(lambda x: x.id, query), [10])
+        # The batch size is kept by the queries derived from a query
+        query = Query(Host.id).yield_per(4).filter(Host.id > 2).limit(3).offset(2)
+        self.assertEqual(len(list(query)), 3)
+        self.assertEqual(query.all(), Query(Host.id).filter(Host.id > 2).limit(3).offset(2).all())
+
+    def test_yield_per_without_table_scan(self):
+        query = Query(Host).join(Rack, Rack.id == Host.rack_id).filter(Host.id > 4).yield_per(2)
+        batches = list(query.matching_object_batches(2))
+        self.assertEqual(map(len, batches), [2, 2, 1])
+        self.assertEqual(sorted(map(lambda x: x.id, query)), [5, 6, 7, 8, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, ForeignKey, Integer, String, or_
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.plan_cache import QueryPlanCache
+from rome.core.orm.query import Query
+from rome.core.rows.semijoins import SemiJoin
+from rome.core.session.session import Session
+
+Base = declarative_base()
+
+
+class Project(Base):
+    __tablename__ = "SemiJoinsProjects"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Server(Base):
+    __tablename__ = "SemiJoinsServers"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("SemiJoinsProjects.id"))
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Server).all() + Query(Project).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 5):
+        project = Project()
+        project.id = i
+        project.name = "project%s" % (i % 2)
+        session.add(project)
+    for i in range(1, 9):
+        server = Server()
+        server.id = i
+        server.project_id = 1 + i % 4 if i != 8 else None
+        session.add(server)
+    session.commit()
+
+
+def ids(objects):
+    return sorted(map(lambda x: x.id, objects))
+
+
+class TestSemiJoins(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+
+    def test_probe(self):
+        objects = [{"id": 1, "x": 1}, {"id": 2, "x": 2}, {"id": 3, "x": None}]
+        semi_join = SemiJoin("T", "x", "__subquery_1__")
+        self.assertEqual(semi_join.probe(objects, semi_join.keys([1, 4])), objects[:1])
+        self.assertEqual(semi_join.probe(objects, semi_join.keys(["2"])), objects[1:2])
+        anti_join = SemiJoin("T", "x", "__subquery_1__", negated=True)
+        self.assertEqual(anti_join.probe(objects, anti_join.keys([1, 4])), objects[1:2])
+        self.assertEqual(anti_join.probe(objects, anti_join.keys([1, None])), [])
+        self.assertEqual(anti_join.probe(objects, anti_join.keys([])), objects)
+
+    def test_in_list_matches_equality(self):
+        for value in ["1", "01", " 1", "1.0", 1.0, "x"]:
+            self.assertEqual(ids(Query(Server).filter(Server.project_id.in_([value])).all()),
+                             ids(Query(Server).filter(Server.project_id == value).all()))
+            self.assertEqual(ids(Query(Server).filter(Server.id.in_([value])).all()),
+                             ids(Query(Server).filter(Server.id == value).all()))
+        self.assertEqual(ids(Query(Server).filter(Server.project_id.in_(["1"])).all()), [4])
+
+    def test_semi_joins_are_not_pandas_criteria(self):
+        sub_query = Query(Project.id).filter(Project.name == "project1").subquery()
+        query = Query(Server).filter(Server.project_id.in_(sub_query)).filter(Server.id > 2)
+        (plan, _) = QueryPlanCache().get_plan(query.sa_query)
+        semi_joins = plan.tuples_plan.semi_joins
+        self.assertEqual(map(lambda x: (x.table_name, x.attribute, x.negated), semi_joins),
+                         [("SemiJoinsServers", "project_id", False)])
+        self.assertNotIn("__subquery_", plan.tuples_plan.pandas_where_clause)
+
+    def test_semi_join_and_anti_join(self):
+        sub_query = Query(Project.id).filter(Project.name == "project1").subquery()
+        self.assertEqual(ids(Query(Server).filter(Server.project_id.in_(sub_query)).all()),
+                         [2, 4, 6])
+        self.assertEqual(ids(Query(Server).filter(~Server.project_id.in_(sub_query)).all()),
+                         [1, 3, 5, 7])
+        query = Query(Server).filter(or_(Server.project_id.in_(sub_query), Server.id == 1))
+        self.assertEqual(ids(query.all()), [1, 2, 4, 6])
+
+    def test_in_lists(self):
+        query = Query(Server).filter(Server.id.in_(range(2, 500)))
+        query = query.filter(Server.project_id.in_([1, 3, 5]))
+        (plan, _) = QueryPlanCache().get_plan(query.sa_query)
+        self.assertEqual(len(plan.tuples_plan.semi_joins), 2)
+        self.assertEqual(plan.tuples_plan.pandas_where_clause, "")
+        self.assertEqual(ids(query.all()), [2, 4, 6])
+        self.assertEqual(ids(Query(Server).filter(Server.project_id.notin_([2, 3])).all()),
+                         [3, 4, 7])
+        query = Query(Server).filter(or_(Server.id.in_([8]), Server.project_id.in_([4])))
+        self.assertEqual(ids(query.all()), [3, 7, 8])
+
+    def test_semi_join_hints(self):
+        from rome.core.rows import rows
+        sub_query = Query(Server.project_id).filter(Server.id < 3).subquery()
+        with mock.patch.object(rows, "get_objects", wraps=rows.get_objects) as get_objects:
+            projects = Query(Project).filter(Project.id.in_(sub_query)).all()
+            self.assertEqual(ids(projects), [2, 3])
+            self.assertEqual(sorted(get_objects.call_args_list[-1][1]["hints"]),
+                             [("id", 2), ("id", 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
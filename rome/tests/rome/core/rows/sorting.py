@@ -0,0 +1,37 @@
+import unittest
+
+from rome.core.rows.sorting import sort_tuples
+from rome.lang.expression import ColumnReference, Ordering
+
+BOOKS = [{"id": 1, "author_id": 2, "price": 10},
+         {"id": 2, "author_id": None, "price": 30},
+         {"id": 3, "author_id": 1, "price": 20},
+         {"id": 4, "author_id": 2, "price": 20}]
+
+
+def ordering(column, descending=False):
+    return Ordering(ColumnReference("Books", column, "Books.%s" % (column)), descending)
+
+
+class TestSorting(unittest.TestCase):
+
+    def sorted_ids(self, orderings, count=None):
+        tuples = map(lambda x: {"Books": x}, BOOKS)
+        return map(lambda x: x["Books"]["id"], sort_tuples(tuples, orderings, count=count))
+
+    def test_sort_directions(self):
+        self.assertEqual(self.sorted_ids([ordering("price")]), [1, 3, 4, 2])
+        self.assertEqual(self.sorted_ids([ordering("price", True), ordering("id", True)]),
+                         [2, 4, 3, 1])
+        self.assertEqual(self.sorted_ids([ordering("author_id"), ordering("price", True)]),
+                         [2, 3, 4, 1])
+        self.assertEqual(self.sorted_ids([ordering("author_id", True)]), [1, 4, 3, 2])
+
+    def test_bounded_sort(self):
+        orderings = [ordering("price", True), ordering("id")]
+        self.assertEqual(self.sorted_ids(orderings, count=2), self.sorted_ids(orderings)[:2])
+        self.assertEqual(self.sorted_ids(orderings, count=10), self.sorted_ids(orderings))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+import etcd
+import mock
+
+from rome.driver.etcd.driver import EtcdDriver
+
+
+class FakeEtcdClient(object):
+
+    """An etcd client that keeps the values of its keys in memory."""
+
+    def __init__(self):
+        self.values = {}
+        self.index = 0
+
+    def node(self, key):
+        (value, index) = self.values[key]
+        return mock.Mock(key=key, value=value, modifiedIndex=index)
+
+    def read(self, key, recursive=False):
+        key = "/%s" % (key.strip("/"))
+        if key in self.values:
+            return self.node(key)
+        children = map(self.node, filter(lambda x: x.startswith(key + "/"), sorted(self.values)))
+        if len(children) == 0:
+            raise etcd.EtcdKeyNotFound()
+        return mock.Mock(key=key, value=None, children=children)
+
+    def check(self, key, prevIndex=None, prevExist=None):
+        if prevExist is False and key in self.values:
+            raise etcd.EtcdAlreadyExist()
+        if prevIndex is not None and key not in self.values:
+            raise etcd.EtcdKeyNotFound()
+        if prevIndex is not None and self.values[key][1] != prevIndex:
+            raise etcd.EtcdCompareFailed()
+
+    def write(self, key, value, **conditions):
+        key = "/%s" % (key.strip("/"))
+        self.check(key, **conditions)
+        self.index += 1
+        self.values[key] = ("%s" % (value), self.index)
+        return self.node(key)
+
+    def delete(self, key, **conditions):
+        key = "/%s" % (key.strip("/"))
+        if key not in self.values:
+            raise etcd.EtcdKeyNotFound()
+        self.check(key, **conditions)
+        self.values.pop(key)
+
+
+class TestEtcdDriver(unittest.TestCase):
+
+    def setUp(self):
+        with mock.patch("etcd.Client"), mock.patch("rome.driver.etcd.driver.Redlock"):
+            self.driver = EtcdDriver()
+        self.driver.etcd_client = FakeEtcdClient()
+
+    def test_version_numbers(self):
+        driver = self.driver
+        self.assertEqual(driver.get_version_numbers(["hosts", "racks"]), {"hosts": 0, "racks": 0})
+        driver.put("hosts", 1, {"id": 1, "rack": 1})
+        driver.put("hosts", 2, {"id": 2, "rack": 1}, ["rack"])
+        driver.put("racks", 1, {"id": 1})
+        for key in [1, 2]:
+            driver.add_key("hosts", key)
+        self.assertEqual(driver.get_version_numbers(["hosts", "racks"]), {"hosts": 2, "racks": 1})
+        driver.remove_key("hosts", 2, ["rack"])
+        driver.remove_key("hosts", 1)
+        self.assertEqual(driver.get_version_number("hosts"), 4)
+        self.assertEqual(driver.get_version_number("racks"), 1)
+
+    def test_concurrent_version_increments(self):
+        driver = self.driver
+        driver.put("hosts", 1, {"id": 1})
+        read = driver.etcd_client.read
+
+        def read_before_other_client(key, recursive=False):
+            # Another client increments the version number between the read and the write
+            fetched = read(key, recursive)
+            driver.etcd_client.read = read
+            driver.etcd_client.write(key, int(fetched.value) + 1)
+            return fetched
+        driver.etcd_client.read = read_before_other_client
+        driver.put("hosts", 2, {"id": 2})
+        self.assertEqual(driver.get_version_number("hosts"), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+
+import numpy
+
+from rome.driver.memory.columnar import ColumnarTable
+from rome.driver.memory.driver import MemoryDriver
+
+
+class TestMemoryDriverSecondaryIndexes(unittest.TestCase):
+
+    storage = "dict"
+
+    def setUp(self):
+        self.driver = MemoryDriver(storage=self.storage)
+        for (key, host) in [(1, "node1"), (2, "node2"), (3, "node1")]:
+            self.driver.put("instances", key, {"id": key, "host": host}, ["host"])
+            self.driver.add_key("instances", key)
+
+    def get_ids(self, hints, tablename="instances"):
+        return sorted(map(lambda x: x["id"], self.driver.getall(tablename, hints=hints)))
+
+    def test_hints(self):
+        self.assertTrue(self.driver.is_secondary_index_populated("instances", "host"))
+        self.assertEqual(self.get_ids([("host", "node1")]), [1, 3])
+        self.assertEqual(self.get_ids([("host", "node3")]), [])
+        self.assertEqual(self.get_ids([("id", 2), ("id", "3"), ("id", 4)]), [2, 3])
+        self.assertEqual(self.get_ids([]), [1, 2, 3])
+
+    def test_index_is_updated_on_put(self):
+        self.driver.put("instances", 1, {"id": 1, "host": "node2"}, ["host"])
+        self.assertEqual(self.get_ids([("host", "node1")]), [3])
+        self.assertEqual(self.get_ids([("host", "node2")]), [1, 2])
+
+    def test_index_is_updated_on_remove(self):
+        self.driver.remove_key("instances", 3, ["host"])
+        self.assertEqual(self.get_ids([("host", "node1")]), [1])
+
+    def test_index_keys_keep_types(self):
+        for (key, rack) in [(1, None), (2, "None"), (3, 1), (4, "1"), (5, "01"), (6, "rack")]:
+            self.driver.put("hosts", key, {"id": key, "rack": rack}, ["rack"])
+        self.assertEqual(self.get_ids([("rack", "None")], "hosts"), [2])
+        # Strings compared with numbers are converted to numbers, as in the criteria of queries:
+        # the objects of the hints are candidates, which are then filtered with the criteria.
+        self.assertEqual(self.get_ids([("rack", 1)], "hosts"), [3, 4, 5])
+        self.assertEqual(self.get_ids([("rack", "1")], "hosts"), [3, 4, 5])
+        self.assertEqual(self.get_ids([("rack", "rack")], "hosts"), [6])
+        self.driver.put("hosts", 5, {"id": 5, "rack": "2"}, ["rack"])
+        self.assertEqual(self.get_ids([("rack", 1.0)], "hosts"), [3, 4])
+        self.assertEqual(self.get_ids([("rack", 2)], "hosts"), [5])
+
+    def test_build_secondary_index(self):
+        for key in [1, 2]:
+            self.driver.put("hosts", key, {"id": key, "rack": key % 2})
+        self.driver.put("hosts", 3, {"id": 3, "rack": 1}, ["rack"])
+        self.assertFalse(self.driver.is_secondary_index_populated("hosts", "rack"))
+        self.assertEqual(self.get_ids([("rack", 1)], "hosts"), [3])
+        self.driver.build_secondary_index("hosts", "rack")
+        self.assertTrue(self.driver.is_secondary_index_populated("hosts", "rack"))
+        self.assertEqual(self.get_ids([("rack", 1)], "hosts"), [1, 3])
+        self.assertEqual(self.get_ids([("rack", 0)], "hosts"), [2])
+
+    def test_get_many(self):
+        objects = self.driver.get_many("instances", [3, 42, "1", 3])
+        self.assertEqual(map(lambda x: x["id"] if x is not None else None, objects),
+                         [3, None, 1, 3])
+        self.assertEqual(self.driver.get_many("instances", []), [])
+        self.assertEqual(self.driver.get_many("unknown_table", [1]), [None])
+
+    def test_scan(self):
+        batches = self.driver.scan("instances", 2)
+        first_batch = next(batches)
+        self.assertEqual(len(first_batch), 2)
+        # Objects removed during the scan are skipped
+        last_key = 6 - sum(map(lambda x: x["id"], first_batch))
+        self.driver.remove_key("instances", last_key, ["host"])
+        self.driver.put("instances", 4, {"id": 4, "host": "node2"}, ["host"])
+        self.assertEqual(list(batches), [])
+        self.assertEqual(list(self.driver.scan("unknown_table", 2)), [])
+
+
+class TestColumnarMemoryDriverSecondaryIndexes(TestMemoryDriverSecondaryIndexes):
+
+    storage = "columnar"
+
+    def test_getall_matching(self):
+        def column_filter(table):
+            (kind, values, nulls) = table.column("host")
+            return numpy.flatnonzero(values == "node1")
+        objects = self.driver.getall_matching("instances", column_filter)
+        self.assertEqual(sorted(map(lambda x: x["id"], objects)), [1, 3])
+
+
+class TestColumnarTable(unittest.TestCase):
+
+    def test_typed_columns(self):
+        table = ColumnarTable(capacity=2)
+        for key in range(1, 6):
+            table[key] = {"id": key, "vcpus": key * 2, "load": key / 2.0, "locked": key % 2 == 0,
+                          "host": "node%s" % (key % 2) if key != 3 else None}
+        self.assertEqual(table.column("vcpus")[0], "int")
+        self.assertEqual(table.column("vcpus")[1].dtype, numpy.int64)
+        self.assertEqual(table.column("load")[1].dtype, numpy.float64)
+        self.assertEqual(table.column("locked")[1].dtype, numpy.bool_)
+        self.assertEqual(table.column("host")[0], "string")
+        self.assertEqual(list(table.column("host")[2]), [False, False, True, False, False])
+        self.assertEqual(table[3], {"id": 3, "vcpus": 6, "load": 1.5, "locked": False,
+                                    "host": None})
+        self.assertIs(type(table[2]["vcpus"]), int)
+        self.assertIs(table[2]["host"], table[4]["host"])
+
+    def test_kind_changes(self):
+        table = ColumnarTable()
+        table[1] = {"id": 1, "value": None}
+        self.assertIsNone(table.column("value")[0])
+        table[2] = {"id": 2, "value": 3}
+        self.assertEqual(table.column("value")[0], "int")
+        table[3] = {"id": 3, "value": "3"}
+        self.assertEqual(table.column("value")[0], "object")
+        self.assertEqual(map(lambda x: x["value"], table.values()), [None, 3, "3"])
+        self.assertIs(type(table[2]["value"]), int)
+
+    def test_updates_and_removals(self):
+        table = ColumnarTable()
+        for key in range(1, 5):
+            table[key] = {"id": key, "name": "object%s" % (key), "size": key}
+        table[2] = {"id": 2, "name": "renamed"}
+        self.assertEqual(table[2], {"id": 2, "name": "renamed"})
+        self.assertEqual(table.pop(1), {"id": 1, "name": "object1", "size": 1})
+        self.assertNotIn(1, table)
+        self.assertEqual(len(table), 3)
+        # The last object takes the position of the removed object
+        self.assertEqual(table.keys, [4, 2, 3])
+        self.assertEqual(table[4], {"id": 4, "name": "object4", "size": 4})
+        self.assertIsNone(table.get(1))
+        self.assertRaises(KeyError, table.pop, 1)
+        table.pop(3)
+        table[5] = {"id": 5}
+        self.assertEqual(table[5], {"id": 5})
+
+    def test_absent_columns(self):
+        objects = [{"id": 1, "name": None}, {"id": 2, "size": 2}, {"id": 3, "name": "a", "size": 3}]
+        table = ColumnarTable(capacity=1)
+        for obj in objects:
+            table[obj["id"]] = obj
+        # Objects are built with the same keys as in the dicts of the default storage
+        self.assertEqual(table.values(), objects)
+        self.assertEqual(table.get_many([2, 1]), [objects[1], objects[0]])
+        self.assertEqual(list(table.column("size")[2]), [True, False, False])
+        table.pop(1)
+        self.assertEqual(table[3], objects[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+import mock
+from ujson import dumps as ujson_dumps
+
+from rome.driver.redis.driver import RedisDriver
+
+
+def hscan_reply(cursor, keys):
+    return cursor, dict(map(lambda x: ("hosts:id:%s" % (x), ujson_dumps({"id": x})), keys))
+
+
+class TestRedisDriver(unittest.TestCase):
+
+    def test_scan_returns_each_object_once(self):
+        redis_client = mock.Mock()
+        # HSCAN returns objects again when the hash is resized during the scan
+        redis_client.hscan.side_effect = [hscan_reply(3, [1, 2]),
+                                          hscan_reply(5, [2, 3]),
+                                          hscan_reply(0, [1, 3, 4])]
+        batches = list(RedisDriver(redis_client).scan("hosts", 2))
+        self.assertEqual(map(lambda x: sorted(map(lambda y: y["id"], x)), batches),
+                         [[1, 2], [3], [4]])
+        self.assertEqual(redis_client.hscan.call_args_list,
+                         [mock.call("hosts", cursor=0, count=2),
+                          mock.call("hosts", cursor=3, count=2),
+                          mock.call("hosts", cursor=5, count=2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
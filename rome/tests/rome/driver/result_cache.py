@@ -0,0 +1,129 @@
+import unittest
+
+import mock
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from rome.core.orm.query import Query
+from rome.core.session.session import Session
+from rome.driver import database_driver, result_cache
+from rome.driver.result_cache import ResultCache, estimate_size
+
+Base = declarative_base()
+
+
+class Rack(Base):
+    __tablename__ = "ResultCacheRacks"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Server(Base):
+    __tablename__ = "ResultCacheServers"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    rack_id = Column(Integer, ForeignKey("ResultCacheRacks.id"))
+
+
+def init_objects():
+    session = Session()
+    for obj in Query(Server).all() + Query(Rack).all():
+        session.delete(obj)
+    session.commit()
+    session = Session()
+    for i in range(1, 3):
+        rack = Rack()
+        rack.id = i
+        rack.name = "rack%s" % (i)
+        session.add(rack)
+    for i in range(1, 5):
+        server = Server()
+        server.id = i
+        server.name = "server%s" % (i)
+        server.rack_id = 1 + i % 2
+        session.add(server)
+    session.commit()
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_results_are_validated_by_versions(self):
+        cache = ResultCache(enabled=True)
+        cache.put("a", {"T": 1, "U": 1}, [1])
+        self.assertEqual(cache.get("a", {"T": 1, "U": 1}), [1])
+        self.assertIsNone(cache.get("a", {"T": 1, "U": 2}))
+        # Stale results are discarded
+        self.assertIsNone(cache.get("a", {"T": 1, "U": 1}))
+        cache.put("b", {"T": None}, [1])
+        self.assertIsNone(cache.get("b", {"T": None}))
+        self.assertEqual(cache.statistics(), {"hits": 1, "misses": 3, "evictions": 0,
+                                              "size": 0, "bytes": 0})
+
+    def test_least_recently_used_results_are_evicted(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", {"T": 1}, [1])
+        cache.put("b", {"T": 1}, [2])
+        cache.get("a", {"T": 1})
+        cache.put("c", {"T": 1}, [3])
+        self.assertEqual(cache.results.keys(), ["a", "c"])
+        size = estimate_size([{"id": 1, "name": "x" * 100}])
+        cache = ResultCache(max_bytes=2 * size + 1)
+        for key in ["a", "b", "c"]:
+            cache.put(key, {"T": 1}, [{"id": 1, "name": key * 100}])
+        self.assertEqual(cache.results.keys(), ["b", "c"])
+        self.assertEqual(cache.statistics()["bytes"], 2 * size)
+        self.assertEqual(cache.statistics()["evictions"], 1)
+        # Results larger than the cache are not cached
+        cache.put("d", {"T": 1}, [{"id": 1, "name": "d" * 1000}])
+        self.assertEqual(cache.results.keys(), ["b", "c"])
+
+    def test_table_settings(self):
+        cache = ResultCache(enabled=False, table_settings={"Servers": True})
+        self.assertTrue(cache.is_enabled(["Servers"]))
+        self.assertFalse(cache.is_enabled(["Servers", "Racks"]))
+        cache = ResultCache(enabled=True, table_settings={"racks": False})
+        self.assertFalse(cache.is_enabled(["Racks"]))
+
+
+class TestResultCacheQueries(unittest.TestCase):
+
+    def setUp(self):
+        init_objects()
+        self.result_cache = result_cache.RESULT_CACHE
+        result_cache.RESULT_CACHE = ResultCache(enabled=True)
+
+    def tearDown(self):
+        result_cache.RESULT_CACHE = self.result_cache
+
+    def test_unmodified_tables_are_not_read(self):
+        driver = database_driver.get_driver()
+        query = Query(Server).join(Rack, Rack.id == Server.rack_id).filter(Rack.name == "rack2")
+        with mock.patch.object(driver, "getall", wraps=driver.getall) as getall:
+            self.assertEqual(map(lambda x: x.id, query.all()), [1, 3])
+            self.assertEqual(getall.call_count, 2)
+            self.assertEqual(map(lambda x: x.id, query.all()), [1, 3])
+            self.assertEqual(getall.call_count, 2)
+            # The objects of the tables are also cached
+            self.assertEqual(Query(Rack).filter(Rack.id > 1).count(), 1)
+            self.assertEqual(getall.call_count, 2)
+        self.assertEqual(result_cache.RESULT_CACHE.statistics()["hits"], 2)
+
+    def test_modified_tables_are_read(self):
+        query = Query(Server).filter(Server.rack_id == 2)
+        self.assertEqual(map(lambda x: x.id, query.all()), [1, 3])
+        session = Session()
+        server = Query(Server).filter(Server.id == 2).one()
+        server.rack_id = 2
+        session.add(server)
+        session.commit()
+        self.assertEqual(map(lambda x: x.id, query.all()), [1, 2, 3])
+        session = Session()
+        session.delete(Query(Server).filter(Server.id == 1).one())
+        session.commit()
+        self.assertEqual(map(lambda x: x.id, query.all()), [2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
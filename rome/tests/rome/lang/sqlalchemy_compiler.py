@@ -0,0 +1,127 @@
+import unittest
+
+from sqlalchemy import Column, ForeignKey, Integer, String, asc, func, not_, or_
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import literal_column
+
+from rome.core.orm.query import Query
+from rome.lang.sqlalchemy_compiler import QueryCompiler, UnsupportedExpression
+
+Base = declarative_base()
+
+
+class Owner(Base):
+    __tablename__ = "CompilerOwners"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Pet(Base):
+    __tablename__ = "CompilerPets"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    owner_id = Column(Integer, ForeignKey("CompilerOwners.id"))
+
+
+class Toy(Base):
+    __tablename__ = "CompilerToys"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("CompilerOwners.id"))
+
+
+def compile_query(query):
+    (query_tree, parameters, _) = QueryCompiler().compile(query.sa_query)
+    return query_tree, parameters
+
+
+class TestQueryCompiler(unittest.TestCase):
+
+    def test_filters_use_typed_placeholders(self):
+        (query_tree, parameters) = compile_query(
+            Query(Pet).filter(Pet.name == "rex").filter(Pet.owner_id.in_([1, 2])))
+        self.assertEqual(query_tree.models, ["CompilerPets"])
+        self.assertEqual(map(str, query_tree.where_clauses),
+                         ['"CompilerPets".name = :param_1 AND '
+                          '"CompilerPets".owner_id IN (:param_2, :param_3)'])
+        self.assertEqual(parameters, {"param_1": "rex", "param_2": 1, "param_3": 2})
+        comparison = query_tree.where_clauses[0].operands[0]
+        self.assertEqual(comparison.left.table, "CompilerPets")
+        self.assertEqual(comparison.left.column, "name")
+        self.assertIsInstance(comparison.right.type, String)
+
+    def test_boolean_operators_and_null(self):
+        (query_tree, _) = compile_query(
+            Query(Pet).filter(not_(or_(Pet.name == None, Pet.id < 3))))
+        self.assertEqual(map(str, query_tree.where_clauses),
+                         ['NOT ("CompilerPets".name IS NULL OR "CompilerPets".id < :param_1)'])
+
+    def test_joins_aliases_and_functions(self):
+        (query_tree, _) = compile_query(Query(Owner).outerjoin(Pet, Owner.id == Pet.owner_id))
+        self.assertEqual(query_tree.models, ["CompilerOwners", "CompilerPets"])
+        self.assertEqual(query_tree.outer_join_models, ["CompilerOwners"])
+        self.assertEqual(map(str, query_tree.joining_clauses),
+                         ['"CompilerOwners".id = "CompilerPets".owner_id'])
+        # Only the tables on the right side of an outer join are optional
+        (query_tree, _) = compile_query(Query(Owner).outerjoin(Pet, Owner.id == Pet.owner_id)
+                                        .join(Toy, Owner.id == Toy.owner_id))
+        self.assertEqual(query_tree.outer_join_models, ["CompilerOwners", "CompilerToys"])
+
+        (query_tree, _) = compile_query(Query(aliased(Owner)))
+        self.assertEqual(query_tree.models, ["CompilerOwners"])
+        self.assertEqual(query_tree.aliases, {"CompilerOwners_1": "CompilerOwners"})
+
+        (query_tree, _) = compile_query(Query(func.count(Pet.id)))
+        self.assertEqual(query_tree.attributes, ['"CompilerPets".id'])
+        self.assertEqual(query_tree.function_calls, {0: "count"})
+
+    def test_sub_queries_are_variables(self):
+        sub_query = Query(Owner.id).filter(Owner.name != "bob").subquery()
+        (query_tree, parameters) = compile_query(Query(Pet).filter(Pet.owner_id.in_(sub_query)))
+        self.assertEqual(map(str, query_tree.where_clauses),
+                         ['"CompilerPets".owner_id IN __subquery_1__'])
+        self.assertEqual(map(str, query_tree.variables["__subquery_1__"].where_clauses),
+                         ['"CompilerOwners".name != :param_1'])
+        self.assertEqual(parameters, {"param_1": "bob"})
+
+    def test_same_shape_same_signature(self):
+        (query_tree_1, _) = compile_query(Query(Pet).filter(Pet.name == "rex"))
+        (query_tree_2, _) = compile_query(Query(Pet).filter(Pet.name == "medor"))
+        (query_tree_3, _) = compile_query(Query(Pet).filter(Pet.id == 1))
+        self.assertEqual(query_tree_1.signature(), query_tree_2.signature())
+        self.assertNotEqual(query_tree_1.signature(), query_tree_3.signature())
+
+    def test_limit_and_offset(self):
+        (query_tree, parameters) = compile_query(Query(Pet).limit(3).offset(6))
+        self.assertEqual((str(query_tree.limit), str(query_tree.offset)),
+                         (":param_1", ":param_2"))
+        self.assertEqual(parameters, {"param_1": 3, "param_2": 6})
+
+    def test_order_by(self):
+        (query_tree, _) = compile_query(Query(Pet).order_by(Pet.owner_id.desc(), asc("name")))
+        self.assertEqual(map(str, query_tree.order_by),
+                         ['"CompilerPets".owner_id DESC', '"CompilerPets".name ASC'])
+        self.assertNotEqual(query_tree.signature(),
+                            compile_query(Query(Pet).order_by(Pet.owner_id))[0].signature())
+
+    def test_group_by_and_having(self):
+        query = Query(Pet.owner_id, func.count(Pet.id)).group_by(Pet.owner_id)
+        (query_tree, parameters) = compile_query(query.having(func.count(Pet.id) > 2))
+        self.assertEqual(map(str, query_tree.group_by), ['"CompilerPets".owner_id'])
+        self.assertEqual(str(query_tree.having), 'count("CompilerPets".id) > :param_1')
+        self.assertEqual(parameters, {"param_1": 2})
+        self.assertRaises(UnsupportedExpression, compile_query,
+                          Query(Pet).filter(func.count(Pet.id) > 2))
+
+    def test_unsupported_expression(self):
+        self.assertRaises(UnsupportedExpression, compile_query,
+                          Query(Pet).filter(Pet.name.like("r%")))
+        self.assertRaises(UnsupportedExpression, compile_query,
+                          Query(Pet).filter(literal_column("1") == 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
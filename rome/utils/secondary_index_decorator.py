@@ -10,7 +10,11 @@ class SecondaryIndexDecorator(object):
 
     def __call__(self, model_class):
         current_secondary_indexes = getattr(model_class, "_secondary_indexes", [])
-        setattr(model_class, "_secondary_indexes", current_secondary_indexes + [self.attribute])
+        secondary_indexes = current_secondary_indexes + [self.attribute]
+        setattr(model_class, "_secondary_indexes", secondary_indexes)
+        tablename = getattr(model_class, "__tablename__", None)
+        if tablename is not None:
+            SECONDARY_INDEXES[tablename] = secondary_indexes
         return model_class
 
 
@@ -21,3 +25,12 @@ def secondary_index_decorator(attribute):
     :return: an instance of 'SecondaryIndexDecorator'
     """
     return SecondaryIndexDecorator(attribute)
+
+
+def get_secondary_indexes(tablename):
+    """
+    Return the secondary indexes that have been declared for a table.
+    :param tablename: a table name
+    :return: a list of attribute names
+    """
+    return SECONDARY_INDEXES.get(tablename, [])